@@ -7,10 +7,11 @@ from __future__ import annotations
 
 from typing import Optional
 
-from math import sqrt
 # from python_ta.contracts import check_contracts
 
 import sudoku_setup as setup
+from sudoku_puzzle_bank import PuzzleBank
+from sudoku_solution_pool import SolutionPool
 
 
 # @check_contracts
@@ -22,19 +23,32 @@ class AdversarialSudoku:
     guesses: list[tuple[tuple[int, int], int]]  # coordinates
     statuses: list[tuple[list[list[int]], list[list[int]]]]  # chosen solution and current boards
     current_board: list[list[int]]
+    initial_board: list[list[int]]  # the puzzle the game started from
+    solution_pool: Optional[SolutionPool]  # solutions consistent with the game so far, created on first use
 
-    def __init__(self, max_guesses: int, board_length: int, difficulty: int = 50) -> None:
+    def __init__(self, max_guesses: int, board_length: int, difficulty: int = 50,
+                 bank: Optional[PuzzleBank] = None) -> None:
         """Initialize a new Adversarial Wordle game with the given word_set and max_guesses.
 
+        If a puzzle bank is given, the puzzle is drawn from it instead of being generated, and difficulty is ignored.
+
         Preconditions:
         - len(word_set) > 0
         - all words in word_set have the same length
         - max_guesses >= 1
+        - bank is None or bank.n == board_length
         """
         self.max_guesses = max_guesses
         self.guesses = []
         self.statuses = []
-        self.current_board = setup.generate_puzzle(difficulty, board_length)
+        self.solution_pool = None
+        if bank is not None:
+            if bank.n != board_length:
+                raise ValueError(f'The puzzle bank holds {bank.n}x{bank.n} boards, not {board_length}x{board_length}.')
+            self.current_board = bank.sample().puzzle
+        else:
+            self.current_board = setup.generate_puzzle(difficulty, board_length)
+        self.initial_board = copy_board(self.current_board)
 
     def is_guesser_turn(self) -> bool:
         """Return whether it is the Guesser player's turn.
@@ -48,6 +62,25 @@ class AdversarialSudoku:
     def record_adversary_move(self, status: tuple[list[list[int]], list[list[int]]]) -> None:
         """Record the given status returned by the Adversary player."""
         self.statuses.append(status)
+        if self.solution_pool is not None:
+            (r, c), value = self.guesses[-1]
+            if status[1][r][c] != value:
+                self.solution_pool.exclude((r, c), value)
+            self.solution_pool.sync(status[1])
+
+    def get_consistent_solutions(self) -> list[list[list[int]]]:
+        """Return the solutions consistent with the game so far: they complete the current board and agree with
+        every status returned by the Adversary.
+
+        The solutions come from a per-game SolutionPool that is filtered as moves are recorded. When there are more
+        than the pool's capacity, a random sample of them is returned. The returned list must not be mutated.
+        """
+        if self.solution_pool is None:
+            self.solution_pool = SolutionPool()
+            for guess, status in zip(self.guesses, self.statuses):
+                if status[1][guess[0][0]][guess[0][1]] != guess[1]:
+                    self.solution_pool.exclude(guess[0], guess[1])
+        return self.solution_pool.get(self.current_board)
 
     def copy_and_record_guesser_move(self, guess: tuple[tuple[int, int], int]) -> AdversarialSudoku:
         """Return a copy of this game state with the given guess recorded.
@@ -62,11 +95,17 @@ class AdversarialSudoku:
         return new_game
 
     def _copy(self) -> AdversarialSudoku:
-        """Return a copy of this game state."""
-        new_game = AdversarialSudoku(self.max_guesses, int(sqrt(len(self.current_board))))
-        new_game.guesses.extend(self.guesses)
-        new_game.statuses.extend(self.statuses)
+        """Return a copy of this game state.
+
+        The copy is built without __init__, which would generate a puzzle only to replace it with the current board.
+        """
+        new_game = AdversarialSudoku.__new__(AdversarialSudoku)
+        new_game.max_guesses = self.max_guesses
+        new_game.guesses = list(self.guesses)
+        new_game.statuses = list(self.statuses)
         new_game.current_board = copy_board(self.current_board)
+        new_game.initial_board = self.initial_board
+        new_game.solution_pool = None if self.solution_pool is None else self.solution_pool.copy()
         return new_game
 
     def get_status_for_answer(self, guess: tuple[tuple[int, int], int],
@@ -1,24 +1,24 @@
 """
 The main running block of the project
+
+Importing this module has no side effects: pygame, the window, the fonts and the menu are set up by `init_display`
+the first time they are needed, and games and players are only created once a mode is picked in the menu.
 """
 from __future__ import annotations
-import copy
 import sudoku_players as player
 from adversarial_sudoku import AdversarialSudoku, copy_board
-import pygame
+from main_without_visualization import run_game, run_games  # the game loop, reporting through sudoku_events
+from sudoku_game_records import GameRecordFile
+from sudoku_replay import Replay
+from sudoku_validation import is_move_legal
+import os
 import sys
+import time
 from typing import Optional
 
-# initializing the constructor
-pygame.init()
-
 # screen resolution
 size = (650, 720)
 
-# opens up a window
-screen = pygame.display.set_mode(size)
-pygame.display.set_caption("ADVERSIAL SUDOKU")
-
 # text colors
 white = (255, 255, 255)
 black = (0, 0, 0)
@@ -27,34 +27,24 @@ color_dark = (90, 90, 90)
 hover_color = (250, 250, 0)
 
 # stores the width and height of the screen
-width = screen.get_width()
-height = screen.get_height()
+width, height = size
 
 # Define the size of the cells and the board
 CELL_SIZE = 50
 BOARD_SIZE = CELL_SIZE * 9
 
-# defining a font
-smallfont = pygame.font.SysFont('Arial', 35)
-bigfont = pygame.font.SysFont('TimesNewRoman', 60)
-
-# rendering a text written in this font
-play_text = smallfont.render("Play", True, (255, 255, 255))
-simulation_text = smallfont.render("Simulation", True, (255, 255, 255))
-quit_text = smallfont.render("Quit", True, (255, 255, 255))
-
 # Set up the positions of the texts
 play_pos = (width / 2 - 30, 2 * height / 3 - 78)
 simulation_pos = (width / 2 - 75, 2 * height / 3 - 18)
-quit_pos = (width / 2 - 30, 2 * height / 3 + 40)
-
-# Get the rect of each text surface
-play_rect = play_text.get_rect(topleft=play_pos)
-simulation_rect = simulation_text.get_rect(topleft=simulation_pos)
-quit_rect = quit_text.get_rect(topleft=quit_pos)
+replay_pos = (width / 2 - 48, 2 * height / 3 + 40)
+quit_pos = (width / 2 - 30, 2 * height / 3 + 98)
 
-# set the background image
-background_img = pygame.image.load("blackboard.jpg")
+# pygame and everything drawn with it, set up by init_display
+pygame = None
+screen = None
+smallfont = bigfont = None
+background_img = None
+play_rect = simulation_rect = replay_rect = quit_rect = None
 
 # grid for the sudoku game
 grid = prev_grid = original_grid = [
@@ -78,10 +68,48 @@ game_over = False
 sudoku_running = False
 use_solve = False
 
-# settings of adversial sudoku game
+# settings of adversial sudoku game, the game being created when a mode is picked
 MAX_GUESSES = 81
 BOARD_LENGTH = 16
-game = AdversarialSudoku(MAX_GUESSES, BOARD_LENGTH)
+game = None
+
+# settings of the replay of recorded games: python main.py [record file [game number]]
+REPLAY_FILE = 'games.sgr'
+REPLAY_GAME = 0
+REPLAY_SPEED = 2.0  # rounds per second
+replay = None
+
+
+def init_display() -> None:
+    """
+    Import pygame, open the window and load the fonts, the menu texts and the background image, unless it was done
+    already
+    """
+    global pygame, screen, smallfont, bigfont, background_img, play_rect, simulation_rect, replay_rect, quit_rect
+    if screen is not None:
+        return
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    import pygame
+
+    # initializing the constructor
+    pygame.init()
+
+    # opens up a window
+    screen = pygame.display.set_mode(size)
+    pygame.display.set_caption("ADVERSIAL SUDOKU")
+
+    # defining a font
+    smallfont = pygame.font.SysFont('Arial', 35)
+    bigfont = pygame.font.SysFont('TimesNewRoman', 60)
+
+    # Get the rect of each text, rendered in this font
+    play_rect = smallfont.render("Play", True, white).get_rect(topleft=play_pos)
+    simulation_rect = smallfont.render("Simulation", True, white).get_rect(topleft=simulation_pos)
+    replay_rect = smallfont.render("Replay", True, white).get_rect(topleft=replay_pos)
+    quit_rect = smallfont.render("Quit", True, white).get_rect(topleft=quit_pos)
+
+    # set the background image
+    background_img = pygame.image.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), "blackboard.jpg"))
 
 
 def update_cord(pos) -> tuple:
@@ -119,18 +147,7 @@ def check_valid(value: int, location: tuple) -> bool:
     """
     check if the value in the coordinate is valid
     """
-    for i in range(9):
-        if grid[location[0]][i] == value:
-            return False
-        if grid[i][location[1]] == value:
-            return False
-
-    for i in range(location[0] - location[0] % 3, location[0] - location[0] % 3 + 3):
-        for j in range(location[1] - location[1] % 3, location[1] - location[1] % 3 + 3):
-            if grid[i][j] == value:
-                return False
-
-    return True
+    return grid[location[0]][location[1]] != value and is_move_legal(grid, location, value)
 
 
 def draw_board(screen: screen, selected: Optional[tuple]):
@@ -167,7 +184,7 @@ def draw_board(screen: screen, selected: Optional[tuple]):
         else:
             instruction = smallfont.render('Press R to regenerate', True, white)
             screen.blit(instruction, (170, 600))
-            count_text = smallfont.render("Steps remaining: " + str(MAX_GUESSES - len(game.guesses)), True, white)
+            count_text = smallfont.render("Steps remaining: " + str(game.max_guesses - len(game.guesses)), True, white)
             screen.blit(count_text, (180, 650))
     else:
         if game.get_winner() is not None:
@@ -176,9 +193,14 @@ def draw_board(screen: screen, selected: Optional[tuple]):
             ins = smallfont.render('Press Q to quit', True, white)
             screen.blit(ins, (220, 650))
         else:
-            message = smallfont.render('Simulating...', True, white)
-            screen.blit(message, (250, 600))
-            count_text = smallfont.render("Steps remaining: " + str(MAX_GUESSES - len(game.guesses)), True, white)
+            if replay is None:
+                message = smallfont.render('Simulating...', True, white)
+                screen.blit(message, (250, 600))
+            else:
+                state = 'Paused' if replay.paused else f'{replay.speed:g} rounds/s'
+                message = smallfont.render(f'Round {replay.position}/{replay.rounds}, {state}', True, white)
+                screen.blit(message, (325 - message.get_width() // 2, 600))
+            count_text = smallfont.render("Steps remaining: " + str(game.max_guesses - len(game.guesses)), True, white)
             screen.blit(count_text, (180, 650))
 
     # Fill grid with numbers specified
@@ -194,71 +216,56 @@ def draw_board(screen: screen, selected: Optional[tuple]):
     pygame.display.update()
 
 
-def run_game(guesser: player.Guesser, adversary: player.Adversary, max_guesses: int, board_length: int,
-             difficulty: int = 50) -> AdversarialSudoku:
-    """Run an Adversarial Sudoku game between the two given players.
-
-    Use the words in word_set_file, and use max_guesses as the maximum number of guesses.
-
-    Return the AdversarialWordle instance after the game is complete.
+def draw_menu(mouse: tuple):
+    """
+    draw the menu on the pygame screen, highlighting the text under the mouse
+    """
+    # load the background image
+    screen.blit(background_img, (0, 0))
 
-    Preconditions:
-    - word_set_file is a non-empty with one word per line
-    - all words in word_set_file have the same length
-    - max_guesses >= 1
+    # Set the color of the play text based on mouse hover
+    if play_rect.collidepoint(mouse):
+        play_color = hover_color
+    else:
+        play_color = white
 
-    # >>> guesser = player.GreedyTreeGuesser()
-    # >>> adversary = player.GreedyTreeAdversary()
-    # >>> run_game(guesser, adversary, 81, 9, 50)
-    """
-    game = AdversarialSudoku(max_guesses, board_length, difficulty)
-
-    i = 1
-    while game.get_winner() is None:
-        guess = guesser.make_move(game)
-        game.record_guesser_move(guess)
-        status = adversary.make_move(game)
-        game.record_adversary_move(status)
-
-        print(f'round{i}')
-        if game.statuses[-1][0][game.guesses[-1][0][0]][game.guesses[-1][0][1]] == \
-                game.statuses[-1][1][game.guesses[-1][0][0]][game.guesses[-1][0][1]]:
-            print('Fail to guess the correct number')
-        else:
-            print('Guess correctly')
-        i = i + 1
+    # Set the color of the simulation text based on mouse hover
+    if simulation_rect.collidepoint(mouse):
+        simulation_color = hover_color
+    else:
+        simulation_color = white
 
-    print(f'Game Winner: {game.get_winner()}')  # . Moves: {game.get_move_sequence()}
-    return game
+    # Set the color of the replay text based on mouse hover
+    if replay_rect.collidepoint(mouse):
+        replay_color = hover_color
+    else:
+        replay_color = white
 
+    # Set the color of the quit text based on mouse hover
+    if quit_rect.collidepoint(mouse):
+        quit_color = hover_color
+    else:
+        quit_color = white
 
-def run_games(num_games: int,
-              guesser: player.Guesser, adversary: player.Adversary,
-              max_guesses: int,
-              board_length: int,
-              difficulty: int = 50,
-              print_game: bool = True) -> dict[str, int]:
-    """Run num_games games of Adversary Sudoku between the two given players.
+    # Render the texts with their colors
+    play_text_rendered = smallfont.render("Play", True, play_color)
+    simulation_text_rendered = smallfont.render("Simulation", True, simulation_color)
+    replay_text_rendered = smallfont.render("Replay", True, replay_color)
+    quit_text_rendered = smallfont.render("Quit", True, quit_color)
 
-    Optional arguments:
-    - print_game: print a record of each game (default: True)
-    """
-    stats = {'Guesser': 0, 'Adversary': 0}
-    results = []
-    for i in range(0, num_games):
-        guesser_copy = copy.copy(guesser)
-        adversary_copy = copy.copy(adversary)
+    # Draw the texts on the screen
+    screen.blit(play_text_rendered, play_rect)
+    screen.blit(simulation_text_rendered, simulation_rect)
+    screen.blit(replay_text_rendered, replay_rect)
+    screen.blit(quit_text_rendered, quit_rect)
 
-        game = run_game(guesser_copy, adversary_copy, max_guesses, board_length, difficulty)
-        winner = game.get_winner()
-        stats[winner] += 1
-        results.append(winner)
+    screen.blit(bigfont.render('Adversial Sudoku', True, white), (120, 240))
 
-        if print_game:
-            print(f'Game {i} winner: {winner}')
+    # Update the display
+    pygame.display.flip()
 
-    print(stats)
-    return stats
+    # updates the frames of the game
+    pygame.display.update()
 
 
 if __name__ == '__main__':
@@ -266,9 +273,13 @@ if __name__ == '__main__':
     # adversary = player.NormalAdversary()
     # run_games(10, guesser, adversary, 81, 9, 10, print_game=True)
 
+    if len(sys.argv) > 1:
+        REPLAY_FILE = sys.argv[1]
+    if len(sys.argv) > 2:
+        REPLAY_GAME = int(sys.argv[2])
+    init_display()
+
     while True:
-        # load the background image
-        screen.blit(background_img, (0, 0))
         # stores the (x,y) coordinates
         mouse = pygame.mouse.get_pos()
 
@@ -276,6 +287,7 @@ if __name__ == '__main__':
 
             if ev.type == pygame.QUIT:
                 pygame.quit()
+                sys.exit()
 
             # checks if a mouse is clicked
             if ev.type == pygame.MOUSEBUTTONDOWN:
@@ -398,38 +410,66 @@ if __name__ == '__main__':
                         pygame.time.delay(50)
                         pygame.display.flip()
 
-        # Set the color of the play text based on mouse hover
-        if play_rect.collidepoint(mouse):
-            play_color = hover_color
-        else:
-            play_color = white
-
-        # Set the color of the simulation text based on mouse hover
-        if simulation_rect.collidepoint(mouse):
-            simulation_color = hover_color
-        else:
-            simulation_color = white
-
-        # Set the color of the quit text based on mouse hover
-        if quit_rect.collidepoint(mouse):
-            quit_color = hover_color
-        else:
-            quit_color = white
-
-        # Render the texts with their colors
-        play_text_rendered = smallfont.render("Play", True, play_color)
-        simulation_text_rendered = smallfont.render("Simulation", True, simulation_color)
-        quit_text_rendered = smallfont.render("Quit", True, quit_color)
-
-        # Draw the texts on the screen
-        screen.blit(play_text_rendered, play_rect)
-        screen.blit(simulation_text_rendered, simulation_rect)
-        screen.blit(quit_text_rendered, quit_rect)
+                elif replay_rect.collidepoint(ev.pos):
+                    # Replay the games recorded in REPLAY_FILE without simulating them:
+                    # space pauses, the arrows step back and forth, up and down change the speed,
+                    # home, end and the digits seek, page up and page down change the game
+                    try:
+                        records = GameRecordFile(REPLAY_FILE)
+                    except (OSError, ValueError) as error:
+                        print(f'Cannot replay {REPLAY_FILE}: {error}')
+                        continue
+                    if len(records) == 0:
+                        print(f'No game is recorded in {REPLAY_FILE}')
+                        records.close()
+                        continue
+                    replay_running = True
+
+                    # setting the replay
+                    replay_screen = pygame.display.set_mode((width, height))
+                    game_number = REPLAY_GAME % len(records)
+                    replay = Replay(records[game_number], REPLAY_SPEED, time.monotonic())
+
+                    while replay_running:
+                        now = time.monotonic()
 
-        screen.blit(bigfont.render('Adversial Sudoku', True, white), (120, 240))
+                        for event in pygame.event.get():
+                            if event.type == pygame.QUIT:
+                                replay_running = False
+                            elif event.type == pygame.KEYDOWN:
+                                if event.key == pygame.K_q:
+                                    replay_running = False
+                                elif event.key == pygame.K_SPACE:
+                                    replay.toggle_pause(now)
+                                elif event.key == pygame.K_LEFT:
+                                    replay.step(-1, now)
+                                elif event.key == pygame.K_RIGHT:
+                                    replay.step(1, now)
+                                elif event.key == pygame.K_UP:
+                                    replay.set_speed(replay.speed * 2)
+                                elif event.key == pygame.K_DOWN:
+                                    replay.set_speed(replay.speed / 2)
+                                elif event.key == pygame.K_HOME:
+                                    replay.seek(0, now)
+                                elif event.key == pygame.K_END:
+                                    replay.seek(replay.rounds, now)
+                                elif pygame.K_0 <= event.key <= pygame.K_9:
+                                    replay.seek(replay.rounds * (event.key - pygame.K_0) // 10, now)
+                                elif event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+                                    game_number += 1 if event.key == pygame.K_PAGEDOWN else -1
+                                    game_number %= len(records)
+                                    replay = Replay(records[game_number], replay.speed, now)
+
+                        replay.update(now)
+                        game = replay.game()
+                        grid = replay.board()
+                        original_grid = replay.record.puzzle
+                        draw_board(replay_screen, None)
+
+                        pygame.time.delay(20)
+                        pygame.display.flip()
 
-        # Update the display
-        pygame.display.flip()
+                    records.close()
+                    replay = None
 
-        # updates the frames of the game
-        pygame.display.update()
+        draw_menu(mouse)
@@ -4,46 +4,75 @@ The main running block of the project
 from __future__ import annotations
 
 import copy
+import json
+import os
+import random
+import time
+from typing import Any, Iterator, Optional
 # from python_ta.contracts import check_contracts
 
 import sudoku_players as player
 from adversarial_sudoku import AdversarialSudoku, copy_board
+from sudoku_events import EventSink, GameEvent, NullSink, PrintSink
+from sudoku_game_records import GameRecordWriter
 
 
-def run_game(guesser: player.Guesser, adversary: player.Adversary, max_guesses: int, board_length: int,
-             difficulty: int = 50) -> AdversarialSudoku:
-    """Run an Adversarial Sudoku game between the two given players.
-
-    Use the words in word_set_file, and use max_guesses as the maximum number of guesses.
-
-    Return the AdversarialWordle instance after the game is complete.
+def iter_game(guesser: player.Guesser, adversary: player.Adversary, game: AdversarialSudoku,
+              game_number: int = 0) -> Iterator[GameEvent]:
+    """Play game between the two given players to the end, yielding its events (see `sudoku_events`) as they happen.
 
     Preconditions:
-    - word_set_file is a non-empty with one word per line
-    - all words in word_set_file have the same length
-    - max_guesses >= 1
-
-    >>> guesser = player.GreedyTreeGuesser()
-    >>> adversary = player.GreedyTreeAdversary()
-    >>> run_game(guesser, adversary, 81, 9, 60)
+    - game.is_guesser_turn()
     """
-    game = AdversarialSudoku(max_guesses, board_length, difficulty)
+    start = time.perf_counter()
+    n = len(game.current_board)
+    yield GameEvent('start', game_number, 0, 0.0,
+                    {'board': copy_board(game.current_board), 'n': n, 'max_guesses': game.max_guesses})
 
     i = 1
     while game.get_winner() is None:
+        before = time.perf_counter()
         guess = guesser.make_move(game)
         game.record_guesser_move(guess)
+        after = time.perf_counter()
+        yield GameEvent('guess', game_number, i, after - start,
+                        {'cell': list(guess[0]), 'value': guess[1], 'seconds': after - before})
         status = adversary.make_move(game)
         game.record_adversary_move(status)
-        print(f'round{i}')
-        if game.current_board == game.statuses[-1][1]:
-            print('Fail to guess the correct number')
-        else:
-            print('Guess Correctly')
+        before, after = after, time.perf_counter()
+        (r, c), value = guess
+        yield GameEvent('status', game_number, i, after - start,
+                        {'accepted': status[1][r][c] == value, 'board': copy_board(status[1]),
+                         'seconds': after - before})
         game.current_board = copy_board(game.statuses[-1][1])
         i += 1
 
-    print(f'Game Winner: {game.get_winner()}')  # . Moves: {game.get_move_sequence()}
+    yield GameEvent('end', game_number, i - 1, time.perf_counter() - start,
+                    {'winner': game.get_winner(), 'rounds': i - 1})
+
+
+def run_game(guesser: player.Guesser, adversary: player.Adversary, max_guesses: int, board_length: int,
+             difficulty: int = 50, sink: Optional[EventSink] = None) -> AdversarialSudoku:
+    """Run an Adversarial Sudoku game between the two given players.
+
+    Use a random board_length x board_length puzzle with difficulty percent of its cells empty, and use max_guesses
+    as the maximum number of guesses. The events of the game are sent to sink; by default nothing is reported, pass
+    a `sudoku_events.PrintSink` to print the game as it goes.
+
+    Return the AdversarialSudoku instance after the game is complete.
+
+    Preconditions:
+    - max_guesses >= 1
+
+    >>> guesser = player.GreedyTreeGuesser()
+    >>> adversary = player.GreedyTreeAdversary()
+    >>> run_game(guesser, adversary, 81, 9, 60).get_winner() in ('Guesser', 'Adversary')
+    True
+    """
+    game = AdversarialSudoku(max_guesses, board_length, difficulty)
+    sink = sink or NullSink()
+    for event in iter_game(guesser, adversary, game):
+        sink.emit(event)
     return game
 
 
@@ -52,40 +81,114 @@ def run_games(num_games: int,
               max_guesses: int,
               board_length: int,
               difficulty: int = 50,
-              print_game: bool = True) -> dict[str, int]:
+              print_game: bool = False,
+              sink: Optional[EventSink] = None,
+              records: Optional[GameRecordWriter] = None,
+              checkpoint: Optional[str] = None,
+              checkpoint_every: int = 10) -> dict[str, int]:
     """Run num_games games of Adversary Wordle between the two given players.
 
-    Use the given word_set_file and max_guesses (these parameters are the same as
+    Use the given max_guesses, board_length and difficulty (these parameters are the same as
     in run_game).
 
     Optional arguments:
-    - print_game: print a record of each game (default: True)
-    - show_stats: use Plotly to display statistics for the game runs (default: False)
+    - print_game: print the winner of each game and the totals (default: False)
+    - sink: receives the events of every game, numbered by game (default: none are kept)
+    - records: every finished game is appended to it (default: none are kept)
+    - checkpoint: the path of a checkpoint file, saved every checkpoint_every games, when the batch ends and when it
+      is interrupted. If the file exists, the batch resumes from it where it stopped, with the same random state,
+      so it plays the same games as a batch that was never stopped. Games played after the last save are played
+      again: their events are sent to sink again, and their records are cut from records (default: no checkpoint)
 
     Preconditions:
         - num_games >= 1
         - same preconditions for word_set_file and max_guesses as run_game
+        - checkpoint_every >= 1
+
+    Raises:
+        - ValueError: if the checkpoint file was saved by a batch with other players or parameters
     """
+    batch = {'num_games': num_games, 'guesser': type(guesser).__name__, 'adversary': type(adversary).__name__,
+             'max_guesses': max_guesses, 'board_length': board_length, 'difficulty': difficulty}
     stats = {'Guesser': 0, 'Adversary': 0}
     results = []
-    for i in range(0, num_games):
-        guesser_copy = copy.copy(guesser)
-        adversary_copy = copy.copy(adversary)
-
-        game = run_game(guesser_copy, adversary_copy, max_guesses, board_length, difficulty)
-        winner = game.get_winner()
-        stats[winner] += 1
-        results.append(winner)
+    if checkpoint is not None and os.path.exists(checkpoint):
+        state = _load_checkpoint(checkpoint, batch)
+        stats, results = state['stats'], state['winners']
+        random.setstate(state['random'])
+        if records is not None and state['records_size'] is not None:
+            records.truncate(state['records_size'])
+    saved = len(results)
+    random_state = random.getstate()
+    records_size = None if checkpoint is None or records is None else records.tell()
+
+    try:
+        for i in range(len(results), num_games):
+            guesser_copy = copy.copy(guesser)
+            adversary_copy = copy.copy(adversary)
+
+            game = AdversarialSudoku(max_guesses, board_length, difficulty)
+            for event in iter_game(guesser_copy, adversary_copy, game, i):
+                if sink is not None:
+                    sink.emit(event)
+            if records is not None:
+                records.write(game)
+            winner = game.get_winner()
+            stats[winner] += 1
+            results.append(winner)
+            random_state = random.getstate()
+            if checkpoint is not None and records is not None:
+                records_size = records.tell()
+
+            if print_game:
+                print(f'Game {i} winner: {winner}')
+
+            if checkpoint is not None and (i + 1) % checkpoint_every == 0:
+                _save_checkpoint(checkpoint, batch, stats, results, random_state, records_size)
+                saved = len(results)
+    finally:
+        # save the games finished since the last checkpoint, also when the batch is interrupted
+        if checkpoint is not None and len(results) > saved:
+            _save_checkpoint(checkpoint, batch, stats, results, random_state, records_size)
+
+    if print_game:
+        print(stats)
+    return stats
 
-        if print_game:
-            print(f'Game {i} winner: {winner}')
 
-    print(stats)
-    return stats
+def _save_checkpoint(path: str, batch: dict[str, Any], stats: dict[str, int], winners: list[str],
+                     random_state: tuple, records_size: Optional[int]) -> None:
+    """Save the state of a batch of games to the checkpoint file at path, replacing the file only once the new one
+    is complete.
+    """
+    version, internal_state, gauss_next = random_state
+    state = {'batch': batch, 'stats': stats, 'winners': winners,
+             'random': [version, list(internal_state), gauss_next],
+             'records_size': records_size}
+    with open(path + '.tmp', 'w') as file:
+        json.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _load_checkpoint(path: str, batch: dict[str, Any]) -> dict[str, Any]:
+    """Return the state of a batch of games saved to the checkpoint file at path.
+
+    Raises:
+        - ValueError: if the checkpoint was saved by a batch other than batch
+    """
+    with open(path) as file:
+        state = json.load(file)
+    if state['batch'] != batch:
+        raise ValueError(f'The checkpoint {path} was saved by another batch of games: {state["batch"]}.')
+    version, internal_state, gauss_next = state['random']
+    state['random'] = (version, tuple(internal_state), gauss_next)
+    return state
 
 
 if __name__ == '__main__':
     guesser = player.GreedyTreeGuesser()
     adversary = player.GreedyTreeAdversary()
     # run_games(10, guesser, adversary, 81, 9, 70)
-    run_game(guesser, adversary, 81, 9, 56)
+    run_game(guesser, adversary, 81, 9, 56, sink=PrintSink())
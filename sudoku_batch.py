@@ -0,0 +1,196 @@
+"""Solving and counting many sudoku boards at once across worker processes.
+
+`solve_boards` takes any iterable of boards, for example the lines of a file, and yields one BatchResult per board in
+input order. Boards are sent to a process pool in chunks, and only a few chunks are in flight at a time, so a stream of
+millions of boards is never held in memory. A board that cannot be read gets a result with its error instead of
+stopping the batch.
+
+Boards may be given as nested lists or as lines of n * n characters in row-major order, with '0' or '.' for empty
+cells, '1' to '9' for digits up to 9 and 'A', 'B', ... for the digits from 10 on.
+"""
+from __future__ import annotations
+
+import os
+from collections import deque
+from itertools import islice
+from math import isqrt
+from multiprocessing import Pool
+from typing import Iterable, Iterator, Optional, TextIO
+
+import sudoku_setup as setup
+
+DIGITS = '123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+class BatchResult:
+    """
+    The result of solving one board of a batch.
+
+    Instance Attributes:
+    - index: the position of the board in the input
+    - board: the board that was solved, or None if it could not be read
+    - solution: a solution of the board, or None if it has none or could not be read
+    - count: the number of solutions, or the limit if the board has at least that many
+    - error: why the board could not be read, or None
+    """
+    __slots__ = ('index', 'board', 'solution', 'count', 'error')
+    index: int
+    board: Optional[list[list[int]]]
+    solution: Optional[list[list[int]]]
+    count: int
+    error: Optional[str]
+
+    def __init__(self, index: int, board: Optional[list[list[int]]], solution: Optional[list[list[int]]],
+                 count: int, error: Optional[str] = None) -> None:
+        """Initialize a new result."""
+        self.index = index
+        self.board = board
+        self.solution = solution
+        self.count = count
+        self.error = error
+
+    def __repr__(self) -> str:
+        if self.error is not None:
+            return f'BatchResult({self.index}, error={self.error!r})'
+        return f'BatchResult({self.index}, count={self.count})'
+
+
+def solve_boards(boards: Iterable[list[list[int]] | str], limit: Optional[int] = 1, workers: Optional[int] = None,
+                 chunk_size: int = 256) -> Iterator[BatchResult]:
+    """Yield the result of solving every board, in input order.
+
+    Variables:
+        - limit: solutions are counted up to this number, so the default only solves; None counts every solution
+        - workers: the number of worker processes, or None for one per CPU; 0 solves in this process
+        - chunk_size: the number of boards sent to a worker at once
+
+    Preconditions:
+        - limit is None or limit >= 1
+        - chunk_size >= 1
+    """
+    chunks = _chunks(boards, chunk_size)
+    if workers == 0:
+        for chunk in chunks:
+            yield from _solve_chunk((chunk, limit))
+        return
+
+    with Pool(workers) as pool:
+        window = 2 * (workers or os.cpu_count() or 1)
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_solve_chunk, ((chunk, limit),)))
+            if len(pending) >= window:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def count_boards(boards: Iterable[list[list[int]] | str], limit: Optional[int] = None,
+                 workers: Optional[int] = None, chunk_size: int = 256) -> Iterator[int]:
+    """Yield the number of solutions of every board in input order, up to limit, or -1 for a board that could not
+    be read.
+    """
+    for result in solve_boards(boards, limit, workers, chunk_size):
+        yield -1 if result.error is not None else result.count
+
+
+def read_boards(file: TextIO) -> Iterator[str]:
+    """Yield the board lines of a text file, skipping blank lines and lines starting with '#'."""
+    for line in file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def parse_board(line: str) -> list[list[int]]:
+    """Return the board written on line.
+
+    Raises:
+        - ValueError: if line is not a square board of a valid size, or has a character that is not a digit of it
+
+    >>> parse_board('1.3.' '..1.' '3...' '.1.3')[0]
+    [1, 0, 3, 0]
+    """
+    n = isqrt(len(line))
+    if n * n != len(line) or not _is_board_length(n):
+        raise ValueError(f'A board of {len(line)} characters is not a square sudoku board.')
+    values = []
+    for char in line.upper():
+        if char in '0.':
+            values.append(0)
+        else:
+            value = DIGITS.find(char) + 1
+            if not 1 <= value <= n:
+                raise ValueError(f'{char!r} is not a digit of a {n}x{n} board.')
+            values.append(value)
+    return [values[r * n:(r + 1) * n] for r in range(n)]
+
+
+def format_board(board: list[list[int]]) -> str:
+    """Return board written as a single line, the inverse of parse_board."""
+    return ''.join(DIGITS[value - 1] if value else '.' for row in board for value in row)
+
+
+def _is_board_length(n: int) -> bool:
+    """Return whether n is the side length of a sudoku board, without printing like setup.is_initiated_number."""
+    return n > 0 and isqrt(n) ** 2 == n
+
+
+def _chunks(boards: Iterable[list[list[int]] | str], chunk_size: int) -> Iterator[list[tuple[int, object]]]:
+    """Yield the boards in lists of chunk_size (index, board) pairs."""
+    numbered = enumerate(boards)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _solve_chunk(task: tuple[list[tuple[int, object]], Optional[int]]) -> list[BatchResult]:
+    """Solve one chunk of boards in a worker process."""
+    chunk, limit = task
+    results = []
+    for index, board in chunk:
+        try:
+            if isinstance(board, str):
+                board = parse_board(board)
+            results.append(_solve_one(index, board, limit))
+        except (ValueError, TypeError, IndexError) as error:
+            results.append(BatchResult(index, None, None, 0, str(error)))
+    return results
+
+
+def _solve_one(index: int, board: list[list[int]], limit: Optional[int]) -> BatchResult:
+    """Return the result of solving board, counting its solutions up to limit."""
+    n = len(board)
+    if not _is_board_length(n) or any(len(row) != n for row in board):
+        raise ValueError('The board is not a square sudoku board.')
+    solution, count = None, 0
+    for found in islice(setup.iter_solutions(board, n), limit):
+        if solution is None:
+            solution = found
+        count += 1
+    return BatchResult(index, board, solution, count)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Solve the boards of a file, one per line.')
+    parser.add_argument('path', nargs='?', default='-', help='the board file, or - for standard input')
+    parser.add_argument('--count', type=int, default=None, metavar='LIMIT',
+                        help='count solutions up to LIMIT instead of printing a solution')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    args = parser.parse_args()
+
+    source = sys.stdin if args.path == '-' else open(args.path)
+    with source:
+        for result in solve_boards(read_boards(source), args.count or 1, args.workers, args.chunk_size):
+            if result.error is not None:
+                print(f'error: {result.error}')
+            elif args.count:
+                print(result.count)
+            else:
+                print(format_board(result.solution) if result.solution is not None else 'unsolvable')
@@ -0,0 +1,349 @@
+"""Benchmarks of Adversarial Sudoku.
+
+Each benchmark is a subcommand:
+    - startup: the time to import `main` and to draw the first frame of its menu, each measured in a fresh
+      interpreter, which must stay under a limit
+    - games: the throughput of whole games played by `run_game`, for every pair of players, board size and
+      difficulty asked for; each case runs in a fresh process from a fixed seed, and reports games per second, the
+      percentiles of the seconds taken by single moves and the peak resident memory of its process
+    - primitives: the time of one call to each of the board primitives called in the inner loops of the tree
+      searches, on boards of the sizes asked for, built from a fixed seed
+
+Run `python sudoku_benchmark.py <benchmark> --help` for the options of a benchmark. A benchmark exits with status 1
+when its numbers are worse than allowed. The results of a benchmark can be saved as a baseline file with --save,
+and compared with a baseline with --compare, which flags every result worse than the baseline by more than
+--threshold.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from typing import Any, Callable, Optional
+
+import sudoku_players as player
+import sudoku_setup as setup
+from adversarial_sudoku import AdversarialSudoku, copy_board
+from main_without_visualization import run_game
+from sudoku_events import CallbackSink, GameEvent
+from sudoku_gametree import find_degree, get_available_numbers, order_cells
+from sudoku_scheduler import ADVERSARIES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+################################################################################
+# Startup
+################################################################################
+# Run in a fresh interpreter, printing the seconds taken by the import, then by the first frame
+_STARTUP_SCRIPT = '''
+import time
+start = time.perf_counter()
+import main
+print(time.perf_counter() - start, flush=True)
+start = time.perf_counter()
+main.init_display()
+main.draw_menu((0, 0))
+print(time.perf_counter() - start, flush=True)
+'''
+
+
+def startup_times(headless: bool = True) -> tuple[float, Optional[float], str]:
+    """Return the seconds a fresh interpreter takes to import main and to draw the first frame of the menu, with
+    None for the frame and the error reported when it could not be drawn, e.g. because pygame is not installed.
+
+    If headless, pygame draws to no window.
+    """
+    env = dict(os.environ)
+    if headless:
+        env.setdefault('SDL_VIDEODRIVER', 'dummy')
+        env.setdefault('SDL_AUDIODRIVER', 'dummy')
+    result = subprocess.run([sys.executable, '-c', _STARTUP_SCRIPT], cwd=HERE, env=env, capture_output=True,
+                            text=True)
+    times = [float(line) for line in result.stdout.split()]
+    if not times:
+        raise RuntimeError(f'main could not be imported:\n{result.stderr}')
+    if len(times) < 2:
+        errors = result.stderr.strip().splitlines()
+        return times[0], None, errors[-1] if errors else f'exit status {result.returncode}'
+    return times[0], times[1], ''
+
+
+def _startup(args: argparse.Namespace) -> int:
+    """Run the startup benchmark."""
+    imports, frames, error = [], [], ''
+    for _ in range(args.runs):
+        import_time, frame_time, error = startup_times(not args.window)
+        imports.append(import_time)
+        if frame_time is not None:
+            frames.append(frame_time)
+    print(f'import      median {statistics.median(imports) * 1000:8.1f} ms   max {max(imports) * 1000:8.1f} ms')
+    if frames:
+        print(f'first frame median {statistics.median(frames) * 1000:8.1f} ms   max {max(frames) * 1000:8.1f} ms')
+    else:
+        print(f'first frame not drawn: {error}')
+    total = statistics.median(imports) + (statistics.median(frames) if frames else 0.0)
+    print(f'startup     median {total * 1000:8.1f} ms   limit {args.limit * 1000:8.1f} ms')
+    return int(total > args.limit)
+
+
+################################################################################
+# Games
+################################################################################
+GUESSERS = {
+    'normal': player.NormalGuesser,
+    'greedy': player.GreedyTreeGuesser,
+}
+
+# the metrics of a game benchmark compared with a baseline, and whether a higher value is better
+GAME_METRICS = {'games_per_second': True, 'peak_rss_mb': False}
+
+
+def game_throughput(guesser: str, adversary: str, n: int, difficulty: int, games: int,
+                    seed: int = 0) -> dict[str, Any]:
+    """Return the numbers of playing games games between fresh players of the given kinds with `run_game`, on
+    n x n puzzles with difficulty percent of their cells empty, after seeding the random generator with seed.
+
+    The numbers are the seconds taken, the games per second, the number of moves (guesses and answers), the 50th,
+    90th and 99th percentiles of the milliseconds taken by a move, and the peak resident memory of the process in
+    MB, which only describes the games if the process played nothing else.
+    """
+    random.seed(seed)
+    moves = []
+
+    def record_move(event: GameEvent) -> None:
+        if event.kind in ('guess', 'status'):
+            moves.append(event.data['seconds'])
+
+    sink = CallbackSink(record_move)
+    start = time.perf_counter()
+    for _ in range(games):
+        run_game(GUESSERS[guesser](), ADVERSARIES[adversary](), n * n, n, difficulty, sink)
+    seconds = time.perf_counter() - start
+    moves.sort()
+    return {
+        'seconds': seconds,
+        'games_per_second': games / seconds,
+        'moves': len(moves),
+        'p50_ms': 1000 * _percentile(moves, 0.5),
+        'p90_ms': 1000 * _percentile(moves, 0.9),
+        'p99_ms': 1000 * _percentile(moves, 0.99),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _games(args: argparse.Namespace) -> int:
+    """Run the game benchmark."""
+    results = {}
+    print(f'{"case":32} {"games/s":>9} {"moves":>6} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"peak MB":>8}')
+    for n in args.sizes:
+        for difficulty in args.difficulties:
+            for guesser in args.guessers:
+                for adversary in args.adversaries:
+                    case = f'{guesser}-{adversary}-{n}x{n}-{difficulty}%'
+                    result = run_isolated(game_throughput, (guesser, adversary, n, difficulty, args.games, args.seed),
+                                          args.timeout, args.max_memory)
+                    results[case] = result
+                    if 'error' in result:
+                        print(f'{case:32} {result["error"]}')
+                    else:
+                        print(f'{case:32} {result["games_per_second"]:9.2f} {result["moves"]:6} '
+                              f'{result["p50_ms"]:9.2f} {result["p90_ms"]:9.2f} {result["p99_ms"]:9.2f} '
+                              f'{result["peak_rss_mb"]:8.1f}', flush=True)
+    return _check_baseline(args, results, GAME_METRICS)
+
+
+################################################################################
+# Primitives
+################################################################################
+# the metrics of a primitive benchmark compared with a baseline, and whether a higher value is better
+PRIMITIVE_METRICS = {'min_ns': False}
+
+
+def primitive_calls(n: int, seed: int = 0) -> dict[str, tuple[Callable, tuple]]:
+    """Return the calls timed by the primitive benchmark on n x n boards, as (function, arguments) pairs by name.
+
+    The boards are built after seeding the random generator with seed: a solution, and a puzzle with half of its
+    cells empty, in a game whose first round was played by a NormalGuesser and a NormalAdversary.
+    """
+    random.seed(seed)
+    solution = setup.generate_sudoku(n)
+    game = AdversarialSudoku(n * n, n, 50)
+    game.record_guesser_move(player.NormalGuesser().make_move(game))
+    game.record_adversary_move(player.NormalAdversary().make_move(game))
+    game.current_board = copy_board(game.statuses[-1][1])
+    board = game.current_board
+    empty = next((i, j) for i in [*range(n // 2, n), *range(n // 2)] for j in range(n) if board[i][j] == 0)
+    return {
+        'copy_board': (copy_board, (board,)),
+        'order_cells': (order_cells, (board,)),
+        'find_degree': (find_degree, (board, empty)),
+        'get_available_numbers': (get_available_numbers, (board, empty)),
+        'is_position_valid': (setup.is_position_valid, ((n // 2, n // 2), solution, n)),
+        'is_valid_solution': (setup.is_valid_solution, (solution, n)),
+        'get_winner': (game.get_winner, ()),
+    }
+
+
+def time_call(function: Callable, args: tuple, repeats: int = 7, warmup: int = 2) -> dict[str, float]:
+    """Return the nanoseconds one call function(*args) takes: the minimum, median and standard deviation over
+    repeats timings, each of as many calls as run in at least 0.2 seconds, after warmup timings that are dropped.
+
+    Garbage collection is disabled while timing, as with timeit.
+    """
+    timer = timeit.Timer('function(*args)', globals={'function': function, 'args': args})
+    number, _ = timer.autorange()
+    times = [seconds / number * 1e9 for seconds in timer.repeat(warmup + repeats, number)[warmup:]]
+    return {
+        'calls': number,
+        'min_ns': min(times),
+        'median_ns': statistics.median(times),
+        'stdev_ns': statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def _primitives(args: argparse.Namespace) -> int:
+    """Run the primitive benchmark."""
+    results = {}
+    print(f'{"case":32} {"min ns":>12} {"median ns":>12} {"stdev":>7}')
+    for n in args.sizes:
+        for name, (function, call_args) in primitive_calls(n, args.seed).items():
+            if args.only and name not in args.only:
+                continue
+            case = f'{name}-{n}x{n}'
+            result = results[case] = time_call(function, call_args, args.repeats, args.warmup)
+            print(f'{case:32} {result["min_ns"]:12.1f} {result["median_ns"]:12.1f} '
+                  f'{result["stdev_ns"] / result["median_ns"]:7.1%}', flush=True)
+    return _check_baseline(args, results, PRIMITIVE_METRICS)
+
+
+################################################################################
+# Helpers
+################################################################################
+def run_isolated(function: Callable[..., dict[str, Any]], args: tuple, timeout: Optional[float] = None,
+                 max_memory: Optional[float] = None) -> dict[str, Any]:
+    """Return function(*args) called in a fresh process, so it is measured apart from anything run before.
+
+    The process is killed after timeout seconds, and may use at most max_memory MB of address space. If the call
+    fails or is killed, return a dict with only an 'error' key describing why.
+    """
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_call_isolated, args=(sender, function, args, max_memory), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        if receiver.poll(timeout):
+            return receiver.recv()
+        return {'error': f'timed out after {timeout:g}s'}
+    except EOFError:
+        return {'error': f'crashed with exit code {process.exitcode}'}
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        receiver.close()
+
+
+def _call_isolated(sender: Any, function: Callable[..., dict[str, Any]], args: tuple,
+                   max_memory: Optional[float]) -> None:
+    """Send the result of function(*args), or the error it raised, through sender. Runs in the isolated process."""
+    if max_memory is not None:
+        limit = int(max_memory * 2 ** 20)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+    try:
+        result = function(*args)
+    except MemoryError:
+        result = {'error': f'ran out of memory ({max_memory:g} MB)'}
+    except Exception as error:
+        result = {'error': f'{type(error).__name__}: {error}'}
+    sender.send(result)
+    sender.close()
+
+
+def _percentile(values: list[float], q: float) -> float:
+    """Return the q-th quantile of the sorted values, or 0.0 if there are none."""
+    return values[int(q * (len(values) - 1))] if values else 0.0
+
+
+def _check_baseline(args: argparse.Namespace, results: dict[str, dict[str, Any]], metrics: dict[str, bool]) -> int:
+    """Save results as the baseline file args.save and compare them with the baseline file args.compare, if given.
+    Return 1 if a result is worse than the baseline by more than args.threshold, else 0.
+
+    metrics maps the metrics compared to whether a higher value is better. A case that failed is worse than any
+    result, and cases missing from either side are not compared.
+    """
+    status = 0
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        for case, result in results.items():
+            if case not in baseline or 'error' in baseline[case]:
+                continue
+            if 'error' in result:
+                print(f'REGRESSION {case}: {result["error"]}')
+                status = 1
+                continue
+            for metric, higher_is_better in metrics.items():
+                old, new = baseline[case][metric], result[metric]
+                change = (new - old) / old if old else 0.0
+                if (-change if higher_is_better else change) > args.threshold:
+                    print(f'REGRESSION {case}: {metric} {old:.4g} -> {new:.4g} ({change:+.1%})')
+                    status = 1
+        if status == 0:
+            print(f'no regression beyond {args.threshold:.0%} against {args.compare}')
+    if args.save is not None:
+        with open(args.save, 'w') as file:
+            json.dump({'command': args.command, 'python': sys.version.split()[0], 'results': results}, file, indent=1)
+    return status
+
+
+def _add_baseline_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options saving and comparing baselines to parser."""
+    parser.add_argument('--save', metavar='FILE', help='save the results as a baseline file')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results with a baseline file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='the fraction by which a result may be worse than the baseline')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of Adversarial Sudoku.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    startup = commands.add_parser('startup', help='time the import of main and the first frame of its menu')
+    startup.add_argument('--runs', type=int, default=5, help='the number of fresh interpreters timed')
+    startup.add_argument('--limit', type=float, default=1.0, help='the most seconds startup may take')
+    startup.add_argument('--window', action='store_true', help='draw to a real window instead of none')
+    startup.set_defaults(run=_startup)
+
+    games = commands.add_parser('games', help='time whole games between pairs of players')
+    games.add_argument('--guessers', nargs='+', choices=sorted(GUESSERS), default=sorted(GUESSERS))
+    games.add_argument('--adversaries', nargs='+', choices=sorted(ADVERSARIES), default=sorted(ADVERSARIES))
+    games.add_argument('--sizes', nargs='+', type=int, default=[4, 9, 16], help='the board lengths')
+    games.add_argument('--difficulties', nargs='+', type=int, default=[30, 50, 70],
+                       help='the percentages of empty cells')
+    games.add_argument('--games', type=int, default=3, help='the number of games of every case')
+    games.add_argument('--seed', type=int, default=0, help='the seed of every case')
+    games.add_argument('--timeout', type=float, default=120.0, help='the most seconds a case may take')
+    games.add_argument('--max-memory', type=float, default=4096.0, help='the most MB of memory a case may use')
+    _add_baseline_arguments(games)
+    games.set_defaults(run=_games)
+
+    primitives = commands.add_parser('primitives', help='time single calls to the board primitives')
+    primitives.add_argument('--sizes', nargs='+', type=int, default=[9, 16], help='the board lengths')
+    primitives.add_argument('--only', nargs='+', metavar='PRIMITIVE', help='time only these primitives')
+    primitives.add_argument('--repeats', type=int, default=7, help='the number of timings of every primitive')
+    primitives.add_argument('--warmup', type=int, default=2, help='the number of timings dropped first')
+    primitives.add_argument('--seed', type=int, default=0, help='the seed of the boards')
+    _add_baseline_arguments(primitives)
+    primitives.set_defaults(run=_primitives)
+
+    arguments = parser.parse_args()
+    sys.exit(arguments.run(arguments))
@@ -0,0 +1,176 @@
+"""A candidate bitboard: the legal digits of every cell of a sudoku board as bitmasks.
+
+Move generation needs, for many cells at once, the digits that can still go in a cell and the cell's degree (the
+number of empty cells in its row, column and block, the order in which cells are guessed and revealed). A
+CandidateBoard computes both for every cell in one pass over the board and keeps them up to date as cells are filled
+and cleared, so the moves of a position, and of the positions one guess away, come from the same structure instead of
+a rescan of the row, column and block per cell.
+
+Digit d is bit d - 1 of a mask.
+"""
+from __future__ import annotations
+
+from math import isqrt
+from typing import Optional
+
+
+class CandidateBoard:
+    """
+    The candidate digits and degrees of every cell of a board.
+
+    Instance Attributes:
+    - n: the board length
+    - board: the board, updated by fill and clear
+    - masks: masks[r * n + c] is the mask of the digits that can be placed in the empty cell (r, c), 0 if filled
+
+    Representation Invariants:
+    - self.masks[r * self.n + c] == 0 whenever self.board[r][c] != 0
+    """
+    __slots__ = ('n', 'board', 'masks', '_b', '_full', '_used', '_empty')
+    n: int
+    board: list[list[int]]
+    masks: list[int]
+    _b: int
+    _full: int
+    # _used[u] and _empty[u] are the used-digit mask and the number of empty cells of unit u: rows 0..n - 1,
+    # columns n..2n - 1 and blocks 2n..3n - 1
+    _used: list[int]
+    _empty: list[int]
+
+    def __init__(self, board: list[list[int]]) -> None:
+        """Initialize the bitboard of a copy of board."""
+        n = len(board)
+        b = isqrt(n)
+        self.n = n
+        self.board = [row[:] for row in board]
+        self._b = b
+        self._full = (1 << n) - 1
+        self._used = [0] * (3 * n)
+        self._empty = [0] * (3 * n)
+        for r in range(n):
+            for c in range(n):
+                d = board[r][c]
+                for u in self._units(r, c):
+                    if d == 0:
+                        self._empty[u] += 1
+                    else:
+                        self._used[u] |= 1 << (d - 1)
+        self.masks = [self._mask(r, c) for r in range(n) for c in range(n)]
+
+    def candidates(self, cell: tuple[int, int]) -> int:
+        """Return the mask of the digits that can be placed in cell, 0 if it is filled."""
+        return self.masks[cell[0] * self.n + cell[1]]
+
+    def values(self, cell: tuple[int, int]) -> list[int]:
+        """Return the digits that can be placed in cell, in increasing order."""
+        return _digits(self.masks[cell[0] * self.n + cell[1]])
+
+    def degree(self, cell: tuple[int, int]) -> int:
+        """Return the number of empty cells in the row, column and block of cell, counting cell once in each."""
+        return sum(self._empty[u] for u in self._units(*cell))
+
+    def ordered_cells(self) -> list[tuple[tuple[int, int], int]]:
+        """Return every empty cell with its degree, from lowest to highest degree (row-major among equal degrees)."""
+        n = self.n
+        board = self.board
+        cells = [((r, c), self.degree((r, c))) for r in range(n) for c in range(n) if board[r][c] == 0]
+        cells.sort(key=lambda cell: cell[1])
+        return cells
+
+    def lowest_degree_cell(self) -> Optional[tuple[int, int]]:
+        """Return the first cell of ordered_cells, or None if the board is full."""
+        n = self.n
+        board = self.board
+        best, best_degree = None, 0
+        for r in range(n):
+            row = board[r]
+            for c in range(n):
+                if row[c] == 0:
+                    degree = self.degree((r, c))
+                    if best is None or degree < best_degree:
+                        best, best_degree = (r, c), degree
+        return best
+
+    def moves(self, cells: Optional[int] = None) -> list[tuple[tuple[int, int], int]]:
+        """Return every (cell, digit) that can be placed, for the given number of lowest-degree cells (all empty
+        cells if None), in the order of ordered_cells and then increasing digit.
+        """
+        ordered = self.ordered_cells()
+        if cells is not None:
+            ordered = ordered[:cells]
+        n = self.n
+        return [(cell, d) for cell, _ in ordered for d in _digits(self.masks[cell[0] * n + cell[1]])]
+
+    def fill(self, cell: tuple[int, int], d: int) -> None:
+        """Place digit d in the empty cell and update the masks of its row, column and block.
+
+        Preconditions:
+        - self.board[cell[0]][cell[1]] == 0
+        """
+        r, c = cell
+        bit = 1 << (d - 1)
+        self.board[r][c] = d
+        for u in self._units(r, c):
+            self._used[u] |= bit
+            self._empty[u] -= 1
+        masks = self.masks
+        masks[r * self.n + c] = 0
+        for k in _peers(self.n)[r * self.n + c]:
+            masks[k] &= ~bit
+
+    def clear(self, cell: tuple[int, int]) -> None:
+        """Empty the filled cell and recompute the masks of its row, column and block."""
+        r, c = cell
+        bit = 1 << (self.board[r][c] - 1)
+        self.board[r][c] = 0
+        for u in self._units(r, c):
+            self._used[u] &= ~bit
+            self._empty[u] += 1
+        n = self.n
+        self.masks[r * n + c] = self._mask(r, c)
+        for k in _peers(n)[r * n + c]:
+            self.masks[k] = self._mask(k // n, k % n)
+
+    def _units(self, r: int, c: int) -> tuple[int, int, int]:
+        """Return the row, column and block units of the cell (r, c)."""
+        b = self._b
+        return (r, self.n + c, 2 * self.n + (r // b) * b + c // b)
+
+    def _mask(self, r: int, c: int) -> int:
+        """Return the candidate mask of the cell (r, c) from the unit masks."""
+        if self.board[r][c] != 0:
+            return 0
+        row, col, block = self._units(r, c)
+        return self._full & ~(self._used[row] | self._used[col] | self._used[block])
+
+
+_PEERS: dict[int, list[tuple[int, ...]]] = {}
+
+
+def _peers(n: int) -> list[tuple[int, ...]]:
+    """Return, for every cell index of a board of length n, the indices of the other cells in its row, column and
+    block. The lists are built once per board length.
+    """
+    peers = _PEERS.get(n)
+    if peers is None:
+        b = isqrt(n)
+        peers = []
+        for k in range(n * n):
+            r, c = divmod(k, n)
+            br, bc = r - r % b, c - c % b
+            cells = {r * n + i for i in range(n)} | {i * n + c for i in range(n)} \
+                | {i * n + j for i in range(br, br + b) for j in range(bc, bc + b)}
+            cells.discard(k)
+            peers.append(tuple(sorted(cells)))
+        _PEERS[n] = peers
+    return peers
+
+
+def _digits(mask: int) -> list[int]:
+    """Return the digits of mask in increasing order."""
+    digits = []
+    while mask:
+        bit = mask & -mask
+        digits.append(bit.bit_length())
+        mask ^= bit
+    return digits
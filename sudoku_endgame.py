@@ -0,0 +1,188 @@
+"""Exact play for the last few empty cells of an Adversarial Sudoku game.
+
+Once few cells are empty, the game can be solved outright instead of estimated by a depth-limited game tree. A
+position is the current board together with the solutions still consistent with the game. From it, the Guesser
+guesses a cell and a digit, and the Adversary either
+    - rejects the guess, keeping the board and dropping the solutions with that digit in that cell, or
+    - accepts it, filling the cell and revealing the digit of the lowest-degree empty cell (as `order_cells` orders
+      them) from a solution of its choice.
+The Guesser wins once the board is full. The value of a position is the number of guesses the Guesser needs to fill
+the board when both players play perfectly, so the Guesser wins from a position exactly when its value is at most the
+number of guesses left.
+
+Values are memoized in an Endgame tablebase keyed by the position. The key is the board and the set of consistent
+solutions, independent of the order they were found in. It is not reduced further by the symmetries of
+`sudoku_symmetry`: the revealed cell is chosen by board position when degrees tie, so symmetric positions can have
+different values.
+"""
+from __future__ import annotations
+
+from collections import Counter, OrderedDict
+from math import isqrt
+from typing import Iterator, Optional
+
+from adversarial_sudoku import AdversarialSudoku
+from sudoku_candidates import CandidateBoard
+from sudoku_gametree import flatten_board, unflatten_board
+
+ENDGAME_CELLS = 6  # the players switch to exact play once at most this many cells are empty
+
+
+class Endgame:
+    """
+    A bounded tablebase of exact endgame values.
+
+    Instance Attributes:
+    - maxsize: the number of positions kept, least recently used first out
+    - hits: the number of values answered from the tablebase
+    - misses: the number of values computed by search
+    """
+    maxsize: int
+    hits: int
+    misses: int
+    _values: OrderedDict[bytes, int]
+
+    def __init__(self, maxsize: int = 1 << 16) -> None:
+        """Initialize an empty tablebase."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of positions in the tablebase."""
+        return len(self._values)
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters."""
+        self._values.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def value(self, board: list[list[int]], solutions: list[list[list[int]]]) -> int:
+        """Return the number of guesses the Guesser needs to fill board under perfect play.
+
+        Preconditions:
+        - solutions is every solution of board consistent with the game so far, and is not empty
+        """
+        return self._value(flatten_board(board), _position(solutions))
+
+    def best_guess(self, board: list[list[int]],
+                   solutions: list[list[list[int]]]) -> tuple[tuple[int, int], int]:
+        """Return a guess that fills board in the fewest guesses under perfect play.
+
+        Preconditions:
+        - solutions is every solution of board consistent with the game so far, and is not empty
+        - board has an empty cell
+        """
+        flat = flatten_board(board)
+        _, k, digit = self._search(flat, _position(solutions))
+        n = len(board)
+        return ((k // n, k % n), digit)
+
+    def best_status(self, board: list[list[int]], solutions: list[list[list[int]]],
+                    guess: tuple[tuple[int, int], int]) -> tuple[list[list[int]], list[list[int]]]:
+        """Return the Adversary's answer to guess that leaves the Guesser the most guesses to make: a consistent
+        solution and the board after the guess is accepted or rejected by it.
+
+        Preconditions:
+        - solutions is every solution of board consistent with the game so far, and is not empty
+        """
+        flat = flatten_board(board)
+        position = _position(solutions)
+        n = len(board)
+        k = guess[0][0] * n + guess[0][1]
+        best, best_outcome = None, None
+        for outcome, solution in _outcomes(flat, position, k, guess[1]):
+            value = self._value(*outcome)
+            if best is None or value > best:
+                best, best_outcome = value, (solution, outcome[0])
+        solution, new_board = best_outcome
+        return unflatten_board(solution), unflatten_board(new_board)
+
+    def _value(self, board: bytes, solutions: tuple[bytes, ...]) -> int:
+        """Return the value of the position, from the tablebase if it is there."""
+        if 0 not in board:
+            return 0
+        key = board + b''.join(solutions)
+        value = self._values.get(key)
+        if value is not None:
+            self.hits += 1
+            self._values.move_to_end(key)
+            return value
+        self.misses += 1
+        value = self._search(board, solutions)[0]
+        self._values[key] = value
+        if len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
+        return value
+
+    def _search(self, board: bytes, solutions: tuple[bytes, ...]) -> tuple[int, int, int]:
+        """Return the value of the position with a best guess (cell index, digit) reaching it."""
+        empty = [k for k, value in enumerate(board) if value == 0]
+        # every accepted guess fills at most two cells, and nothing fills fewer guesses than that
+        lower_bound = (len(empty) + 1) // 2
+        moves = []
+        for k in empty:
+            for digit, support in Counter(s[k] for s in solutions).items():
+                moves.append((support < len(solutions), k, digit))
+        moves.sort()
+
+        best = None
+        for _, k, digit in moves:
+            worst = 0
+            for outcome, _ in _outcomes(board, solutions, k, digit):
+                worst = max(worst, 1 + self._value(*outcome))
+                if best is not None and worst >= best[0]:
+                    break
+            if best is None or worst < best[0]:
+                best = (worst, k, digit)
+                if worst == lower_bound:
+                    break
+        return best
+
+
+def _outcomes(board: bytes, solutions: tuple[bytes, ...], k: int,
+              digit: int) -> Iterator[tuple[tuple[bytes, tuple[bytes, ...]], bytes]]:
+    """Yield every position the Adversary can answer the guess of digit at cell index k with, each with a solution
+    that gives it.
+    """
+    rejected = tuple(s for s in solutions if s[k] != digit)
+    if rejected:
+        yield (board, rejected), rejected[0]
+    accepted = [s for s in solutions if s[k] == digit]
+    if not accepted:
+        return
+    filled = bytearray(board)
+    filled[k] = digit
+    cell = CandidateBoard(unflatten_board(bytes(filled))).lowest_degree_cell()
+    if cell is None:
+        yield (bytes(filled), tuple(accepted)), accepted[0]
+        return
+    r, c = cell
+    reveal = r * isqrt(len(board)) + c
+    by_digit = {}
+    for s in accepted:
+        by_digit.setdefault(s[reveal], []).append(s)
+    for revealed, group in by_digit.items():
+        new_board = bytearray(filled)
+        new_board[reveal] = revealed
+        yield (bytes(new_board), tuple(group)), group[0]
+
+
+def _position(solutions: list[list[list[int]]]) -> tuple[bytes, ...]:
+    """Return the solutions as a sorted tuple of flat byte strings."""
+    return tuple(sorted(flatten_board(s) for s in solutions))
+
+
+endgame = Endgame()
+
+
+def endgame_solutions(game: AdversarialSudoku, threshold: int = ENDGAME_CELLS) -> Optional[list[list[list[int]]]]:
+    """Return every solution consistent with game if it has at most threshold empty cells, otherwise None."""
+    if sum(1 for row in game.current_board for value in row if value == 0) > threshold:
+        return None
+    solutions = game.get_consistent_solutions()
+    if not solutions or not game.solution_pool.exhaustive:
+        return None
+    return solutions
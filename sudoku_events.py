@@ -0,0 +1,171 @@
+"""Structured events of Adversarial Sudoku games, and the sinks that consume them.
+
+A game run by `main_without_visualization.iter_game` is a stream of GameEvents:
+    - 'start': the puzzle is set; data has the board, n and max_guesses
+    - 'guess': the Guesser moved; data has the cell, the value and the seconds the Guesser took
+    - 'status': the Adversary answered; data has whether the guess was accepted, the new board and the seconds the
+      Adversary took
+    - 'end': the game is over; data has the winner and the number of rounds
+`run_game` and `run_games` send the stream to an EventSink instead of printing it. The default NullSink drops every
+event, so batches of games produce no terminal output; MemorySink keeps the events, JsonlSink writes them to a
+file one JSON object per line through a buffer, CallbackSink hands them to a function and PrintSink prints the
+round-by-round report.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Optional, TextIO
+
+
+class GameEvent:
+    """
+    One event of a game.
+
+    Instance Attributes:
+    - kind: 'start', 'guess', 'status' or 'end'
+    - game: the number of the game in its batch, 0 for a single game
+    - round: the number of guesses made so far
+    - time: the seconds since the game started
+    - data: the fields of the event, as described in the module docstring
+    """
+    __slots__ = ('kind', 'game', 'round', 'time', 'data')
+    kind: str
+    game: int
+    round: int
+    time: float
+    data: dict[str, Any]
+
+    def __init__(self, kind: str, game: int, round_: int, time: float, data: dict[str, Any]) -> None:
+        """Initialize a new event."""
+        self.kind = kind
+        self.game = game
+        self.round = round_
+        self.time = time
+        self.data = data
+
+    def __repr__(self) -> str:
+        return f'GameEvent({self.kind!r}, game={self.game}, round={self.round})'
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the event as a JSON-serializable dict."""
+        return {'event': self.kind, 'game': self.game, 'round': self.round, 'time': round(self.time, 6), **self.data}
+
+
+class EventSink:
+    """A consumer of game events.
+
+    This is an abstract class; use one of its subclasses.
+    """
+
+    def emit(self, event: GameEvent) -> None:
+        """Consume one event."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release what the sink holds once no more events will be emitted."""
+
+    def __enter__(self) -> EventSink:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class NullSink(EventSink):
+    """A sink that drops every event."""
+
+    def emit(self, event: GameEvent) -> None:
+        """Drop the event."""
+
+
+class MemorySink(EventSink):
+    """
+    A sink that keeps every event in a list.
+
+    Instance Attributes:
+    - events: the events emitted so far, in order
+    """
+    events: list[GameEvent]
+
+    def __init__(self) -> None:
+        """Initialize an empty sink."""
+        self.events = []
+
+    def emit(self, event: GameEvent) -> None:
+        """Keep the event."""
+        self.events.append(event)
+
+
+class CallbackSink(EventSink):
+    """A sink that calls a function with every event."""
+    _callback: Callable[[GameEvent], object]
+
+    def __init__(self, callback: Callable[[GameEvent], object]) -> None:
+        """Initialize a sink calling callback."""
+        self._callback = callback
+
+    def emit(self, event: GameEvent) -> None:
+        """Call the callback with the event."""
+        self._callback(event)
+
+
+class JsonlSink(EventSink):
+    """
+    A sink that writes every event to a text file as one line of JSON, buffering buffer_size lines between writes.
+
+    Instance Attributes:
+    - buffer_size: the number of lines buffered before they are written
+    """
+    buffer_size: int
+    _file: TextIO
+    _owns_file: bool
+    _buffer: list[str]
+
+    def __init__(self, file: str | TextIO, buffer_size: int = 256) -> None:
+        """Initialize a sink writing to file, a path opened for appending or an open text file."""
+        self.buffer_size = buffer_size
+        self._owns_file = isinstance(file, str)
+        self._file = open(file, 'a') if isinstance(file, str) else file
+        self._buffer = []
+
+    def emit(self, event: GameEvent) -> None:
+        """Buffer the event, writing the buffer out when it is full."""
+        self._buffer.append(json.dumps(event.as_dict(), separators=(',', ':')))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered events."""
+        if self._buffer:
+            self._file.write('\n'.join(self._buffer) + '\n')
+            self._buffer.clear()
+        self._file.flush()
+
+    def close(self) -> None:
+        """Write the buffered events, and close the file if the sink opened it."""
+        self.flush()
+        if self._owns_file:
+            self._file.close()
+
+
+class PrintSink(EventSink):
+    """A sink that prints the puzzle, whether each guess was correct and the winner, as games used to."""
+
+    def emit(self, event: GameEvent) -> None:
+        """Print the event."""
+        if event.kind == 'start':
+            board = event.data['board']
+            num_size = len(str(len(board)))
+            for row in board:
+                print(*(f"{n or '.':{num_size}} " for n in row))
+        elif event.kind == 'status':
+            print(f'round{event.round}')
+            print('Guess Correctly' if event.data['accepted'] else 'Fail to guess the correct number')
+        elif event.kind == 'end':
+            print(f'Game Winner: {event.data["winner"]}')
+
+
+def read_events(file: TextIO, kind: Optional[str] = None) -> list[dict[str, Any]]:
+    """Return the events written to file by a JsonlSink, as dicts, keeping only those of the given kind if any."""
+    events = (json.loads(line) for line in file if line.strip())
+    return [event for event in events if kind is None or event['event'] == kind]
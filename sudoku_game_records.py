@@ -0,0 +1,345 @@
+"""A compact binary file format for the records of played Adversarial Sudoku games.
+
+A GameRecord holds everything needed to replay a game without simulating it again: the initial puzzle, every guess,
+whether the Adversary accepted it and which cell it revealed, the solution the Adversary answered with, and the winner.
+`GameRecordWriter` appends records to a file as games finish, and `GameRecordFile` opens the file with `mmap` to
+iterate over the records or read any one of them.
+
+File layout (little-endian):
+    - header: magic b'SUDOKUGR', version (uint16), n (uint16)
+    - records, one after another:
+        RECORD_HEAD: record size in bytes (uint32, this field included), max guesses (uint16), rounds (uint16),
+            solution count (uint16), winner (uint8: 0 for none, 1 for the Guesser, 2 for the Adversary)
+        puzzle (n * n bytes, row-major, 0 for empty)
+        solutions (solution count * n * n bytes): the distinct solutions the Adversary answered with
+        rounds * MOVE: guessed row, column and digit, accepted flag, revealed row, column and digit (NO_CELL for
+            the row and column when no cell was revealed), solution ID (uint16, an index into the solutions)
+
+Records have different sizes, so GameRecordFile finds them by following the record sizes from the start of the file,
+remembering their offsets as it goes. A record cut short, for example by a simulation stopped while writing, ends the
+file. The records appended after a GameRecordFile was opened are not seen by it.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from array import array
+from typing import BinaryIO, Iterator, Optional
+
+from adversarial_sudoku import AdversarialSudoku, copy_board
+
+MAGIC = b'SUDOKUGR'
+VERSION = 1
+HEADER = struct.Struct('<8sHH')
+RECORD_HEAD = struct.Struct('<IHHHB')
+MOVE = struct.Struct('<7BH')
+NO_CELL = 255
+WINNERS = (None, 'Guesser', 'Adversary')
+
+
+class GameRecord:
+    """
+    The record of one game.
+
+    Instance Attributes:
+    - puzzle: the board the game started from, 0 for empty cells
+    - max_guesses: the most guesses the Guesser was allowed
+    - guesses: the Guesser's moves, in order
+    - accepted: whether each guess was accepted
+    - reveals: the (cell, digit) the Adversary revealed after each guess, or None
+    - solution_ids: the index in solutions of the solution the Adversary answered each guess with
+    - solutions: the distinct solutions the Adversary answered with
+    - winner: 'Guesser', 'Adversary', or None if the game was not over
+
+    Representation Invariants:
+    - len(self.guesses) == len(self.accepted) == len(self.reveals) == len(self.solution_ids)
+    - all(0 <= i < len(self.solutions) for i in self.solution_ids)
+    """
+    __slots__ = ('puzzle', 'max_guesses', 'guesses', 'accepted', 'reveals', 'solution_ids', 'solutions', 'winner')
+    puzzle: list[list[int]]
+    max_guesses: int
+    guesses: list[tuple[tuple[int, int], int]]
+    accepted: list[bool]
+    reveals: list[Optional[tuple[tuple[int, int], int]]]
+    solution_ids: list[int]
+    solutions: list[list[list[int]]]
+    winner: Optional[str]
+
+    def __init__(self, puzzle: list[list[int]], max_guesses: int, guesses: list[tuple[tuple[int, int], int]],
+                 accepted: list[bool], reveals: list[Optional[tuple[tuple[int, int], int]]],
+                 solution_ids: list[int], solutions: list[list[list[int]]], winner: Optional[str]) -> None:
+        """Initialize a new record."""
+        self.puzzle = puzzle
+        self.max_guesses = max_guesses
+        self.guesses = guesses
+        self.accepted = accepted
+        self.reveals = reveals
+        self.solution_ids = solution_ids
+        self.solutions = solutions
+        self.winner = winner
+
+    @classmethod
+    def from_game(cls, game: AdversarialSudoku) -> GameRecord:
+        """Return the record of game, whose Adversary has answered every guess so far.
+
+        Raises:
+            - ValueError: if a status fills cells other than the guessed cell and one revealed cell
+        """
+        board = game.initial_board
+        accepted, reveals, solution_ids, solutions, index = [], [], [], [], {}
+        for ((r, c), value), (solution, new_board) in zip(game.guesses, game.statuses):
+            changed = [(i, j) for i, row in enumerate(new_board) for j, d in enumerate(row)
+                       if d != board[i][j] and (i, j) != (r, c)]
+            if len(changed) > 1:
+                raise ValueError('A status may reveal at most one cell besides the guessed one.')
+            accepted.append(new_board[r][c] == value)
+            reveals.append((changed[0], new_board[changed[0][0]][changed[0][1]]) if changed else None)
+            key = bytes(d for row in solution for d in row)
+            if key not in index:
+                index[key] = len(solutions)
+                solutions.append(copy_board(solution))
+            solution_ids.append(index[key])
+            board = new_board
+        return cls(copy_board(game.initial_board), game.max_guesses, list(game.guesses[:len(game.statuses)]),
+                   accepted, reveals, solution_ids, solutions, game.get_winner())
+
+    def boards(self) -> Iterator[list[list[int]]]:
+        """Yield the board after every round, starting with the puzzle."""
+        board = copy_board(self.puzzle)
+        yield copy_board(board)
+        for ((r, c), value), accepted, reveal in zip(self.guesses, self.accepted, self.reveals):
+            if accepted:
+                board[r][c] = value
+            if reveal is not None:
+                (i, j), digit = reveal
+                board[i][j] = digit
+            yield copy_board(board)
+
+    def statuses(self) -> list[tuple[list[list[int]], list[list[int]]]]:
+        """Return the Adversary's statuses as AdversarialSudoku.statuses holds them."""
+        boards = self.boards()
+        next(boards)
+        return [(self.solutions[i], board) for i, board in zip(self.solution_ids, boards)]
+
+    def to_game(self, rounds: Optional[int] = None) -> AdversarialSudoku:
+        """Return the game in the state it was recorded in, or after its first rounds rounds if rounds is given."""
+        game = AdversarialSudoku.__new__(AdversarialSudoku)
+        game.max_guesses = self.max_guesses
+        game.guesses = list(self.guesses[:rounds])
+        game.statuses = self.statuses()[:rounds]
+        game.initial_board = copy_board(self.puzzle)
+        game.current_board = copy_board(game.statuses[-1][1]) if game.statuses else copy_board(self.puzzle)
+        game.solution_pool = None
+        return game
+
+    def to_bytes(self) -> bytes:
+        """Return the record as stored in a file."""
+        cells = bytes(d for row in self.puzzle for d in row)
+        cells += b''.join(bytes(d for row in s for d in row) for s in self.solutions)
+        moves = []
+        for ((r, c), value), accepted, reveal, solution_id in zip(self.guesses, self.accepted, self.reveals,
+                                                                  self.solution_ids):
+            (i, j), digit = reveal if reveal is not None else ((NO_CELL, NO_CELL), 0)
+            moves.append(MOVE.pack(r, c, value, accepted, i, j, digit, solution_id))
+        body = cells + b''.join(moves)
+        return RECORD_HEAD.pack(RECORD_HEAD.size + len(body), self.max_guesses, len(self.guesses),
+                                len(self.solutions), WINNERS.index(self.winner)) + body
+
+    @classmethod
+    def from_bytes(cls, data: bytes, n: int) -> GameRecord:
+        """Return the record stored in data for boards of length n."""
+        _, max_guesses, rounds, solution_count, winner = RECORD_HEAD.unpack_from(data, 0)
+        cells = n * n
+        offset = RECORD_HEAD.size
+        boards = [_unflatten(data[offset + k * cells:offset + (k + 1) * cells], n)
+                  for k in range(1 + solution_count)]
+        offset += (1 + solution_count) * cells
+        guesses, accepted, reveals, solution_ids = [], [], [], []
+        for r, c, value, was_accepted, i, j, digit, solution_id in MOVE.iter_unpack(
+                data[offset:offset + rounds * MOVE.size]):
+            guesses.append(((r, c), value))
+            accepted.append(bool(was_accepted))
+            reveals.append(None if i == NO_CELL else ((i, j), digit))
+            solution_ids.append(solution_id)
+        return cls(boards[0], max_guesses, guesses, accepted, reveals, solution_ids, boards[1:], WINNERS[winner])
+
+
+class GameRecordWriter:
+    """
+    Appends game records to a file, creating it with its header if it does not exist.
+
+    Instance Attributes:
+    - path: the record file
+    - n: the board length of every game in the file
+    - written: the number of records written by this writer
+    """
+    path: str
+    n: int
+    written: int
+    _file: Optional[BinaryIO]
+
+    def __init__(self, path: str, n: int = 9) -> None:
+        """Open the record file at path for appending.
+
+        Raises:
+            - ValueError: if path exists but is not a record file of version VERSION for boards of length n
+        """
+        self.path = path
+        self.n = n
+        self.written = 0
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, n))
+        else:
+            with open(path, 'rb') as file:
+                header = file.read(HEADER.size)
+            if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION, n):
+                self.close()
+                raise ValueError(f'{path} is not a game record file of version {VERSION} for {n}x{n} boards.')
+
+    def write(self, record: GameRecord | AdversarialSudoku) -> None:
+        """Append the record, or the record of a game."""
+        if isinstance(record, AdversarialSudoku):
+            record = GameRecord.from_game(record)
+        if len(record.puzzle) != self.n:
+            raise ValueError(f'A {len(record.puzzle)}x{len(record.puzzle)} game cannot go in a file of '
+                             f'{self.n}x{self.n} games.')
+        self._file.write(record.to_bytes())
+        self.written += 1
+
+    def flush(self) -> None:
+        """Write the buffered records to the file."""
+        self._file.flush()
+
+    def tell(self) -> int:
+        """Write the buffered records to the file and return its size in bytes."""
+        self._file.flush()
+        return self._file.tell()
+
+    def truncate(self, size: int) -> None:
+        """Cut the file back to size bytes, a size returned by tell, dropping the records appended since.
+
+        Raises:
+            - ValueError: if size would cut off the header
+        """
+        if size < HEADER.size:
+            raise ValueError('A game record file cannot be cut inside its header.')
+        self._file.flush()
+        self._file.truncate(size)
+        self._file.seek(size)
+
+    def close(self) -> None:
+        """Flush and close the file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> GameRecordWriter:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+class GameRecordFile:
+    """
+    A read-only, memory-mapped view of a game record file.
+
+    Instance Attributes:
+    - path: the record file
+    - n: the board length of every game in the file
+    """
+    path: str
+    n: int
+    _file: Optional[BinaryIO]
+    _map: Optional[mmap.mmap]
+    _offsets: array
+    _scanned: int
+    _end: bool
+
+    def __init__(self, path: str) -> None:
+        """Open the record file at path.
+
+        Raises:
+            - ValueError: if path is not a game record file of a supported version
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = None
+        if os.fstat(self._file.fileno()).st_size < HEADER.size:
+            self.close()
+            raise ValueError(f'{path} is not a game record file.')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a game record file of version {VERSION}.')
+        self.n = n
+        self._offsets = array('q')
+        self._scanned = HEADER.size
+        self._end = False
+
+    def __len__(self) -> int:
+        """Return the number of records in the file."""
+        while self._scan():
+            pass
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> GameRecord:
+        """Return the record at the given index."""
+        if index < 0:
+            index += len(self)
+        while index >= len(self._offsets) and self._scan():
+            pass
+        if not 0 <= index < len(self._offsets):
+            raise IndexError('game record index out of range')
+        return self._read(self._offsets[index])
+
+    def __iter__(self) -> Iterator[GameRecord]:
+        """Yield every record of the file in order."""
+        index = 0
+        while index < len(self._offsets) or self._scan():
+            yield self._read(self._offsets[index])
+            index += 1
+
+    def __enter__(self) -> GameRecordFile:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Release the memory map and the file."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _scan(self) -> bool:
+        """Find the offset of the next record, and return whether there was one."""
+        if self._end:
+            return False
+        offset = self._scanned
+        if offset + RECORD_HEAD.size > len(self._map):
+            self._end = True
+            return False
+        size = RECORD_HEAD.unpack_from(self._map, offset)[0]
+        if size < RECORD_HEAD.size or offset + size > len(self._map):
+            self._end = True
+            return False
+        self._offsets.append(offset)
+        self._scanned = offset + size
+        return True
+
+    def _read(self, offset: int) -> GameRecord:
+        """Return the record starting at offset."""
+        size = RECORD_HEAD.unpack_from(self._map, offset)[0]
+        return GameRecord.from_bytes(self._map[offset:offset + size], self.n)
+
+
+def _unflatten(flat: bytes, n: int) -> list[list[int]]:
+    """Return the n by n board encoded row-major in flat."""
+    return [list(flat[r * n:(r + 1) * n]) for r in range(n)]
@@ -4,121 +4,766 @@ This file contains a generation function and corresponding helper functions to g
 current sudoku board
 """
 from __future__ import annotations
-from typing import Optional
-from math import sqrt
+import os
+import sys
+import weakref
+from array import array
+from concurrent.futures import Executor
+from typing import Iterator, Optional
+from math import isnan, isqrt, sqrt
 # from python_ta.contracts import check_contracts
 
-import sudoku_setup as setup
+import numpy as np
+
 from adversarial_sudoku import copy_board
+from sudoku_candidates import CandidateBoard
+from sudoku_shared import SharedTable, TableHandle, attach
+from sudoku_solution_pool import solution_histogram, solution_table
+from sudoku_symmetry import solution_cache
 
 MAX_STEP = 81
+NAN = float('nan')
+
+
+class GameTreeStore:
+    """
+    Parallel-array storage for the nodes of a game tree.
+
+    Every node is an index into the arrays below, so a node costs a few machine words instead of a Python object with
+    an instance dict, a subtree list and two nested board copies. Children are linked through first_child/next_sibling,
+    which keeps counting and aggregation as plain passes over the arrays.
+
+    Nodes of a lazy tree are expanded on first access: a generator in _expanders materializes their children one at a
+    time, and their probabilities stay NaN until they are requested. Each child is built from its share of the parent's
+    scores (guesser_share, adversary_share) and later resolved against the mean over its own subtrees.
+
+    The root of a store may have a parent in another store. That link is weak, so keeping a tree alive never keeps the
+    trees of earlier turns alive. When max_bytes is set, the subtrees of a node are released as soon as its
+    probabilities are cached and the store is over budget. The array slots of released nodes go on a free list and
+    are reused by the next nodes added, so the arrays only grow to the most nodes live at once; GameTree.detach
+    copies a subtree into arrays of exactly its size. A GameTree of a released node must not be used.
+
+    Representation Invariants:
+    - all arrays have the same length, equal to len(self)
+    - parents[i] == -1 or parents[i] < len(self)
+    - every index in _free is a released node, linked from no live node
+    - solution_ids[i] == -1 or solution_ids[i] < len(self.solutions)
+    """
+    parents: array
+    first_child: array
+    last_child: array
+    next_sibling: array
+    move_rows: array
+    move_cols: array
+    move_values: array
+    solution_ids: array
+    guesser_win: array
+    adversary_lose: array
+    guesser_share: array
+    adversary_share: array
+    layers: array
+    expanded: array
+    boards: list[bytes]
+    solutions: list[list[list[int]]]
+    _solution_index: dict[bytes, int]
+    _expanders: dict[int, Iterator[int]]
+    _inherited: dict[int, tuple[np.ndarray, tuple[tuple[int, int, int], ...]]]
+    _free: list[int]
+    root_parent: Optional[weakref.ref]
+    root_parent_index: int
+    max_bytes: Optional[int]
+    _object_bytes: int
+
+    def __init__(self) -> None:
+        """Initialize an empty store."""
+        self.parents = array('l')
+        self.first_child = array('l')
+        self.last_child = array('l')
+        self.next_sibling = array('l')
+        self.move_rows = array('l')
+        self.move_cols = array('l')
+        self.move_values = array('l')
+        self.solution_ids = array('l')
+        self.guesser_win = array('d')
+        self.adversary_lose = array('d')
+        self.guesser_share = array('d')
+        self.adversary_share = array('d')
+        self.layers = array('l')
+        self.expanded = array('b')
+        self.boards = []
+        self.solutions = []
+        self._solution_index = {}
+        self._expanders = {}
+        self._inherited = {}
+        self._free = []
+        self.root_parent = None
+        self.root_parent_index = -1
+        self.max_bytes = None
+        self._object_bytes = 0
+
+    def __len__(self) -> int:
+        """Return the number of node slots of this store, live or free."""
+        return len(self.parents)
+
+    def memory_usage(self) -> int:
+        """Return the approximate number of bytes held by this store: the array slots of the live nodes, the live
+        boards and the interned solutions.
+        """
+        return self.node_bytes() * (len(self.parents) - len(self._free)) + self._object_bytes
+
+    def array_bytes(self) -> int:
+        """Return the number of bytes allocated to the node arrays, free slots included."""
+        return self.node_bytes() * len(self.parents)
+
+    def node_bytes(self) -> int:
+        """Return the number of bytes a node takes in the node arrays."""
+        return sum(a.itemsize for a in (
+            self.parents, self.first_child, self.last_child, self.next_sibling, self.move_rows, self.move_cols,
+            self.move_values, self.solution_ids, self.guesser_win, self.adversary_lose, self.guesser_share,
+            self.adversary_share, self.layers, self.expanded))
+
+    def is_over_budget(self) -> bool:
+        """Return whether this store holds more than max_bytes."""
+        return self.max_bytes is not None and self.memory_usage() > self.max_bytes
+
+    def add_node(self, board: list[list[int]], parent: int = -1,
+                 move: Optional[tuple[tuple[int, int], int]] = None,
+                 solution: Optional[list[list[int]]] = None, layer: int = -1) -> int:
+        """Add a new unlinked node, in a free slot if there is one, and return its index.
+
+        A node added with layer >= 0 is lazy: it is expanded to that many more layers on first access.
+        """
+        if self._free:
+            index = self._free.pop()
+            self._object_bytes -= sys.getsizeof(self.boards[index])
+        else:
+            index = len(self.parents)
+            for a in (self.parents, self.first_child, self.last_child, self.next_sibling, self.move_rows,
+                      self.move_cols, self.move_values, self.solution_ids, self.guesser_win, self.adversary_lose,
+                      self.guesser_share, self.adversary_share, self.layers, self.expanded):
+                a.append(0)
+            self.boards.append(b'')
+        self.parents[index] = parent
+        self.first_child[index] = -1
+        self.last_child[index] = -1
+        self.next_sibling[index] = -1
+        if move is None:
+            self.move_rows[index] = self.move_cols[index] = self.move_values[index] = -1
+        else:
+            self.move_rows[index] = move[0][0]
+            self.move_cols[index] = move[0][1]
+            self.move_values[index] = move[1]
+        self.solution_ids[index] = -1 if solution is None else self.intern_solution(solution)
+        self.guesser_win[index] = -1.0
+        self.adversary_lose[index] = 2.0
+        self.guesser_share[index] = NAN
+        self.adversary_share[index] = NAN
+        self.layers[index] = max(layer, 0)
+        self.expanded[index] = layer < 0
+        flat = flatten_board(board)
+        self.boards[index] = flat
+        self._object_bytes += sys.getsizeof(flat)
+        return index
+
+    def intern_solution(self, solution: list[list[int]]) -> int:
+        """Return the solution ID of the given solution, storing it once if it is new."""
+        key = flatten_board(solution)
+        solution_id = self._solution_index.get(key)
+        if solution_id is None:
+            solution_id = len(self.solutions)
+            self.solutions.append(solution)
+            self._solution_index[key] = solution_id
+            self._object_bytes += sys.getsizeof(solution) + sum(sys.getsizeof(row) for row in solution)
+        return solution_id
+
+    def intern_row(self, row: np.ndarray) -> int:
+        """Return the solution ID of a flattened uint8 solution, storing it once if it is new."""
+        key = row.tobytes()
+        solution_id = self._solution_index.get(key)
+        if solution_id is None:
+            n = isqrt(len(key))
+            solution_id = self.intern_solution([list(key[r * n:(r + 1) * n]) for r in range(n)])
+        return solution_id
+
+    def link(self, parent: int, child: int) -> None:
+        """Append the node child to the subtrees of the node parent."""
+        if self.first_child[parent] == -1:
+            self.first_child[parent] = child
+        else:
+            self.next_sibling[self.last_child[parent]] = child
+        self.last_child[parent] = child
+
+    def children(self, index: int) -> list[int]:
+        """Return the indices of the subtrees of the given node, in insertion order."""
+        return list(self.iter_children(index))
+
+    def iter_children(self, index: int) -> Iterator[int]:
+        """Yield the indices of the subtrees of the given node, materializing lazy children only as they are reached.
+        """
+        prev = -1
+        while True:
+            child = self.first_child[index] if prev == -1 else self.next_sibling[prev]
+            if child == -1:
+                child = self._advance(index)
+                if child == -1:
+                    return
+            yield child
+            prev = child
+
+    def _advance(self, index: int) -> int:
+        """Materialize the next child of a lazy node and return its index, or -1 if it has no more children."""
+        expander = self._expanders.get(index)
+        if expander is None:
+            if self.expanded[index]:
+                return -1
+            self.expanded[index] = True
+            if self.layers[index] == 0:
+                return -1
+            expander = self._expanders[index] = self._expand(index)
+        child = next(expander, -1)
+        if child == -1:
+            del self._expanders[index]
+        return child
+
+    def _expand(self, index: int) -> Iterator[int]:
+        """Yield the children of a lazy node one at a time, in the order generate_gametree builds them.
+
+        The candidate solutions are inherited from the parent as a solution table and filtered by the two cells filled
+        since, so only the root of a lazy tree calls the solver.
+        """
+        board = unflatten_board(self.boards[index])
+        n = len(board)
+        candidates = CandidateBoard(board)
+        moves = candidates.moves(5)
+        reveals = _reveal_cells(candidates, moves)
+        inherited = self._inherited.pop(index, None)
+        if inherited is None:
+            table = solution_table(solution_cache.find_multiple_solutions(board), n)
+        else:
+            table, filled = inherited
+            if filled:
+                cells = [r * n + c for r, c, _ in filled]
+                table = table[np.all(table[:, cells] == np.array([v for _, _, v in filled], dtype=np.uint8), axis=1)]
+
+        score_solution, score_move, matches = _score_moves(table, moves, n)
+        total = len(matches)
+
+        for i, j in matches:
+            (r, c), value = moves[j]
+            new_board = copy_board(board)
+            new_board[r][c] = value
+            filled = ((r, c, value),)
+            coord = reveals[j]
+            if coord is not None:
+                revealed = int(table[i, coord[0] * n + coord[1]])
+                new_board[coord[0]][coord[1]] = revealed
+                filled += ((coord[0], coord[1], revealed),)
+            child = self.add_node(new_board, index, moves[j], None, self.layers[index] - 1)
+            self.solution_ids[child] = self.intern_row(table[i])
+            self.guesser_win[child] = NAN
+            self.adversary_lose[child] = NAN
+            self.guesser_share[child] = score_move[j] / total
+            self.adversary_share[child] = score_solution[i] / total
+            self._inherited[child] = (table, filled)
+            self.link(index, child)
+            yield child
+
+    def resolve_probabilities(self, index: int) -> None:
+        """Compute and cache the probabilities of a lazy node, expanding its subtrees as far as needed.
+
+        The subtrees are resolved in post-order from an explicit stack of child iterators rather than by recursion:
+        a node is resolved, and its subtrees released if over budget, once every child has been.
+        """
+        if not isnan(self.guesser_win[index]):
+            return
+        stack = [(index, self.iter_children(index))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, -1)
+            if child != -1:
+                if isnan(self.guesser_win[child]):
+                    stack.append((child, self.iter_children(child)))
+                continue
+            stack.pop()
+            means = self.child_probability_means(node)
+            ave_sol, ave_move = (1, 1) if means is None else means
+            self.adversary_lose[node] = self.adversary_share[node] * ave_sol
+            self.guesser_win[node] = self.guesser_share[node] * ave_move
+            if self.is_over_budget():
+                self.release_subtrees(node)
+
+    def resolve_children(self, index: int, executor: Executor, jobs: Optional[int] = None) -> None:
+        """Compute and cache the probabilities of the subtrees of a lazy node on executor, with the values
+        resolve_probabilities gives them, then those of the node.
+
+        Every subtree still to be expanded is resolved in a worker from its board and the two cells filled since the
+        node. The solution table those subtrees filter is copied to the workers once through shared memory (see
+        `sudoku_shared`), so a task is a few bytes and sends back only two probabilities. The subtrees are left
+        unexpanded here, and are expanded again only if they are accessed.
+
+        Variables:
+            - jobs: the number of tasks the subtrees are split into, or None for one per CPU
+        """
+        groups = {}
+        for child in self.iter_children(index):
+            if isnan(self.guesser_win[child]) and not self.expanded[child] and child in self._inherited:
+                table = self._inherited[child][0]
+                groups.setdefault(id(table), (table, []))[1].append(child)
+        jobs = jobs or os.cpu_count() or 1
+        for table, children in groups.values():
+            with SharedTable(table) as shared:
+                tasks = [(self.boards[child], self._inherited[child][1], self.layers[child], self.guesser_share[child],
+                          self.adversary_share[child]) for child in children]
+                size = -(-len(tasks) // jobs)
+                futures = [executor.submit(_resolve_shared, shared.handle, tasks[i:i + size], self.max_bytes)
+                           for i in range(0, len(tasks), size)]
+                results = [value for future in futures for value in future.result()]
+            for child, (guesser_win, adversary_lose) in zip(children, results):
+                self.guesser_win[child] = guesser_win
+                self.adversary_lose[child] = adversary_lose
+        self.resolve_probabilities(index)
+
+    def release_subtrees(self, index: int) -> None:
+        """Unlink every subtree of the given node, drop the boards and pending expansions they hold and free their
+        array slots for reuse.
+
+        The node keeps its cached probabilities and is never expanded again.
+        """
+        stack = self.children(index)
+        while stack:
+            node = stack.pop()
+            child = self.first_child[node]
+            while child != -1:
+                stack.append(child)
+                child = self.next_sibling[child]
+            self._object_bytes -= sys.getsizeof(self.boards[node]) - sys.getsizeof(b'')
+            self.boards[node] = b''
+            self._expanders.pop(node, None)
+            self._inherited.pop(node, None)
+            self._free.append(node)
+        self._expanders.pop(index, None)
+        self.first_child[index] = -1
+        self.last_child[index] = -1
+        self.expanded[index] = True
+
+    def subtree_size(self, index: int) -> int:
+        """Return the number of nodes in the tree rooted at the given node."""
+        count = 0
+        stack = [index]
+        while stack:
+            node = stack.pop()
+            count += 1
+            child = self.first_child[node]
+            while child != -1:
+                stack.append(child)
+                child = self.next_sibling[child]
+        return count
+
+    def child_probability_means(self, index: int) -> Optional[tuple[float, float]]:
+        """Return the mean adversary_lose and guesser_win probabilities over the subtrees of the given node.
+
+        Return None if the node has no subtrees.
+        """
+        total_sol, total_move, count = 0.0, 0.0, 0
+        child = self.first_child[index]
+        while child != -1:
+            total_sol += self.adversary_lose[child]
+            total_move += self.guesser_win[child]
+            count += 1
+            child = self.next_sibling[child]
+        if count == 0:
+            return None
+        return (total_sol / count, total_move / count)
 
 
-# @check_contracts
 class GameTree:
     """
     The gametree for the sudoku algorithm
 
+    A GameTree is a lightweight view of one node in a GameTreeStore; all of its fields live in the store.
+
     Representation Invariants:
     - parent is None or self in self.parent.subtrees
     """
-    move: Optional[tuple[tuple[int, int], int]]
-    prev_solution: Optional[list[list[int]]]
-    parent: Optional[GameTree]
-    guesser_win_probability: float = -1.0
-    adversary_lose_probability: float = 2
-    subtrees: list[GameTree]
-    current_board: list[list[int]]
+    __slots__ = ('_store', '_index')
+    _store: GameTreeStore
+    _index: int
 
     def __init__(self, board: list[list[int]],
                  parent: GameTree = None,
                  move: tuple[tuple[int, int], int] = None,
                  solution: list[list[int]] = None) -> None:
         """Initialize a new GameTree"""
-        self.subtrees = []
-        self.parent = parent
-        self.move = move
-        self.prev_solution = solution
-        self.current_board = copy_board(board)
+        if parent is None:
+            self._store = GameTreeStore()
+            self._index = self._store.add_node(board, -1, move, solution)
+        else:
+            self._store = parent._store
+            self._index = self._store.add_node(board, parent._index, move, solution)
+
+    @classmethod
+    def new_root(cls, board: list[list[int]], parent: Optional[GameTree] = None,
+                 move: Optional[tuple[tuple[int, int], int]] = None,
+                 solution: Optional[list[list[int]]] = None) -> GameTree:
+        """Return a new tree in its own store whose root is weakly linked to parent."""
+        tree = cls(board, None, move, solution)
+        if parent is not None:
+            tree._store.root_parent = weakref.ref(parent._store)
+            tree._store.root_parent_index = parent._index
+        return tree
+
+    @classmethod
+    def _view(cls, store: GameTreeStore, index: int) -> GameTree:
+        """Return the view of an existing node of store."""
+        tree = cls.__new__(cls)
+        tree._store = store
+        tree._index = index
+        return tree
+
+    def __eq__(self, other: object) -> bool:
+        """Return whether other views the same node as self."""
+        return isinstance(other, GameTree) and self._store is other._store and self._index == other._index
+
+    def __hash__(self) -> int:
+        """Return a hash of the node viewed by self."""
+        return hash((id(self._store), self._index))
+
+    @property
+    def move(self) -> Optional[tuple[tuple[int, int], int]]:
+        """The guess that led to this node."""
+        store, i = self._store, self._index
+        if store.move_values[i] == -1:
+            return None
+        return ((store.move_rows[i], store.move_cols[i]), store.move_values[i])
+
+    @property
+    def solution_id(self) -> int:
+        """The ID of prev_solution in the store, or -1 if there is none."""
+        return self._store.solution_ids[self._index]
+
+    @property
+    def prev_solution(self) -> Optional[list[list[int]]]:
+        """The solution the adversary chose to reach this node."""
+        solution_id = self._store.solution_ids[self._index]
+        return None if solution_id == -1 else self._store.solutions[solution_id]
+
+    @property
+    def parent(self) -> Optional[GameTree]:
+        """The parent of this node, or None for a root whose parent is gone or was never set."""
+        store = self._store
+        parent = store.parents[self._index]
+        if parent != -1:
+            return GameTree._view(store, parent)
+        parent_store = store.root_parent() if store.root_parent is not None and self._index == 0 else None
+        return None if parent_store is None else GameTree._view(parent_store, store.root_parent_index)
+
+    @property
+    def guesser_win_probability(self) -> float:
+        """The estimated probability that the guesser wins after this move."""
+        self._store.resolve_probabilities(self._index)
+        return self._store.guesser_win[self._index]
+
+    @guesser_win_probability.setter
+    def guesser_win_probability(self, value: float) -> None:
+        self._store.guesser_win[self._index] = value
+
+    @property
+    def adversary_lose_probability(self) -> float:
+        """The estimated probability that the adversary loses after choosing this solution."""
+        self._store.resolve_probabilities(self._index)
+        return self._store.adversary_lose[self._index]
+
+    @adversary_lose_probability.setter
+    def adversary_lose_probability(self, value: float) -> None:
+        self._store.adversary_lose[self._index] = value
+
+    @property
+    def current_board(self) -> list[list[int]]:
+        """The board at this node."""
+        return unflatten_board(self._store.boards[self._index])
+
+    @property
+    def subtrees(self) -> list[GameTree]:
+        """The subtrees of this node."""
+        return [GameTree._view(self._store, child) for child in self._store.children(self._index)]
 
     def get_subtrees(self) -> list[GameTree]:
         """Return the subtrees of this game tree."""
         return self.subtrees
 
+    def add_subtree(self, subtree: GameTree) -> None:
+        """Add subtree as the last subtree of this node.
+
+        Preconditions:
+        - subtree was created with self as its parent
+        """
+        self._store.link(self._index, subtree._index)
+
+    def iter_subtrees(self) -> Iterator[GameTree]:
+        """Yield the subtrees of this game tree; in a lazy tree each one is built only when it is reached."""
+        for child in self._store.iter_children(self._index):
+            yield GameTree._view(self._store, child)
+
+    def resolve_subtrees(self, executor: Executor, jobs: Optional[int] = None) -> None:
+        """Compute the probabilities of the subtrees of this lazy tree across the worker processes of executor.
+
+        See GameTreeStore.resolve_children.
+        """
+        self._store.resolve_children(self._index, executor, jobs)
+
     def __len__(self) -> int:
-        """Return the number of items in this tree."""
-        # Note: no "empty tree" base case is necessary here.
-        # Instead, the only implicit base case is when there are no subtrees (sum returns 0).
-        return 1 + sum(subtree.__len__() for subtree in self.subtrees)
+        """Return the number of items in this tree.
+
+        For a lazy tree, only the nodes materialized so far are counted.
+        """
+        return self._store.subtree_size(self._index)
+
+    def memory_usage(self) -> int:
+        """Return the approximate number of bytes held by the store of this tree."""
+        return self._store.memory_usage()
+
+    def detach(self, max_bytes: Optional[int] = None) -> GameTree:
+        """Return a copy of this subtree in a new, compact store, weakly linked to the parent of this node.
+
+        Siblings and ancestors are not copied, so once the caller drops the old tree its memory is released.
+        Nodes are copied breadth-first; when max_bytes is given, the subtrees that would not fit are left out
+        (max_bytes=0 copies this node alone). Lazy nodes that were never expanded stay lazy in the copy.
+        """
+        old = self._store
+        tree = GameTree.new_root(unflatten_board(old.boards[self._index]), self.parent, self.move, self.prev_solution)
+        new = tree._store
+        new.max_bytes = old.max_bytes
+        queue = [(self._index, 0)]
+        for old_index, new_index in queue:
+            if old.expanded[old_index] and max_bytes is not None and new.memory_usage() > max_bytes:
+                # The subtrees are left out, so the node must carry its final values
+                old.resolve_probabilities(old_index)
+                _copy_node_fields(old, old_index, new, new_index)
+                continue
+            _copy_node_fields(old, old_index, new, new_index)
+            if not old.expanded[old_index]:
+                continue
+            for child in old.children(old_index):
+                new_child = new.add_node(unflatten_board(old.boards[child]), new_index, None,
+                                         None if old.solution_ids[child] == -1
+                                         else old.solutions[old.solution_ids[child]])
+                new.link(new_index, new_child)
+                queue.append((child, new_child))
+        return tree
+
+
+def _resolve_shared(handle: TableHandle, tasks: list[tuple[bytes, tuple[tuple[int, int, int], ...], int, float, float]],
+                    max_bytes: Optional[int]) -> list[tuple[float, float]]:
+    """Return the (guesser_win, adversary_lose) probabilities of lazy subtrees given by their board, filled cells,
+    layers and shares, filtering the shared solution table of handle. Runs in a worker process.
+    """
+    table = attach(handle)
+    results = []
+    for board, filled, layer, guesser_share, adversary_share in tasks:
+        store = GameTreeStore()
+        store.max_bytes = max_bytes
+        root = store.add_node(unflatten_board(board), layer=layer)
+        store.guesser_win[root] = NAN
+        store.adversary_lose[root] = NAN
+        store.guesser_share[root] = guesser_share
+        store.adversary_share[root] = adversary_share
+        store._inherited[root] = (table, filled)
+        store.resolve_probabilities(root)
+        results.append((store.guesser_win[root], store.adversary_lose[root]))
+    return results
+
+
+def _copy_node_fields(old: GameTreeStore, old_index: int, new: GameTreeStore, new_index: int) -> None:
+    """Copy the move, probabilities and lazy state of a node between stores."""
+    new.move_rows[new_index] = old.move_rows[old_index]
+    new.move_cols[new_index] = old.move_cols[old_index]
+    new.move_values[new_index] = old.move_values[old_index]
+    new.guesser_win[new_index] = old.guesser_win[old_index]
+    new.adversary_lose[new_index] = old.adversary_lose[old_index]
+    new.guesser_share[new_index] = old.guesser_share[old_index]
+    new.adversary_share[new_index] = old.adversary_share[old_index]
+    new.layers[new_index] = old.layers[old_index]
+    new.expanded[new_index] = old.expanded[old_index]
+    if old_index in old._inherited:
+        new._inherited[new_index] = old._inherited[old_index]
+
+
+def flatten_board(board: list[list[int]]) -> bytes:
+    """Return the board as a flat row-major byte string."""
+    return bytes(value for row in board for value in row)
+
+
+def unflatten_board(flat: bytes) -> list[list[int]]:
+    """Return the nested board encoded by flatten_board."""
+    n = isqrt(len(flat))
+    return [list(flat[r * n:(r + 1) * n]) for r in range(n)]
 
 
 def generate_gametree(layer: int, move: tuple[tuple[int, int], int] | None, solution: list[list[int]] | None,
-                      board_old: list[list[int]], step: int, parent: GameTree | None = None) -> GameTree:
-    """This function generate the gametree with fixed layer"""
-    board = copy_board(board_old)
-    game_tree = GameTree(board, parent, move, solution)
-    if layer > 0:
-        # Find possible cells and values for the guesser
-        moves = []
-        possible_cells = order_cells(board)
-        for i in range(min(len(possible_cells), 5)):
-            values = get_available_numbers(board, possible_cells[i][0])
-            moves += [(possible_cells[i][0], value) for value in values]
+                      board_old: list[list[int]], step: int, parent: GameTree | None = None,
+                      lazy: bool = False, max_bytes: Optional[int] = None,
+                      solutions: Optional[list[list[list[int]]]] = None) -> GameTree:
+    """This function generate the gametree with fixed layer
 
-        # Find possible solutions for the adversary
-        possible_solutions = setup.find_multiple_solutions(board, len(board))
-        score_solution = [0 for _ in range(len(possible_solutions))]
-        score_move = [0 for _ in range(len(moves))]
-        for i in range(len(possible_solutions)):
-            for j in range(len(moves)):
-                if moves[j][1] == possible_solutions[i][moves[j][0][0]][moves[j][0][1]]:
-                    score_solution[i] += 1
-                    score_move[j] += 1
-                    new_board = copy_board(board)
-                    new_board[moves[j][0][0]][moves[j][0][1]] = moves[j][1]
-                    possible_cells = order_cells(new_board)
-                    coord = possible_cells[0][0]
-                    new_board[coord[0]][coord[1]] = possible_solutions[i][coord[0]][coord[1]]
-                    game_tree.subtrees.append(generate_gametree(layer - 1, moves[j], possible_solutions[i],
-                                                                new_board, step + 1, game_tree))
-        total = sum(score_solution)
-        if game_tree.subtrees:
-            for subtree in game_tree.subtrees:
-                if subtree.subtrees:
-                    sub_sol_prob = 0
-                    sub_move_prob = 0
-                    sub_length = len(subtree.subtrees)
-                    for subsubtree in subtree.subtrees:
-                        sub_sol_prob += subsubtree.adversary_lose_probability
-                        sub_move_prob += subsubtree.guesser_win_probability
-                    ave_sol = sub_sol_prob / sub_length
-                    ave_move = sub_move_prob / sub_length
-                else:
-                    ave_sol, ave_move = 1, 1
-                for i in range(len(score_solution)):
-                    if subtree.prev_solution == possible_solutions[i]:
-                        subtree.adversary_lose_probability = (score_solution[i] / total) * ave_sol
-                for j in range(len(score_move)):
-                    if subtree.move == moves[j]:
-                        subtree.guesser_win_probability = (score_move[j] / total) * ave_move
+    The new tree lives in its own store and its root is only weakly linked to parent.
+
+    If solutions is given, it is used as the adversary's candidate solutions at the root instead of solving
+    board_old, e.g. the game's pool from AdversarialSudoku.get_consistent_solutions.
+
+    With lazy=True, only the root is created here; subtrees are built when first accessed and probabilities are
+    computed when first read, with the same values as the eager tree.
+
+    With max_bytes set, subtrees whose values have already been folded into their parent are released whenever the
+    tree grows past that many bytes. The subtrees of the root are always kept. The released array slots are reused,
+    so the node arrays, which never shrink, stay within the budget:
+
+    >>> import random
+    >>> import sudoku_setup
+    >>> random.seed(3)
+    >>> board = sudoku_setup.generate_puzzle(30, 9)
+    >>> full = generate_gametree(3, None, None, board, 0, lazy=True)
+    >>> bounded = generate_gametree(3, None, None, board, 0, lazy=True, max_bytes=8000)
+    >>> [tree.guesser_win_probability for tree in bounded.get_subtrees()] \\
+    ...     == [tree.guesser_win_probability for tree in full.get_subtrees()]
+    True
+    >>> bounded._store.array_bytes() <= 8000 < full._store.array_bytes()
+    True
+    """
+    game_tree = GameTree.new_root(board_old, parent, move, solution)
+    game_tree._store.max_bytes = max_bytes
+    if lazy:
+        game_tree._store.expanded[game_tree._index] = False
+        game_tree._store.layers[game_tree._index] = max(layer, 0)
+        if solutions is not None:
+            game_tree._store._inherited[game_tree._index] = (solution_table(solutions, len(board_old)), ())
+    else:
+        _generate_subtrees(game_tree, layer, copy_board(board_old), step, solutions)
     return game_tree
 
 
+def _generate_subtrees(game_tree: GameTree, layer: int, board: list[list[int]], step: int,
+                       solutions: Optional[list[list[list[int]]]] = None) -> None:
+    """Build layer levels of subtrees below game_tree, whose board is board, and score them.
+
+    The levels are built depth first from an explicit stack of frames rather than by recursion, in the same order: a
+    subtree is fully built and scored before it is added to its parent and the next sibling is started.
+    """
+    if layer <= 0:
+        return
+    stack = [_SubtreeFrame(game_tree, layer, board, solutions)]
+    while stack:
+        frame = stack[-1]
+        if frame.position < len(frame.matches):
+            i, j = frame.matches[frame.position]
+            frame.position += 1
+            moves = frame.moves
+            new_board = copy_board(frame.board)
+            new_board[moves[j][0][0]][moves[j][0][1]] = moves[j][1]
+            coord = frame.reveals[j]
+            if coord is not None:
+                new_board[coord[0]][coord[1]] = frame.solutions[i][coord[0]][coord[1]]
+            subtree = GameTree(new_board, frame.tree, moves[j], frame.solutions[i])
+            if frame.layer > 1:
+                stack.append(_SubtreeFrame(subtree, frame.layer - 1, new_board))
+            else:
+                frame.tree.add_subtree(subtree)
+        else:
+            stack.pop()
+            _score_subtrees(frame)
+            if stack:
+                stack[-1].tree.add_subtree(frame.tree)
+
+
+class _SubtreeFrame:
+    """One level of _generate_subtrees: a node being expanded, with its moves, candidate solutions and scores, and
+    the position of the next (solution, move) match to build a subtree for.
+    """
+    __slots__ = ('tree', 'layer', 'board', 'moves', 'reveals', 'solutions', 'score_solution', 'score_move',
+                 'matches', 'position')
+    tree: GameTree
+    layer: int
+    board: list[list[int]]
+    moves: list[tuple[tuple[int, int], int]]
+    reveals: list[Optional[tuple[int, int]]]
+    solutions: list[list[list[int]]]
+    score_solution: list[int]
+    score_move: list[int]
+    matches: list[tuple[int, int]]
+    position: int
+
+    def __init__(self, tree: GameTree, layer: int, board: list[list[int]],
+                 solutions: Optional[list[list[list[int]]]] = None) -> None:
+        """Find the moves and candidate solutions of board and score them."""
+        self.tree = tree
+        self.layer = layer
+        self.board = board
+        # Find possible cells and values for the guesser
+        candidates = CandidateBoard(board)
+        self.moves = candidates.moves(5)
+        self.reveals = _reveal_cells(candidates, self.moves)
+        # Find possible solutions for the adversary
+        self.solutions = solution_cache.find_multiple_solutions(board) if solutions is None else solutions
+        self.score_solution, self.score_move, self.matches = _score_moves(
+            solution_table(self.solutions, len(board)), self.moves, len(board))
+        self.position = 0
+
+
+def _score_subtrees(frame: _SubtreeFrame) -> None:
+    """Set the probabilities of the subtrees built for frame, releasing their own subtrees when over budget."""
+    store = frame.tree._store
+    total = sum(frame.score_solution)
+    solution_scores = {store.intern_solution(frame.solutions[i]): frame.score_solution[i]
+                       for i in range(len(frame.solutions))}
+    move_scores = {frame.moves[j]: frame.score_move[j] for j in range(len(frame.moves))}
+    for child in store.children(frame.tree._index):
+        means = store.child_probability_means(child)
+        ave_sol, ave_move = (1, 1) if means is None else means
+        if store.solution_ids[child] in solution_scores:
+            store.adversary_lose[child] = (solution_scores[store.solution_ids[child]] / total) * ave_sol
+        child_move = ((store.move_rows[child], store.move_cols[child]), store.move_values[child])
+        if child_move in move_scores:
+            store.guesser_win[child] = (move_scores[child_move] / total) * ave_move
+        if store.is_over_budget():
+            store.release_subtrees(child)
+
+
+def _score_moves(table: np.ndarray, moves: list[tuple[tuple[int, int], int]],
+                 n: int) -> tuple[list[int], list[int], list[tuple[int, int]]]:
+    """Return, for the solutions in table and the given moves:
+    - the number of moves each solution makes correct,
+    - the number of solutions each move is correct in, read off the cell-digit histogram of the table,
+    - every (solution, move) index pair where the move is correct, solutions first.
+    """
+    if len(table) == 0 or not moves:
+        return [0] * len(table), [0] * len(moves), []
+    rows = np.array([cell[0] for cell, _ in moves])
+    cols = np.array([cell[1] for cell, _ in moves])
+    values = np.array([value for _, value in moves], dtype=np.uint8)
+    matches = table[:, rows * n + cols] == values
+    score_move = solution_histogram(table, n)[rows, cols, values.astype(np.int64) - 1]
+    pairs = np.nonzero(matches)
+    return matches.sum(axis=1).tolist(), score_move.tolist(), list(zip(pairs[0].tolist(), pairs[1].tolist()))
+
+
+def _reveal_cells(candidates: CandidateBoard,
+                  moves: list[tuple[tuple[int, int], int]]) -> list[Optional[tuple[int, int]]]:
+    """Return, for each move, the lowest-degree empty cell after it is accepted (the cell the adversary reveals), or
+    None if the move fills the board.
+    """
+    reveals = []
+    for cell, value in moves:
+        candidates.fill(cell, value)
+        reveals.append(candidates.lowest_degree_cell())
+        candidates.clear(cell)
+    return reveals
+
+
 def order_cells(board: list[list[int]]) -> list[tuple[tuple[int, int], int]]:
     """
     Order the empty cells by their degree from lowest to highest
     degree = number of empty cells in the same row + column + block
     """
-    unordered = []
-    index = 0
-    for i in range(len(board)):
-        for j in range(len(board)):
-            if board[i][j] == 0:
-                unordered.append(((i, j), find_degree(board, (i, j))))
-                index += 1
-
-    unordered.sort(key=lambda tup: tup[1])
-    return unordered
+    return CandidateBoard(board).ordered_cells()
 
 
 def find_degree(board: list[list[int]], position: tuple[int, int]) -> int:
@@ -133,8 +778,8 @@ def find_degree(board: list[list[int]], position: tuple[int, int]) -> int:
             count += 1
 
     block_length = int(sqrt(len(board)))
-    start_r = position[0] // block_length
-    start_c = position[1] // block_length
+    start_r = block_length * (position[0] // block_length)
+    start_c = block_length * (position[1] // block_length)
 
     for i in range(start_r, start_r + block_length):
         for j in range(start_c, start_c + block_length):
@@ -145,28 +790,25 @@ def find_degree(board: list[list[int]], position: tuple[int, int]) -> int:
 
 
 def get_available_numbers(board: list[list[int]], position: tuple[int, int]) -> set[int]:
-    """helper function to check row, column and block avaliability"""
-    number_set = set(range(1, len(board) + 1))
+    """helper function to check row, column and block avaliability
 
-    for i in range(len(board)):
-        num = board[i][position[1]]
-        if num in number_set:
-            number_set.remove(num)
-    for j in range(len(board)):
-        num = board[position[0]][j]
-        if num in number_set:
-            number_set.remove(num)
+    Only the row, column and block of the cell are read; use a CandidateBoard for the candidates of many cells. A
+    filled cell counts as its own peer, so its digit is never available.
 
+    >>> board = [[1, 0, 0, 0], [0, 0, 3, 0], [0, 2, 0, 0], [0, 0, 0, 0]]
+    >>> sorted(get_available_numbers(board, (0, 1)))
+    [3, 4]
+    >>> sorted(get_available_numbers(board, (1, 2)))
+    [1, 2, 4]
+    """
+    r, c = position
     block_length = int(sqrt(len(board)))
-    start_r = block_length * (position[0] // block_length)
-    start_c = block_length * (position[1] // block_length)
-
-    for i in range(start_r, start_r + block_length):
-        for j in range(start_c, start_c + block_length):
-            num = board[i][j]
-            if num in number_set:
-                number_set.remove(num)
-
+    start_r = r - r % block_length
+    start_c = c - c % block_length
+    number_set = set(range(1, len(board) + 1))
+    number_set.difference_update(board[r], [row[c] for row in board],
+                                 *(board[i][start_c:start_c + block_length]
+                                   for i in range(start_r, start_r + block_length)))
     return number_set
 
 # if __name__ == '__main__':
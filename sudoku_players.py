@@ -2,13 +2,18 @@
 from __future__ import annotations
 
 import random
+from concurrent.futures import Executor
 from typing import Optional
 
+import numpy as np
+
 # from python_ta.contracts import check_contracts
 
-import sudoku_setup as setup
 from adversarial_sudoku import AdversarialSudoku, copy_board
-from sudoku_gametree import GameTree, generate_gametree, order_cells, get_available_numbers
+from sudoku_candidates import CandidateBoard
+from sudoku_endgame import ENDGAME_CELLS, endgame, endgame_solutions
+from sudoku_gametree import GameTree, generate_gametree
+from sudoku_solution_pool import SolutionPool
 
 layer = 3
 
@@ -36,12 +41,51 @@ class NormalGuesser(Guesser):
     def make_move(self, game: AdversarialSudoku) -> tuple[tuple[int, int], int]:
         """Return a guess given the current game.
         """
-        moves = []
-        possible_cells = order_cells(game.current_board)
-        for i in range(min(len(possible_cells), 5)):
-            values = get_available_numbers(game.current_board, possible_cells[i][0])
-            moves += [(possible_cells[i][0], value) for value in values]
-        return random.choice(list(moves))
+        moves = CandidateBoard(game.current_board).moves(5)
+        return random.choice(moves)
+
+
+class EntropyGuesser(Guesser):
+    """A Guesser player that makes the guess with the most expected information about the solution.
+
+    A guess is scored over the game's pool of consistent solutions. With p the fraction of them in which the guess
+    is correct, the Adversary either accepts it (probability p) and then reveals the digit of the lowest-degree empty
+    cell, or rejects it. The expected information, in bits, is
+
+        H(p) + p * H(revealed digit | guess accepted)
+
+    The revealed cell depends on the cell guessed but not on the digit, so the guesses are scored from the pool's
+    histograms with one pass over the pool per distinct revealed cell rather than a game tree. Ties go to the guess
+    most likely to be accepted, then to a random one.
+    """
+
+    def make_move(self, game: AdversarialSudoku) -> tuple[tuple[int, int], int]:
+        """Return a guess given the current game.
+
+        Preconditions:
+        - game.is_guesser_turn()
+        """
+        board = game.current_board
+        n = len(board)
+        game.get_consistent_solutions()
+        pool = game.solution_pool
+        if len(pool) == 0:
+            return NormalGuesser().make_move(game)
+
+        # score each guess with the cell the adversary reveals after accepting it
+        scores = np.zeros((n, n, n))
+        for reveal, cells in _reveals_by_guess(board).items():
+            reveal_scores = _information_scores(pool, reveal)
+            for r, c in cells:
+                scores[r, c] = reveal_scores[r, c]
+
+        support = pool.histogram
+        empty = np.array([[value == 0 for value in row] for row in board], dtype=bool)[:, :, None]
+        legal = empty & (support > 0)
+        best = np.flatnonzero(legal & (scores >= scores[legal].max() - 1e-9))
+        best = best[support.ravel()[best] == support.ravel()[best].max()]
+        k = int(random.choice(best))
+        return ((k // (n * n), k // n % n), k % n + 1)
 
 
 # @check_contracts
@@ -53,12 +97,26 @@ class GreedyTreeGuesser(Guesser):
     #   - _game_tree:
     #       The GameTree that this player uses to make its moves. If None, then this
     #       player just makes random moves.
+    #   - _max_tree_bytes:
+    #       The memory budget of the GameTree built on each turn, or None for no limit.
+    #   - _endgame_cells:
+    #       The player plays exactly, without a GameTree, once at most this many cells are empty.
+    #   - _executor:
+    #       If not None, the subtrees of each turn's GameTree are resolved on the worker processes of this executor.
     _game_tree: Optional[GameTree]
+    _max_tree_bytes: Optional[int]
+    _endgame_cells: int
+    _executor: Optional[Executor]
 
-    def __init__(self, game_tree: GameTree = None) -> None:
+    def __init__(self, game_tree: GameTree = None, max_tree_bytes: Optional[int] = None,
+                 endgame_cells: int = ENDGAME_CELLS,
+                 executor: Optional[Executor] = None) -> None:
         """Initialize this player."""
 
         self._game_tree = game_tree
+        self._max_tree_bytes = max_tree_bytes
+        self._endgame_cells = endgame_cells
+        self._executor = executor
 
     def make_move(self, game: AdversarialSudoku) -> tuple[tuple[int, int], int]:
         """Make a move given the current game.
@@ -66,11 +124,19 @@ class GreedyTreeGuesser(Guesser):
         Preconditions:
             - game.is_guesser_turn()
         """
-        if not game.statuses:
-            self._game_tree = generate_gametree(layer, None, None, game.current_board, 0, None)
+        solutions = endgame_solutions(game, self._endgame_cells)
+        if solutions is not None:
+            self._game_tree = None
+            return endgame.best_guess(game.current_board, solutions)
+        if not game.statuses or self._game_tree is None:
+            self._game_tree = generate_gametree(layer, None, None, game.current_board, 0, None,
+                                                lazy=True, max_bytes=self._max_tree_bytes)
         else:
             self._game_tree = generate_gametree(layer, self._game_tree.move, self._game_tree.prev_solution,
-                                                game.current_board, len(game.guesses), self._game_tree)
+                                                game.current_board, len(game.guesses), self._game_tree,
+                                                lazy=True, max_bytes=self._max_tree_bytes)
+        if self._executor is not None:
+            self._game_tree.resolve_subtrees(self._executor)
         possible_subtrees = self._game_tree.get_subtrees()
         record_subs = [possible_subtrees[0]]
         for i in range(1, len(possible_subtrees)):
@@ -79,10 +145,53 @@ class GreedyTreeGuesser(Guesser):
             elif possible_subtrees[i].guesser_win_probability == record_subs[0].guesser_win_probability:
                 record_subs.append(possible_subtrees[i])
         record_sub = random.choice(record_subs)
-        self._game_tree = record_sub
+        # Keep only the committed node so the rest of this turn's tree can be freed
+        self._game_tree = record_sub.detach(max_bytes=0)
         return self._game_tree.move
 
 
+def _reveals_by_guess(board: list[list[int]]) -> dict[tuple[int, int], list[tuple[int, int]]]:
+    """Return the empty cells of board grouped by the lowest-degree empty cell once they are filled, which is the
+    cell the adversary reveals after accepting a guess in them. A cell leaving no empty cell is grouped under itself.
+
+    >>> board = [[2, 0, 1, 4], [4, 0, 3, 0], [0, 0, 0, 0], [3, 4, 0, 1]]
+    >>> CandidateBoard(board).lowest_degree_cell()
+    (1, 3)
+    >>> [reveal for reveal, cells in _reveals_by_guess(board).items() if (0, 1) in cells]
+    [(1, 1)]
+    """
+    candidates = CandidateBoard(board)
+    groups = {}
+    for cell, _ in candidates.ordered_cells():
+        values = candidates.values(cell)
+        if not values:
+            continue  # no legal guess in this cell
+        candidates.fill(cell, values[0])  # degrees do not depend on the digit
+        groups.setdefault(candidates.lowest_degree_cell() or cell, []).append(cell)
+        candidates.clear(cell)
+    return groups
+
+
+def _information_scores(pool: SolutionPool, reveal_cell: tuple[int, int]) -> np.ndarray:
+    """Return the (n, n, n) expected information, in bits, of every guess when reveal_cell is revealed after it is
+    accepted.
+    """
+    total = len(pool)
+    support = pool.histogram.astype(np.float64)
+    p = support / total
+    joint = pool.joint_histogram(reveal_cell).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        outcome = -(_plogp(p) + _plogp(1 - p))
+        conditional = joint / support[..., None]
+        revealed = -_plogp(conditional).sum(axis=3)
+    return outcome + np.where(support > 0, p * revealed, 0.0)
+
+
+def _plogp(x: np.ndarray) -> np.ndarray:
+    """Return x * log2(x) elementwise, taking 0 * log2(0) to be 0."""
+    return np.where(x > 0, x * np.log2(np.where(x > 0, x, 1)), 0.0)
+
+
 ################################################################################
 # Adversary player classes
 ################################################################################
@@ -110,16 +219,16 @@ class NormalAdversary(Adversary):
         """Return a status given the current game.
         """
         # Select a random answer and return the corresponding status
-        possible_solutions = setup.find_multiple_solutions(game.current_board, len(game.current_board))
+        possible_solutions = game.get_consistent_solutions()
         solution_chosen = random.choice(possible_solutions)
         coord = game.guesses[-1][0]
         value = game.guesses[-1][1]
         if game.get_status_for_answer(game.guesses[-1], solution_chosen):
             new_board = copy_board(game.current_board)
             new_board[coord[0]][coord[1]] = value
-            possible_cells = order_cells(new_board)
-            coord = possible_cells[0][0]
-            new_board[coord[0]][coord[1]] = solution_chosen[coord[0]][coord[1]]
+            coord = CandidateBoard(new_board).lowest_degree_cell()
+            if coord is not None:
+                new_board[coord[0]][coord[1]] = solution_chosen[coord[0]][coord[1]]
         else:
             new_board = copy_board(game.current_board)
         return (solution_chosen, new_board)
@@ -132,12 +241,26 @@ class GreedyTreeAdversary(Adversary):
     # Private Instance Attributes:
     #   - _game_tree:
     #       The GameTree that this player uses to make its moves.
+    #   - _max_tree_bytes:
+    #       The memory budget of the GameTree built on each turn, or None for no limit.
+    #   - _endgame_cells:
+    #       The player plays exactly, without a GameTree, once at most this many cells are empty.
+    #   - _executor:
+    #       If not None, the subtrees of each turn's GameTree are resolved on the worker processes of this executor.
     _game_tree: Optional[GameTree]
+    _max_tree_bytes: Optional[int]
+    _endgame_cells: int
+    _executor: Optional[Executor]
 
-    def __init__(self, game_tree: GameTree | None = None) -> None:
+    def __init__(self, game_tree: GameTree | None = None, max_tree_bytes: Optional[int] = None,
+                 endgame_cells: int = ENDGAME_CELLS,
+                 executor: Optional[Executor] = None) -> None:
         """Initialize this player."""
 
         self._game_tree = game_tree
+        self._max_tree_bytes = max_tree_bytes
+        self._endgame_cells = endgame_cells
+        self._executor = executor
 
     def make_move(self, game: AdversarialSudoku) -> tuple[list[list[int]], list[list[int]]]:
         """Make a move given the current game.
@@ -145,11 +268,22 @@ class GreedyTreeAdversary(Adversary):
         Preconditions:
             - not game.is_guesser_turn()
         """
-        if not game.statuses:
-            self._game_tree = generate_gametree(layer, None, None, game.current_board, 0, None)
+        endgame_pool = endgame_solutions(game, self._endgame_cells)
+        if endgame_pool is not None:
+            self._game_tree = None
+            return endgame.best_status(game.current_board, endgame_pool, game.guesses[-1])
+        solutions = game.get_consistent_solutions()
+        if not game.solution_pool.exhaustive:
+            solutions = None  # a sample would narrow the tree's choices; let it find every solution itself
+        if not game.statuses or self._game_tree is None:
+            self._game_tree = generate_gametree(layer, None, None, game.current_board, 0, None,
+                                                lazy=True, max_bytes=self._max_tree_bytes, solutions=solutions)
         else:
             self._game_tree = generate_gametree(layer, self._game_tree.move, self._game_tree.prev_solution,
-                                                game.current_board, len(game.guesses), self._game_tree)
+                                                game.current_board, len(game.guesses), self._game_tree,
+                                                lazy=True, max_bytes=self._max_tree_bytes, solutions=solutions)
+        if self._executor is not None:
+            self._game_tree.resolve_subtrees(self._executor)
         possible_subtrees = self._game_tree.get_subtrees()
         record_subs = [possible_subtrees[0]]
         for i in range(1, len(possible_subtrees)):
@@ -164,12 +298,13 @@ class GreedyTreeAdversary(Adversary):
             value = game.guesses[-1][1]
             new_board = copy_board(game.current_board)
             new_board[coord[0]][coord[1]] = value
-            possible_cells = order_cells(new_board)
-            coord = possible_cells[0][0]
-            new_board[coord[0]][coord[1]] = solution_chosen[coord[0]][coord[1]]
-            self._game_tree = GameTree(new_board, record_sub.parent, game.guesses[-1], solution_chosen)
+            coord = CandidateBoard(new_board).lowest_degree_cell()
+            if coord is not None:
+                new_board[coord[0]][coord[1]] = solution_chosen[coord[0]][coord[1]]
+            self._game_tree = GameTree.new_root(new_board, record_sub.parent, game.guesses[-1], solution_chosen)
         else:
             new_board = copy_board(game.current_board)
+            self._game_tree = self._game_tree.detach(max_bytes=0)
         return (solution_chosen, new_board)
 
 
@@ -0,0 +1,235 @@
+"""A bank of pre-generated sudoku puzzles stored in a fixed-record binary file.
+
+Generating a puzzle, especially one with a capped number of solutions, is too slow to do each time a game starts.
+`build_bank` generates puzzles in worker processes and writes them with their metadata to a file that `PuzzleBank`
+opens with `mmap`, so any puzzle can be read, or sampled at random, in O(1).
+
+File layout (little-endian):
+    - header: magic b'SUDOKUPB', version (uint16), n (uint16), record count (uint32), solution count cap (uint32)
+    - records, each RECORD_TAIL.size + 2 * n * n bytes long:
+        puzzle (n * n bytes, row-major, 0 for empty), one solution (n * n bytes),
+        solution count (uint32, equal to the cap when capped), empty-cell count (uint16), capped flag (uint8)
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import random
+import struct
+from multiprocessing import Pool
+from typing import BinaryIO, Iterator, Optional
+
+import sudoku_setup as setup
+
+MAGIC = b'SUDOKUPB'
+VERSION = 1
+HEADER = struct.Struct('<8sHHII')
+RECORD_TAIL = struct.Struct('<IHB')
+
+
+class PuzzleRecord:
+    """
+    One puzzle of a bank with its metadata.
+
+    Instance Attributes:
+    - puzzle: the puzzle board, 0 for empty cells
+    - solution: one solution of the puzzle
+    - solution_count: the number of solutions, or the bank's cap if capped
+    - capped: whether the puzzle has at least solution_count solutions rather than exactly that many
+    - empty_cells: the number of empty cells in puzzle
+    """
+    __slots__ = ('puzzle', 'solution', 'solution_count', 'capped', 'empty_cells')
+    puzzle: list[list[int]]
+    solution: list[list[int]]
+    solution_count: int
+    capped: bool
+    empty_cells: int
+
+    def __init__(self, puzzle: list[list[int]], solution: list[list[int]], solution_count: int, capped: bool,
+                 empty_cells: int) -> None:
+        """Initialize a new record."""
+        self.puzzle = puzzle
+        self.solution = solution
+        self.solution_count = solution_count
+        self.capped = capped
+        self.empty_cells = empty_cells
+
+
+class PuzzleBank:
+    """
+    A read-only, memory-mapped view of a puzzle bank file.
+
+    Instance Attributes:
+    - path: the bank file
+    - n: the board length of every puzzle in the bank
+    - count_cap: the cap used when counting solutions
+    """
+    path: str
+    n: int
+    count_cap: int
+    _file: Optional[BinaryIO]
+    _map: Optional[mmap.mmap]
+    _length: int
+    _record_size: int
+
+    def __init__(self, path: str) -> None:
+        """Open the bank stored at path.
+
+        Raises:
+            - ValueError: if path is not a puzzle bank of a supported version
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, n, length, count_cap = HEADER.unpack_from(self._map, 0)
+        except (ValueError, struct.error):
+            self._file.close()
+            raise ValueError(f'{path} is not a puzzle bank.')
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a puzzle bank of version {VERSION}.')
+        self.n = n
+        self.count_cap = count_cap
+        self._length = length
+        self._record_size = 2 * n * n + RECORD_TAIL.size
+
+    def __len__(self) -> int:
+        """Return the number of puzzles in the bank."""
+        return self._length
+
+    def __getitem__(self, index: int) -> PuzzleRecord:
+        """Return the puzzle at the given index."""
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('puzzle bank index out of range')
+        n = self.n
+        cells = n * n
+        start = HEADER.size + index * self._record_size
+        data = self._map[start:start + self._record_size]
+        solution_count, empty_cells, capped = RECORD_TAIL.unpack_from(data, 2 * cells)
+        return PuzzleRecord(_unflatten(data[:cells], n), _unflatten(data[cells:2 * cells], n),
+                            solution_count, bool(capped), empty_cells)
+
+    def __iter__(self) -> Iterator[PuzzleRecord]:
+        """Yield every puzzle of the bank in file order."""
+        for index in range(self._length):
+            yield self[index]
+
+    def __enter__(self) -> PuzzleBank:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def sample(self, rng: Optional[random.Random] = None) -> PuzzleRecord:
+        """Return a puzzle of the bank chosen uniformly at random."""
+        if self._length == 0:
+            raise IndexError('sample from an empty puzzle bank')
+        return self[(rng or random).randrange(self._length)]
+
+    def close(self) -> None:
+        """Release the memory map and the file."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def build_bank(path: str, count: int, n: int = 9, percentage: int | float | tuple[float, float] = 50,
+               max_solutions: Optional[int] = 1, count_cap: int = 1000, workers: Optional[int] = None,
+               chunk_size: int = 64, seed: Optional[int] = None) -> None:
+    """Generate count puzzles across worker processes and write them to a new bank file at path.
+
+    Variables:
+        - percentage: the percentage of empty cells, or a (low, high) band within which each puzzle draws its own
+        - max_solutions: passed to `sudoku_setup.dig_puzzle`; None blanks cells at random like `generate_puzzle`
+        - count_cap: solution counts are capped at this value
+        - workers: the number of worker processes, or None for one per CPU
+        - seed: if given, every chunk is generated from a seed derived from it, so the bank is reproducible
+
+    The file is written under a temporary name and moved to path once complete.
+
+    Preconditions:
+        - count >= 0
+        - count_cap >= 1
+        - chunk_size >= 1
+    """
+    tasks = [(start, min(chunk_size, count - start), n, percentage, max_solutions, count_cap,
+              None if seed is None else (seed, start)) for start in range(0, count, chunk_size)]
+    temp_path = f'{path}.tmp'
+    written = 0
+    with open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, n, 0, count_cap))
+        with Pool(workers) as pool:
+            for chunk in pool.imap(_generate_chunk, tasks):
+                file.write(chunk)
+                written += len(chunk) // (2 * n * n + RECORD_TAIL.size)
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, n, written, count_cap))
+    os.replace(temp_path, path)
+
+
+def make_record(puzzle: list[list[int]], count_cap: int = 1000) -> bytes:
+    """Return the bank record of puzzle, solving it and counting its solutions up to count_cap.
+
+    Raises:
+        - ValueError: if the puzzle has no solution
+    """
+    n = len(puzzle)
+    solutions = []
+    setup.count_solutions(puzzle, n, 1, solutions)
+    if not solutions:
+        raise ValueError('The puzzle has no solution.')
+    solution_count = setup.count_solutions(puzzle, n, count_cap)
+    empty_cells = sum(1 for row in puzzle for value in row if value == 0)
+    return (_flatten(puzzle) + _flatten(solutions[0])
+            + RECORD_TAIL.pack(solution_count, empty_cells, solution_count >= count_cap))
+
+
+def _generate_chunk(task: tuple) -> bytes:
+    """Generate one chunk of bank records in a worker process."""
+    start, size, n, percentage, max_solutions, count_cap, seed = task
+    if seed is not None:
+        random.seed(repr(seed))
+    records = []
+    for _ in range(size):
+        if max_solutions is None:
+            share = random.uniform(*percentage) if isinstance(percentage, tuple) else percentage
+            puzzle = setup.blank_cells(setup.generate_sudoku(n), share)
+        else:
+            puzzle = setup.dig_puzzle(n, max_solutions, percentage)
+        records.append(make_record(puzzle, count_cap))
+    return b''.join(records)
+
+
+def _flatten(board: list[list[int]]) -> bytes:
+    """Return the board as a flat row-major byte string."""
+    return bytes(value for row in board for value in row)
+
+
+def _unflatten(flat: bytes, n: int) -> list[list[int]]:
+    """Return the n by n board encoded by _flatten."""
+    return [list(flat[r * n:(r + 1) * n]) for r in range(n)]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build a puzzle bank file.')
+    parser.add_argument('path')
+    parser.add_argument('count', type=int)
+    parser.add_argument('-n', type=int, default=9)
+    parser.add_argument('--percentage', type=float, nargs='+', default=[50])
+    parser.add_argument('--max-solutions', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    if len(args.percentage) > 2:
+        parser.error('--percentage takes one value or a low and a high value')
+
+    band = tuple(args.percentage) if len(args.percentage) == 2 else args.percentage[0]
+    build_bank(args.path, args.count, args.n, band, args.max_solutions or None, workers=args.workers, seed=args.seed)
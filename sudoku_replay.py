@@ -0,0 +1,111 @@
+"""Replaying recorded games round by round.
+
+A Replay steps through the boards of a GameRecord (see `sudoku_game_records`) without simulating any move: it plays
+the rounds forward at a speed in rounds per second, and can be paused, stepped back and forth, and sought to any
+round. It keeps no clock of its own; `update` is given the current time, so it can be driven by the frames of the
+visualizer in `main.py` or by anything else.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from adversarial_sudoku import AdversarialSudoku
+from sudoku_game_records import GameRecord
+
+
+class Replay:
+    """
+    A replay of one recorded game.
+
+    Instance Attributes:
+    - record: the game replayed
+    - position: the number of rounds shown so far
+    - speed: the number of rounds played per second while not paused
+    - paused: whether the replay is paused
+
+    Representation Invariants:
+    - 0 <= self.position <= self.rounds
+    - self.speed > 0
+    """
+    record: GameRecord
+    position: int
+    speed: float
+    paused: bool
+    _boards: list[list[list[int]]]
+    _clock: float
+    _game: Optional[AdversarialSudoku]
+
+    def __init__(self, record: GameRecord, speed: float = 2.0, now: float = 0.0) -> None:
+        """Initialize a replay of record at its first round, playing at speed rounds per second from time now.
+
+        Raises:
+            - ValueError: if speed is not positive
+        """
+        self.record = record
+        self.position = 0
+        self.paused = False
+        self.set_speed(speed)
+        self._boards = list(record.boards())
+        self._clock = now
+        self._game = None
+
+    @property
+    def rounds(self) -> int:
+        """Return the number of rounds of the recorded game."""
+        return len(self._boards) - 1
+
+    def at_end(self) -> bool:
+        """Return whether the last round is shown."""
+        return self.position == self.rounds
+
+    def board(self) -> list[list[int]]:
+        """Return the board after the rounds shown. The board must not be mutated."""
+        return self._boards[self.position]
+
+    def game(self) -> AdversarialSudoku:
+        """Return the game after the rounds shown."""
+        if self._game is None or len(self._game.guesses) != self.position:
+            self._game = self.record.to_game(self.position)
+        return self._game
+
+    def set_speed(self, speed: float) -> None:
+        """Play speed rounds per second from now on.
+
+        Raises:
+            - ValueError: if speed is not positive
+        """
+        if speed <= 0:
+            raise ValueError('The replay speed must be positive.')
+        self.speed = speed
+
+    def seek(self, position: int, now: Optional[float] = None) -> None:
+        """Show the first position rounds, clamped to the rounds of the game, and restart the wait for the next
+        round at time now if it is given.
+        """
+        self.position = min(max(position, 0), self.rounds)
+        if now is not None:
+            self._clock = now
+
+    def step(self, rounds: int, now: Optional[float] = None) -> None:
+        """Pause the replay and move it the given number of rounds, backwards if rounds is negative."""
+        self.paused = True
+        self.seek(self.position + rounds, now)
+
+    def toggle_pause(self, now: float) -> None:
+        """Pause the replay, or resume it at time now. Resuming at the last round starts the replay over."""
+        self.paused = not self.paused
+        if not self.paused and self.at_end():
+            self.position = 0
+        self._clock = now
+
+    def update(self, now: float) -> bool:
+        """Play the rounds due by time now and return whether the round shown changed."""
+        if self.paused or self.at_end():
+            self._clock = now
+            return False
+        due = int((now - self._clock) * self.speed)
+        if due == 0:
+            return False
+        self._clock += due / self.speed
+        self.seek(self.position + due)
+        return True
@@ -0,0 +1,235 @@
+"""Batching Adversary moves of many games into few worker-pool jobs.
+
+Computing one Adversary move in a worker process costs an IPC round trip on top of the move itself, and moves of
+different games often repeat work: games in the same state need the same move, and boards that are images of each
+other under the symmetries of `sudoku_symmetry` need the same solutions, which each worker caches by canonical form in
+`solution_cache`. An AdversaryScheduler collects the move requests of all games for a short window and sends them as
+a few batches, one per worker:
+    - requests for the same game state are computed once and answered with copies of the result,
+    - requests are sorted by a symmetry-invariant hint of their board, and requests with equal hints go to the same
+      worker, so symmetric boards share that worker's solution cache,
+    - a batch is sent early when it is full or when waiting longer would eat more than half of the time left to its
+      most urgent request, and requests whose deadline has passed by then are failed instead of computed.
+"""
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Executor
+from itertools import groupby
+from typing import Optional
+
+import sudoku_players as player
+from adversarial_sudoku import AdversarialSudoku, copy_board
+from sudoku_solution_pool import SolutionPool
+
+ADVERSARIES = {
+    'normal': player.NormalAdversary,
+    'greedy': player.GreedyTreeAdversary,
+}
+
+Status = tuple[list[list[int]], list[list[int]]]
+
+
+class MoveRequest:
+    """
+    An Adversary move waiting to be computed.
+
+    Instance Attributes:
+    - adversary: the key in ADVERSARIES of the Adversary to move
+    - game: the game, with the Guesser's move recorded
+    - deadline: the event loop time by which the move is needed
+    - future: set to the (status, solution pool) of the move
+    - key: equal for requests whose games are in the same state
+    - hint: equal for requests whose boards are symmetric
+    """
+    __slots__ = ('adversary', 'game', 'deadline', 'future', 'key', 'hint')
+    adversary: str
+    game: AdversarialSudoku
+    deadline: float
+    future: asyncio.Future
+    key: tuple
+    hint: tuple
+
+    def __init__(self, adversary: str, game: AdversarialSudoku, deadline: float, future: asyncio.Future) -> None:
+        """Initialize a new request."""
+        self.adversary = adversary
+        self.game = game
+        self.deadline = deadline
+        self.future = future
+        board = bytes(value for row in game.current_board for value in row)
+        pool = game.solution_pool
+        self.key = (adversary, board, tuple(game.guesses), None if pool is None else pool.table.tobytes())
+        self.hint = (len(game.current_board),) + symmetry_hint(game.current_board)
+
+
+class AdversaryScheduler:
+    """
+    Collects Adversary move requests and computes them in batches on an executor.
+
+    Instance Attributes:
+    - window: the most seconds a request waits for others to join its batch
+    - max_batch: a batch is sent as soon as it has this many requests
+    - workers: the number of jobs a batch is split into
+    - requests: the number of requests made
+    - computed: the number of moves computed, after removing duplicates
+    - batches: the number of batches sent
+    - expired: the number of requests failed because their deadline passed before their batch was sent
+    """
+    window: float
+    max_batch: int
+    workers: int
+    requests: int
+    computed: int
+    batches: int
+    expired: int
+    _executor: Executor
+    _pending: list[MoveRequest]
+    _timer: Optional[asyncio.TimerHandle]
+
+    def __init__(self, executor: Executor, workers: int, window: float = 0.005, max_batch: int = 256) -> None:
+        """Initialize a scheduler sending its batches to executor, split into workers jobs each."""
+        self.window = window
+        self.max_batch = max_batch
+        self.workers = max(1, workers)
+        self.requests = 0
+        self.computed = 0
+        self.batches = 0
+        self.expired = 0
+        self._executor = executor
+        self._pending = []
+        self._timer = None
+
+    async def move(self, adversary: str, game: AdversarialSudoku,
+                   budget: float) -> tuple[Status, Optional[SolutionPool]]:
+        """Return the move of a fresh Adversary of the given kind in game, and the game's solution pool as the
+        Adversary left it, needed within budget seconds.
+
+        Raises:
+            - asyncio.TimeoutError: if the budget ran out before the move was sent to a worker
+        """
+        loop = asyncio.get_running_loop()
+        request = MoveRequest(adversary, game, loop.time() + budget, loop.create_future())
+        self._pending.append(request)
+        self.requests += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        else:
+            self._schedule(loop, request.deadline)
+        return await request.future
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop, deadline: float) -> None:
+        """Make sure the pending batch is sent in time for a request with the given deadline."""
+        now = loop.time()
+        when = now + min(self.window, max(0.0, (deadline - now) / 2))
+        if self._timer is not None:
+            if self._timer.when() <= when:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(when, self._flush)
+
+    def _flush(self) -> None:
+        """Send the pending requests to the executor."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        groups = {}
+        for request in batch:
+            if request.future.done():
+                continue  # the caller stopped waiting
+            if request.deadline <= now:
+                self.expired += 1
+                request.future.set_exception(asyncio.TimeoutError())
+                continue
+            groups.setdefault(request.key, []).append(request)
+        if not groups:
+            return
+        self.batches += 1
+        self.computed += len(groups)
+
+        for job in _split(sorted(groups.values(), key=lambda group: group[0].hint), self.workers):
+            tasks = [(group[0].adversary, group[0].game) for group in job]
+            future = loop.run_in_executor(self._executor, adversary_moves, tasks)
+            future.add_done_callback(lambda done, job=job: _resolve(job, done))
+
+
+def _split(groups: list[list[MoveRequest]], jobs: int) -> list[list[list[MoveRequest]]]:
+    """Split the hint-sorted groups into at most about jobs contiguous runs of similar size, never separating
+    groups with equal hints.
+    """
+    target = -(-len(groups) // jobs)
+    runs = [[]]
+    for _, same_hint in groupby(groups, key=lambda group: group[0].hint):
+        if len(runs[-1]) >= target:
+            runs.append([])
+        runs[-1].extend(same_hint)
+    return runs
+
+
+def _resolve(job: list[list[MoveRequest]], done: asyncio.Future) -> None:
+    """Answer the requests of a finished job; every request of a group after the first gets its own copy. If the
+    job was cancelled, so is every request of it.
+
+    >>> async def cancel_job() -> list[bool]:
+    ...     loop = asyncio.get_running_loop()
+    ...     game = AdversarialSudoku(4, 4, 0)
+    ...     job = [[MoveRequest('normal', game, loop.time() + 1, loop.create_future()) for _ in range(2)]
+    ...            for _ in range(3)]
+    ...     done = loop.create_future()
+    ...     done.add_done_callback(lambda done: _resolve(job, done))
+    ...     done.cancel()
+    ...     await asyncio.sleep(0)
+    ...     return [request.future.cancelled() for group in job for request in group]
+    >>> asyncio.run(cancel_job())
+    [True, True, True, True, True, True]
+    """
+    if done.cancelled():
+        for group in job:
+            for request in group:
+                request.future.cancel()
+        return
+    error = done.exception()
+    for i, group in enumerate(job):
+        for k, request in enumerate(group):
+            if request.future.done():
+                continue
+            if error is not None:
+                request.future.set_exception(error)
+                continue
+            (solution, board), pool = done.result()[i]
+            if k > 0:
+                solution, board, pool = copy_board(solution), copy_board(board), pool and pool.copy()
+            request.future.set_result(((solution, board), pool))
+
+
+def symmetry_hint(board: list[list[int]]) -> tuple[tuple[int, ...], tuple[int, ...]]:
+    """Return a key that is equal for boards related by the symmetries of `sudoku_symmetry`: the sorted numbers of
+    empty cells of the rows and columns together, and the sorted numbers of times each digit is used.
+
+    >>> symmetry_hint([[1, 0, 0, 0], [0, 0, 1, 0], [0, 1, 0, 0], [0, 0, 0, 2]]) \\
+    ...     == symmetry_hint([[2, 0, 0, 0], [0, 0, 2, 0], [0, 2, 0, 0], [0, 0, 0, 1]])
+    True
+    """
+    n = len(board)
+    empty = [row.count(0) for row in board] + [sum(1 for row in board if row[c] == 0) for c in range(n)]
+    uses = [0] * (n + 1)
+    for row in board:
+        for value in row:
+            uses[value] += 1
+    return tuple(sorted(empty)), tuple(sorted(uses[1:]))
+
+
+def adversary_moves(tasks: list[tuple[str, AdversarialSudoku]]) -> list[tuple[Status, Optional[SolutionPool]]]:
+    """Return, for every (adversary, game) pair, the move of a fresh Adversary of that kind with the game's solution
+    pool as it was used, so the caller can keep filtering the pool instead of rebuilding it every turn. Runs in a
+    worker process.
+    """
+    return [(ADVERSARIES[adversary]().make_move(game), game.solution_pool) for adversary, game in tasks]
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod(verbose=True)
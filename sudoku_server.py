@@ -0,0 +1,419 @@
+"""A headless asyncio server hosting many concurrent Adversarial Sudoku sessions.
+
+Clients connect over TCP or a Unix socket and exchange JSON objects, one per line. Each request has an "op" and may
+carry an "id", which is echoed in the response:
+
+    {"op": "new", "n": 9, "difficulty": 50, "max_guesses": 81, "adversary": "normal"}
+        -> {"ok": true, "session": "...", "board": [[...]], "max_guesses": 81}
+    {"op": "guess", "session": "...", "cell": [r, c], "value": d}
+        -> {"ok": true, "accepted": true, "board": [[...]], "guesses_left": 80, "winner": null}
+    {"op": "state", "session": "..."}
+        -> {"ok": true, "board": [[...]], "guesses_left": 80, "winner": null}
+    {"op": "close", "session": "..."}
+        -> {"ok": true}
+
+Failures are answered with {"ok": false, "error": "..."} and leave the session as it was. The Guesser's moves come from
+the clients; puzzles and Adversary moves are computed on a process pool shared by every session, so the event loop only
+routes messages. Adversary moves of all sessions are batched by an AdversaryScheduler (see `sudoku_scheduler`). At most
+max_pending requests wait on the pool at once: further requests wait for a slot, and a request whose move does not
+finish within the session timeout is answered with an error and can be retried.
+
+`SudokuClient` is a small client for the same protocol, and `play_random` a stand-in player, so the server can be
+exercised locally:
+
+    python sudoku_server.py serve --port 8765
+    python sudoku_server.py bench --clients 200
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+from adversarial_sudoku import AdversarialSudoku, copy_board
+from sudoku_candidates import CandidateBoard
+from sudoku_scheduler import ADVERSARIES, AdversaryScheduler
+
+
+class Session:
+    """
+    One game hosted by the server.
+
+    Instance Attributes:
+    - game: the game state, current_board included
+    - adversary: the key in ADVERSARIES of the Adversary playing this game
+    - lock: held while a request of this session is handled, so its requests run one at a time
+    - last_active: the time.monotonic() of the last request of this session
+    """
+    __slots__ = ('game', 'adversary', 'lock', 'last_active')
+    game: AdversarialSudoku
+    adversary: str
+    lock: asyncio.Lock
+    last_active: float
+
+    def __init__(self, game: AdversarialSudoku, adversary: str) -> None:
+        """Initialize a new session."""
+        self.game = game
+        self.adversary = adversary
+        self.lock = asyncio.Lock()
+        self.last_active = time.monotonic()
+
+
+class SudokuServer:
+    """
+    The session registry and request handlers of the server.
+
+    Instance Attributes:
+    - sessions: the open sessions by ID
+    - max_sessions: the most sessions open at once
+    - timeout: the seconds a request may wait for its pool job, including the wait for a slot
+    - idle_timeout: sessions without a request for this many seconds are closed, or never if None
+    - scheduler: batches the Adversary moves of all sessions
+    """
+    sessions: dict[str, Session]
+    max_sessions: int
+    timeout: float
+    idle_timeout: Optional[float]
+    scheduler: AdversaryScheduler
+    _executor: ProcessPoolExecutor
+    _slots: asyncio.Semaphore
+    _ids: itertools.count
+    _connections: set[asyncio.Task]
+    _expiry_task: Optional[asyncio.Task]
+
+    def __init__(self, workers: Optional[int] = None, max_sessions: int = 10000, max_pending: int = 64,
+                 timeout: float = 30.0, idle_timeout: Optional[float] = 3600.0) -> None:
+        """Initialize a server with a pool of the given number of worker processes (one per CPU if None)."""
+        self.sessions = {}
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        # workers forked while connections are open would hold copies of their sockets and keep them from closing
+        self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        self.scheduler = AdversaryScheduler(self._executor, workers or os.cpu_count() or 1)
+        self._slots = asyncio.Semaphore(max_pending)
+        self._ids = itertools.count(1)
+        self._connections = set()
+        self._expiry_task = None
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, path: Optional[str] = None) -> asyncio.Server:
+        """Start listening on host:port, or on the Unix socket at path if given, and return the asyncio server."""
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        if self.idle_timeout is not None and self._expiry_task is None:
+            # the event loop keeps only a weak reference to its tasks
+            self._expiry_task = asyncio.get_running_loop().create_task(self._expire_sessions())
+        return server
+
+    async def close(self) -> None:
+        """Stop closing idle sessions and shut down the worker pool."""
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._expiry_task
+            self._expiry_task = None
+        self._executor.shutdown(cancel_futures=True)
+
+    async def wait_connections(self) -> None:
+        """Wait until every open connection has been closed by its client."""
+        if self._connections:
+            await asyncio.wait(self._connections)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the requests of one connection in order until it closes."""
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.handle_line(line)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def handle_line(self, line: bytes) -> dict[str, Any]:
+        """Return the response to one request line."""
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('A request must be a JSON object.')
+        except ValueError as error:
+            return {'ok': False, 'error': f'bad request: {error}'}
+        try:
+            handler = _HANDLERS.get(request.get('op'))
+            if handler is None:
+                raise ValueError(f'unknown op {request.get("op")!r}')
+            response = await handler(self, request)
+        except (ValueError, TypeError, KeyError, IndexError) as error:
+            response = {'ok': False, 'error': str(error)}
+        except asyncio.TimeoutError:
+            response = {'ok': False, 'error': 'timed out, try again'}
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    async def new_session(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Start a new game."""
+        if len(self.sessions) >= self.max_sessions:
+            raise ValueError('too many sessions')
+        adversary = request.get('adversary', 'normal')
+        if adversary not in ADVERSARIES:
+            raise ValueError(f'unknown adversary {adversary!r}')
+        max_guesses = int(request.get('max_guesses', 81))
+        n = int(request.get('n', 9))
+        if max_guesses < 1 or n not in (4, 9, 16):
+            raise ValueError('max_guesses must be positive and n one of 4, 9 and 16')
+        difficulty = float(request.get('difficulty', 50))
+        loop = asyncio.get_running_loop()
+        game = await self._limit(lambda _: loop.run_in_executor(self._executor, _new_game, max_guesses, n, difficulty))
+        session_id = f'{next(self._ids):x}-{random.getrandbits(32):08x}'
+        self.sessions[session_id] = Session(game, adversary)
+        return {'ok': True, 'session': session_id, 'board': game.current_board, 'max_guesses': max_guesses}
+
+    async def guess(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Record a guess of the client and answer it with the Adversary's move."""
+        session = self._session(request)
+        async with session.lock:
+            game = session.game
+            if game.get_winner() is not None:
+                raise ValueError('the game is over')
+            (r, c), value = request['cell'], int(request['value'])
+            n = len(game.current_board)
+            if not (0 <= r < n and 0 <= c < n and 1 <= value <= n) or game.current_board[r][c] != 0:
+                raise ValueError('the guess must put a digit of the board in an empty cell')
+            guess = ((int(r), int(c)), value)
+            moved = game.copy_and_record_guesser_move(guess)
+            status, pool = await self._limit(lambda budget: self.scheduler.move(session.adversary, moved, budget))
+            game.record_guesser_move(guess)
+            game.solution_pool = pool
+            game.record_adversary_move(status)
+            game.current_board = copy_board(status[1])
+            session.last_active = time.monotonic()
+            response = self._state(game)
+            response['accepted'] = game.current_board[r][c] == value
+            return response
+
+    async def state(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Return the state of a game."""
+        session = self._session(request)
+        session.last_active = time.monotonic()
+        return self._state(session.game)
+
+    async def close_session(self, request: dict[str, Any]) -> dict[str, Any]:
+        """End a game."""
+        self._session(request)
+        del self.sessions[request['session']]
+        return {'ok': True}
+
+    def _session(self, request: dict[str, Any]) -> Session:
+        """Return the session named by request."""
+        session = self.sessions.get(request.get('session'))
+        if session is None:
+            raise ValueError('unknown session')
+        return session
+
+    @staticmethod
+    def _state(game: AdversarialSudoku) -> dict[str, Any]:
+        """Return the public state of game, with the Adversary's solution once the game is over."""
+        winner = game.get_winner()
+        state = {'ok': True, 'board': game.current_board, 'guesses_left': game.max_guesses - len(game.statuses),
+                 'winner': winner}
+        if winner is not None:
+            state['solution'] = game.statuses[-1][0]
+        return state
+
+    async def _limit(self, work: Callable[[float], Awaitable[Any]]) -> Any:
+        """Return await work(budget) once a slot is free, where budget is the time left of the session timeout.
+
+        Raises:
+            - asyncio.TimeoutError: if the timeout runs out first
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+
+        async def run() -> Any:
+            async with self._slots:
+                return await work(deadline - loop.time())
+
+        return await asyncio.wait_for(run(), self.timeout)
+
+    async def _expire_sessions(self) -> None:
+        """Close idle sessions, checking every tenth of idle_timeout."""
+        while True:
+            await asyncio.sleep(self.idle_timeout / 10)
+            cutoff = time.monotonic() - self.idle_timeout
+            for session_id, session in list(self.sessions.items()):
+                if session.last_active < cutoff and not session.lock.locked():
+                    del self.sessions[session_id]
+
+
+_HANDLERS = {
+    'new': SudokuServer.new_session,
+    'guess': SudokuServer.guess,
+    'state': SudokuServer.state,
+    'close': SudokuServer.close_session,
+}
+
+
+def _new_game(max_guesses: int, n: int, difficulty: float) -> AdversarialSudoku:
+    """Create a game in a worker process."""
+    return AdversarialSudoku(max_guesses, n, difficulty)
+
+
+################################################################################
+# Client
+################################################################################
+class SudokuClient:
+    """A client for the JSON-lines protocol of SudokuServer, sending one request at a time."""
+    _reader: asyncio.StreamReader
+    _writer: asyncio.StreamWriter
+    _ids: itertools.count
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Initialize a client over an open connection."""
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count(1)
+
+    @classmethod
+    async def connect(cls, host: str = '127.0.0.1', port: int = 8765, path: Optional[str] = None) -> SudokuClient:
+        """Return a client connected to host:port, or to the Unix socket at path if given."""
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, op: str, **fields: Any) -> dict[str, Any]:
+        """Send a request and return its response.
+
+        Raises:
+            - ConnectionError: if the server closed the connection
+        """
+        request_id = next(self._ids)
+        self._writer.write(json.dumps({'op': op, 'id': request_id, **fields}).encode() + b'\n')
+        await self._writer.drain()
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError('the server closed the connection')
+        return json.loads(line)
+
+    async def close(self) -> None:
+        """Close the connection."""
+        self._writer.close()
+        with contextlib.suppress(ConnectionError):
+            await self._writer.wait_closed()
+
+
+async def play_random(client: SudokuClient, n: int = 9, difficulty: float = 50, adversary: str = 'normal',
+                      max_guesses: int = 81, latencies: Optional[list[float]] = None) -> Optional[str]:
+    """Play one game through client, guessing a random legal digit of a lowest-degree cell like NormalGuesser, and
+    return the winner, or None if a request failed. The seconds taken by every guess are appended to latencies if
+    given.
+    """
+    response = await client.request('new', n=n, difficulty=difficulty, adversary=adversary, max_guesses=max_guesses)
+    if not response['ok']:
+        return None
+    session, board = response['session'], response['board']
+    rejected = set()
+    try:
+        while True:
+            moves = [move for move in CandidateBoard(board).moves(5) if move not in rejected]
+            cell, value = random.choice(moves)
+            start = time.perf_counter()
+            response = await client.request('guess', session=session, cell=list(cell), value=value)
+            if latencies is not None:
+                latencies.append(time.perf_counter() - start)
+            if not response['ok']:
+                return None
+            if not response['accepted']:
+                rejected.add((cell, value))
+            board = response['board']
+            if response['winner'] is not None:
+                return response['winner']
+    finally:
+        await client.request('close', session=session)
+
+
+async def _bench(clients: int, games: int, workers: Optional[int], n: int, difficulty: float, adversary: str) -> None:
+    """Serve on an ephemeral local port and play games from concurrent stand-in clients."""
+    server = SudokuServer(workers)
+    listener = await server.serve(port=0)
+    port = listener.sockets[0].getsockname()[1]
+    results = []
+    latencies = []
+
+    async def run_client() -> None:
+        client = await SudokuClient.connect(port=port)
+        try:
+            for _ in range(games):
+                results.append(await play_random(client, n, difficulty, adversary, latencies=latencies))
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    listener.close()
+    await server.wait_connections()
+    await server.close()
+    latencies.sort()
+    scheduler = server.scheduler
+    print(f'{len(results)} games in {elapsed:.2f}s ({len(results) / elapsed:.1f} games/s), '
+          f'winners: {dict((w, results.count(w)) for w in set(results))}')
+    if latencies:
+        print(f'guess latency: median {1000 * latencies[len(latencies) // 2]:.1f}ms, '
+              f'p99 {1000 * latencies[int(0.99 * (len(latencies) - 1))]:.1f}ms')
+    print(f'{scheduler.requests} moves in {scheduler.batches} batches, {scheduler.computed} computed, '
+          f'{scheduler.expired} expired')
+
+
+async def _serve(host: str, port: int, path: Optional[str], workers: Optional[int]) -> None:
+    """Serve until cancelled."""
+    server = SudokuServer(workers)
+    listener = await server.serve(host, port, path)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Host Adversarial Sudoku sessions over JSON lines.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--unix', default=None, help='listen on this Unix socket path instead')
+    serve_parser.add_argument('--workers', type=int, default=None)
+    bench_parser = commands.add_parser('bench')
+    bench_parser.add_argument('--clients', type=int, default=50)
+    bench_parser.add_argument('--games', type=int, default=1, help='games per client')
+    bench_parser.add_argument('--workers', type=int, default=None)
+    bench_parser.add_argument('-n', type=int, default=9)
+    bench_parser.add_argument('--difficulty', type=float, default=50)
+    bench_parser.add_argument('--adversary', choices=sorted(ADVERSARIES), default='normal')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        asyncio.run(_serve(args.host, args.port, args.unix, args.workers))
+    else:
+        asyncio.run(_bench(args.clients, args.games, args.workers, args.n, args.difficulty, args.adversary))
@@ -9,8 +9,14 @@ The abbreviations and short names used in this project are:
     - d: the digit in a cell; the digit in a row; the digit in a coloumn; the digit in a block
     - p: the short for the position of a cell
 """
+from __future__ import annotations
+
 import math  # we used math.isqrt and math.sqrt
 import random  # We used random.sample
+import time
+from typing import Iterator
+
+import sudoku_validation as validation
 
 # import List from typing  # may use List[List[int]]
 
@@ -31,6 +37,9 @@ EMPTY_MARK = '.'  # only used when call `print` for view and test purpose in con
 INITIATED_NUMBER = 9  # by using `get_initiated_number(9)`
 BASE = 3  # by using `get_base_number(9)`, the sudoku game's base number or initiated number
 
+# will be used for estimating solution counts
+EXACT_SLICE_NODES = 1024  # the digits `estimate_solutions` places between checks of its time budget
+
 
 ################################################################################
 # Generating numbers
@@ -81,34 +90,22 @@ def solve(puzzle: list[list[int]], n: int = 9) -> bool:
     Preconditions:
         - n > 0
     """
-    # n = ...
-
-    empty = find_empty(puzzle)
-    if not empty:
-        return True
-    else:
-        r, c = empty
-
-    for d in range(1, n + 1):  # d is digit
-        if is_position_valid((r, c), puzzle, d):
-            puzzle[r][c] = d  # if the digit is valid, then fill in the cell
-
-            if solve(puzzle):  # early return after filled in
-                return True
-
-            puzzle[r][c] = 0  # if the digit is not valid, reset to 0 (empty)
-
-    return False  # no digit can be filled in
+    # the first solution in row-major order, found without recursion
+    search = SolutionSearch(puzzle, n, fewest_candidates=False)
+    if not search.advance():
+        return False
+    for r in range(len(puzzle)):
+        puzzle[r][:] = search.board[r]
+    return True
 
 
 # This is a new function.
 # Here the solutions may be designed as a set, but for now it is a list.
 def find_multiple_solutions(puzzle: list[list[int]], n: int = 9) -> list[list[list[int]]]:
-    """Return all possible solutions, with the use of a helper _solve_recursive.
+    """Return all possible solutions, in row-major lexicographic order, with the use of a SolutionSearch.
     """
     # n = ...
-    solutions = []
-    _solve_recursive(puzzle, solutions, n)
+    solutions = list(SolutionSearch(puzzle, n, fewest_candidates=False))
 
     # print solutions for easily view
     # for i, solution in enumerate(solutions):  # i is the number of current solution
@@ -120,28 +117,327 @@ def find_multiple_solutions(puzzle: list[list[int]], n: int = 9) -> list[list[li
     return solutions
 
 
-# This is a new function.
-def _solve_recursive(puzzle, solutions, n: int = 9) -> None:
-    """A helper function for find_multiple_solutions that gives a solution by checking wether
-    an empty cell on the board.
+################################################################################
+# Counting solutions
+################################################################################
+def count_solutions(puzzle: list[list[int]], n: int = 9, limit: int | None = None,
+                    solutions: list[list[list[int]]] | None = None) -> int:
+    """Return the number of solutions of the puzzle, stopping once `limit` solutions have been found.
+
+    Unlike `find_multiple_solutions`, the solutions are not stored unless a `solutions` list is given to collect
+    them, and the search keeps one bitmask of used digits per row, column and block and always branches on the empty
+    cell with the fewest candidates (so collected solutions are not in row-major order).
+
+    Returns:
+        - the number of solutions, or `limit` if the puzzle has at least `limit` solutions
+
+    Preconditions:
+        - n > 0
+        - limit is None or limit >= 1
     """
+    search = SolutionSearch(puzzle, n)
+    count = 0
+    while (limit is None or count < limit) and search.advance():
+        count += 1
+        if solutions is not None:
+            solutions.append([row[:] for row in search.board])
+    return count
 
-    # Find the first empty cell in the puzzle
-    for row in range(n):
-        for col in range(n):
-            if puzzle[row][col] == 0:
-                # Try all possible values for the cell
-                for val in range(1, n + 1):
-                    puzzle[row][col] = val
-                    # Check if the value is valid and continue recursively
-                    if is_position_valid((row, col), puzzle, n):
-                        _solve_recursive(puzzle, solutions, n)
-                # Reset the value of the cell if no valid value was found
-                puzzle[row][col] = 0
-                return
 
-    # If no empty cell was found, add the solved puzzle to the list of solutions
-    solutions.append([row[:] for row in puzzle])
+def _digit_masks(puzzle: list[list[int]], n: int = 9) \
+        -> tuple[list[int], list[int], list[int], list[tuple[int, int]]] | None:
+    """A helper function for `count_solutions` that returns the used-digit bitmasks of every row, column and block
+    (bit d - 1 for digit d) and the list of empty cells.
+
+    Returns:
+        - None if a digit appears twice in a row, column or block
+    """
+    b = get_base_number(n)
+    rows, cols, blocks = [0] * n, [0] * n, [0] * n
+    empties = []
+    for r in range(n):
+        for c in range(n):
+            d = puzzle[r][c]
+            if d == 0:
+                empties.append((r, c))
+                continue
+            bit = 1 << (d - 1)
+            g = (r // b) * b + c // b
+            if rows[r] & bit or cols[c] & bit or blocks[g] & bit:
+                return None
+            rows[r] |= bit
+            cols[c] |= bit
+            blocks[g] |= bit
+    return rows, cols, blocks, empties
+
+
+class SolutionSearch:
+    """
+    An explicit-stack version of the bitmask search of `count_solutions`, which can be suspended and resumed.
+
+    The search keeps its own stack of (cell, untried digits, placed digit) frames instead of recursing, so its depth is
+    bounded only by the number of empty cells, and `advance` can stop after a number of placed digits and carry on
+    where it left off on the next call.
+
+    Instance Attributes:
+    - n: the board length
+    - board: the working board, holding a solution right after `advance` returns True
+    - nodes: the number of digits placed so far
+    - done: whether every solution has been found
+
+    Representation Invariants:
+    - len(self._remaining) == len(self._placed) == len(self._swaps) <= len(self._empties)
+    """
+    n: int
+    board: list[list[int]]
+    nodes: int
+    done: bool
+    _fewest_candidates: bool
+    _empties: list[tuple[int, int]]
+    _rows: list[int]
+    _cols: list[int]
+    _blocks: list[int]
+    _remaining: list[int]
+    _placed: list[int]
+    _swaps: list[int]
+    _started: bool
+
+    def __init__(self, puzzle: list[list[int]], n: int = 9, fewest_candidates: bool = True) -> None:
+        """Initialize a search over the completions of puzzle, which is not modified.
+
+        With fewest_candidates, the search branches on the empty cell with the fewest candidates, like
+        `count_solutions`; otherwise it branches on the first empty cell in row-major order, so the solutions come in
+        the row-major lexicographic order of `find_multiple_solutions`.
+        """
+        self.n = n
+        self.board = [row[:] for row in puzzle]
+        self.nodes = 0
+        self._fewest_candidates = fewest_candidates
+        self._remaining, self._placed, self._swaps = [], [], []
+        self._started = False
+        masks = _digit_masks(puzzle, n)
+        self.done = masks is None
+        if masks is not None:
+            self._rows, self._cols, self._blocks, self._empties = masks
+
+    def __iter__(self) -> SolutionSearch:
+        return self
+
+    def __next__(self) -> list[list[int]]:
+        """Return a copy of the next solution."""
+        if not self.advance():
+            raise StopIteration
+        return [row[:] for row in self.board]
+
+    def advance(self, max_nodes: int | None = None) -> bool | None:
+        """Search for the next solution.
+
+        Returns:
+            - True: the next solution is in self.board
+            - False: there are no more solutions
+            - None: max_nodes digits were placed without reaching either; call again to resume
+        """
+        if self.done:
+            return False
+        if not self._started:
+            self._started = True
+            if not self._empties:
+                self.done = True
+                return True
+            if not self._push(0):
+                self.done = True
+                return False
+
+        b = get_base_number(self.n)
+        rows, cols, blocks, board = self._rows, self._cols, self._blocks, self.board
+        empties, remaining, placed = self._empties, self._remaining, self._placed
+        budget = max_nodes
+        while True:
+            depth = len(remaining) - 1
+            r, c = empties[depth]
+            g = (r // b) * b + c // b
+            bit = placed[depth]
+            if bit:
+                rows[r] ^= bit
+                cols[c] ^= bit
+                blocks[g] ^= bit
+                placed[depth] = 0
+            if remaining[depth] == 0:
+                board[r][c] = 0
+                self._pop()
+                if not remaining:
+                    self.done = True
+                    return False
+                continue
+            if budget is not None:
+                if budget == 0:
+                    return None
+                budget -= 1
+
+            mask = remaining[depth]
+            bit = mask & -mask
+            remaining[depth] = mask ^ bit
+            rows[r] |= bit
+            cols[c] |= bit
+            blocks[g] |= bit
+            placed[depth] = bit
+            board[r][c] = bit.bit_length()
+            self.nodes += 1
+            if depth + 1 == len(empties):
+                return True
+            self._push(depth + 1)
+
+    def _push(self, depth: int) -> bool:
+        """Choose the cell to branch on at depth and push its frame. Return False, pushing nothing, if some empty
+        cell has no candidates left.
+        """
+        b = get_base_number(self.n)
+        full = (1 << self.n) - 1
+        empties, rows, cols, blocks = self._empties, self._rows, self._cols, self._blocks
+        best, best_mask, best_size = depth, 0, b * b + 1
+        for k in range(depth, len(empties) if self._fewest_candidates else depth + 1):
+            r, c = empties[k]
+            mask = full & ~(rows[r] | cols[c] | blocks[(r // b) * b + c // b])
+            size = bin(mask).count('1')
+            if size < best_size:
+                best, best_mask, best_size = k, mask, size
+                if size <= 1:
+                    break
+        if best_size == 0:
+            return False
+        empties[depth], empties[best] = empties[best], empties[depth]
+        self._remaining.append(best_mask)
+        self._placed.append(0)
+        self._swaps.append(best)
+        return True
+
+    def _pop(self) -> None:
+        """Pop the frame of the deepest cell, restoring the order of the empty cells."""
+        depth = len(self._remaining) - 1
+        best = self._swaps.pop()
+        self._remaining.pop()
+        self._placed.pop()
+        self._empties[depth], self._empties[best] = self._empties[best], self._empties[depth]
+
+
+def iter_solutions(puzzle: list[list[int]], n: int = 9) -> Iterator[list[list[int]]]:
+    """Yield the solutions of the puzzle one at a time, using the same search as `count_solutions`.
+
+    The solutions are not yielded in row-major order; use `find_multiple_solutions` when that order matters.
+    """
+    yield from SolutionSearch(puzzle, n)
+
+
+def has_other_solution(puzzle: list[list[int]], p: tuple[int, int], d: int, n: int = 9) -> bool:
+    """Return whether the puzzle has a solution whose digit at the empty position p is not d.
+
+    This is the incremental uniqueness check used when digging holes: if the puzzle with p filled by d has a unique
+    solution, emptying p keeps it unique exactly when this returns False.
+
+    Preconditions:
+        - puzzle[p[0]][p[1]] == 0
+    """
+    masks = _digit_masks(puzzle, n)
+    if masks is None:
+        return False
+    rows, cols, blocks, _ = masks
+    b = get_base_number(n)
+    r, c = p
+    others = (1 << n) - 1 & ~(rows[r] | cols[c] | blocks[(r // b) * b + c // b]) & ~(1 << (d - 1))
+    board = [row[:] for row in puzzle]
+    while others:
+        bit = others & -others
+        others ^= bit
+        board[r][c] = bit.bit_length()
+        if SolutionSearch(board, n).advance():
+            return True
+    return False
+
+
+def estimate_solutions(puzzle: list[list[int]], n: int = 9, probes: int = 1000, exact_below: int = 64,
+                       time_budget: float | None = None,
+                       rng: random.Random | None = None) -> tuple[float, float, float]:
+    """Return an estimate of the number of solutions of the puzzle with a 95% confidence interval.
+
+    The solutions are first counted with a `SolutionSearch` capped at exact_below; when there are fewer, the count is
+    exact and returned as its own interval. Otherwise each probe walks one random path down the same
+    fewest-candidates search tree and multiplies the number of candidates met on the way (Knuth's estimator), a path
+    ending in a dead end counting as 0. The mean over the probes is an unbiased estimate. When the probes leave no
+    interval above the solutions already found (say every probe dead-ended), high is math.inf, so only an exact
+    count ever has low == high.
+
+    >>> estimate, low, high = estimate_solutions([[0] * 16 for _ in range(16)], 16, probes=1, rng=random.Random(0))
+    >>> isinstance(estimate, float) and low >= 64.0 and low < high
+    True
+
+    Variables:
+        - probes: the most random paths walked
+        - time_budget: if given, the exact count is given up and no new probe is started after this many seconds,
+          though at least one probe is walked
+        - rng: the random generator to use, or None for the random module
+
+    Returns:
+        - (estimate, low, high) as floats, with low at least the number of solutions found and low < high when the
+          count is not exact
+
+    Preconditions:
+        - n > 0
+        - probes >= 1
+        - exact_below >= 1
+    """
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    search = SolutionSearch(puzzle, n)
+    count = 0
+    while count < exact_below:
+        found = search.advance(None if deadline is None else EXACT_SLICE_NODES)
+        if found is False:
+            return (float(count), float(count), float(count))
+        count += found is True
+        if deadline is not None and time.perf_counter() >= deadline:
+            break  # out of time: estimate instead, knowing there are at least count solutions
+
+    rows, cols, blocks, empties = _digit_masks(puzzle, n)
+    b = get_base_number(n)
+    full = (1 << n) - 1
+    rng = rng or random
+    samples = []
+    while len(samples) < probes and (deadline is None or not samples or time.perf_counter() < deadline):
+        samples.append(_probe(list(empties), rows[:], cols[:], blocks[:], b, full, rng))
+
+    k = len(samples)
+    mean = sum(samples) / k
+    spread = 1.96 * math.sqrt(sum((x - mean) ** 2 for x in samples) / (k - 1) / k) if k > 1 else mean
+    low = float(max(mean - spread, count))
+    high = mean + spread if mean + spread > low else math.inf
+    return (float(max(mean, count)), low, high)
+
+
+def _probe(empties: list[tuple[int, int]], rows: list[int], cols: list[int], blocks: list[int], b: int, full: int,
+           rng: random.Random) -> int:
+    """A helper function for `estimate_solutions` that walks one random path of the search tree and returns the
+    product of the number of candidates met, or 0 at a dead end. The masks are updated in place.
+    """
+    product = 1
+    while empties:
+        best, best_mask, best_size = 0, 0, b * b + 1
+        for k, (r, c) in enumerate(empties):
+            mask = full & ~(rows[r] | cols[c] | blocks[(r // b) * b + c // b])
+            size = bin(mask).count('1')
+            if size < best_size:
+                best, best_mask, best_size = k, mask, size
+                if size <= 1:
+                    break
+        if best_size == 0:
+            return 0
+        r, c = empties[best]
+        empties[best] = empties[-1]
+        empties.pop()
+        bit = 1 << rng.choice([d for d in range(best_mask.bit_length()) if best_mask >> d & 1])
+        rows[r] |= bit
+        cols[c] |= bit
+        blocks[(r // b) * b + c // b] |= bit
+        product *= best_size
+    return product
 
 
 ################################################################################
@@ -288,61 +584,18 @@ def is_initiated_number(n: int | float = 9) -> bool:
 # This is a new function.
 def is_position_valid(p: tuple[int, int], puzzle: list[list[int]], n: int = 9) -> bool:
     """
-    Check if the position is a valid position
+    Check if the position is a valid position: the value in the cell is between 1 and n and is not repeated in its
+    row, column or block
     """
-    r, c = p
-
-    # Check if the value in the cell is valid (between 1 and n)
-    if puzzle[r][c] < 1 or puzzle[r][c] > n:
-        return False
-
-    # Check if the value in the cell is already present in the same row
-    for i in range(n):
-        if i != c and puzzle[r][i] == puzzle[r][c]:
-            return False
-
-    # Check if the value in the cell is already present in the same column
-    for i in range(n):
-        if i != r and puzzle[i][c] == puzzle[r][c]:
-            return False
-
-    # Check if the value in the cell is already present in the same block
-    b = get_base_number(n)
-    block_r = (r // b) * b
-    block_c = (c // b) * b
-    for i in range(block_r, block_r + b):
-        for j in range(block_c, block_c + b):
-            if (i, j) != p and puzzle[i][j] == puzzle[r][c]:
-                return False
-
-    # If none of the checks failed, then the position is valid
-    return True
+    value = puzzle[p[0]][p[1]]
+    return 1 <= value <= n and validation.is_move_legal(puzzle, p, value)
 
 
 def is_valid_solution(puzzle: list[list[int]], n: int = 9) -> bool:
     """
     Check if the solution has any contradiction with
     """
-    # Check each row
-    for row in range(n):
-        if len(set(puzzle[row])) != n:
-            return False
-
-    # Check each column
-    for col in range(n):
-        if len(set([puzzle[row][col] for row in range(n)])) != n:
-            return False
-
-    # Check each block
-    b = get_base_number(n)
-    for block_r in range(b):
-        for block_c in range(b):
-            if len(set([puzzle[row][col] for row in range(block_r * b, (block_r + 1) * b)
-                        for col in range(block_c * b, (block_c + 1) * b)])) != n:
-                return False
-
-    # If all checks pass, then the solution is valid
-    return True
+    return len(puzzle) == n and bool(validation.valid_solutions([puzzle])[0])
 
 
 ################################################################################
@@ -385,13 +638,16 @@ def _shuffle(s: any) -> list:
     return random.sample(s, len(s))
 
 
-def generate_puzzle(percentage: int | float = 50, n: int = 9) -> list[list[int]]:
+def generate_puzzle(percentage: int | float = 50, n: int = 9, max_solutions: int | None = None,
+                    verbose: bool = False) -> list[list[int]]:
     """Genreate a sudoku puzzle for playing. The percentage reflecting the difficulty of the puzzle.
     Percentage can be changed for a difficulty level.
 
     Variables:
         - n: the initiated number
         - percentage: the percentage of **empty cells**
+        - max_solutions: if given, the puzzle is built by `dig_puzzle` with at most this many solutions
+        - verbose: print the puzzle (a random puzzle only)
 
     Returns:
         - a sudoku puzzle in the form `list[list[int]]`
@@ -400,7 +656,27 @@ def generate_puzzle(percentage: int | float = 50, n: int = 9) -> list[list[int]]
         - n > 0
         - percentage >= 0 and percentage <= 1
     """
-    board = generate_sudoku(n)
+    if max_solutions is not None:
+        return dig_puzzle(n, max_solutions, percentage)
+
+    board = blank_cells(generate_sudoku(n), percentage)
+
+    if verbose:
+        # Print the puzzle to view
+        num_size = len(str(n))
+        for row in board:
+            print(*(f"{n or '.':{num_size}} " for n in row))
+
+    return board
+
+
+def blank_cells(board: list[list[int]], percentage: int | float = 50) -> list[list[int]]:
+    """Empty a random `percentage` of the cells of board in place and return it.
+
+    Preconditions:
+        - percentage >= 0 and percentage <= 100
+    """
+    n = len(board)
     total_cells = n * n
     # percentage = ...  # percentage of empty cells
 
@@ -411,13 +687,64 @@ def generate_puzzle(percentage: int | float = 50, n: int = 9) -> list[list[int]]
     for empty_position in random.sample(range(total_cells), empties):
         board[empty_position // n][empty_position % n] = 0  # 商是行数，余数是列数
 
-    # Print the puzzle to view
-    num_size = len(str(n))
-    for row in board:
-        print(*(f"{n or '.':{num_size}} " for n in row))
-
     return board
 
 
+def dig_puzzle(n: int = 9, max_solutions: int = 1, percentage: int | float | tuple[float, float] = 100,
+               attempts: int = 20) -> list[list[int]]:
+    """Generate a sudoku puzzle with at most `max_solutions` solutions by emptying the cells of a random full board
+    one at a time, keeping each removal only if the solution count stays within the cap.
+
+    Nothing is printed.
+
+    Variables:
+        - n: the initiated number
+        - max_solutions: the most solutions the puzzle may have; 1 gives a puzzle with a unique solution
+        - percentage: the percentage of **empty cells** to aim for, or a (low, high) difficulty band.
+          A single percentage is a ceiling: digging stops early once no further cell can be emptied.
+          For a band, a target is drawn in the band and boards that cannot reach the low end are retried.
+        - attempts: the number of full boards tried before giving up on a band
+
+    Returns:
+        - a sudoku puzzle in the form `list[list[int]]`
+
+    Raises:
+        - ValueError: if no puzzle in the band was found within `attempts` boards
+
+    Preconditions:
+        - n > 0
+        - max_solutions >= 1
+    """
+    total_cells = n * n
+    if isinstance(percentage, tuple):
+        low, high = percentage
+    else:
+        low, high = None, percentage
+    least = 0 if low is None else math.ceil(total_cells * low * 0.01)
+
+    for _ in range(attempts):
+        board = generate_sudoku(n)
+        target = round(total_cells * (high if low is None else random.uniform(low, high)) * 0.01)
+        empties = 0
+        for position in random.sample(range(total_cells), total_cells):
+            if empties >= target:
+                break
+            r, c = divmod(position, n)
+            d = board[r][c]
+            board[r][c] = 0
+            if max_solutions == 1:
+                accepted = not has_other_solution(board, (r, c), d, n)
+            else:
+                accepted = count_solutions(board, n, max_solutions + 1) <= max_solutions
+            if accepted:
+                empties += 1
+            else:
+                board[r][c] = d
+        if empties >= least:
+            return board
+
+    raise ValueError("No puzzle with the given number of solutions was found in the difficulty band.")
+
+
 if __name__ == "__main__":
     pass
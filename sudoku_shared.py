@@ -0,0 +1,85 @@
+"""Solution tables shared with worker processes through shared memory.
+
+A solution table (see `sudoku_solution_pool`) sent to a worker pool as an argument is pickled for every task, which for
+a table of thousands of solutions costs more than the work done with it. A SharedTable copies the table once into a
+`multiprocessing.shared_memory` block; tasks carry only its handle, a (name, shape) pair, and workers attach to the
+block and read the table in place, sending back only indices and scores.
+
+The process that creates a SharedTable owns the block and must close it once every task using it has finished,
+typically with a `with` statement. Workers keep the blocks they attached to open for later tasks, up to MAX_ATTACHED.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MAX_ATTACHED = 8  # the most blocks a worker keeps attached
+
+TableHandle = tuple[str, tuple[int, int]]
+
+
+class SharedTable:
+    """
+    A 2-D uint8 table copied into a shared memory block.
+
+    Instance Attributes:
+    - handle: what a worker needs to attach to the table with `attach`
+    - table: the table in the shared block, as a read-only array
+    """
+    handle: TableHandle
+    table: np.ndarray
+    _memory: shared_memory.SharedMemory
+
+    def __init__(self, table: np.ndarray) -> None:
+        """Copy table into a new shared memory block."""
+        table = np.ascontiguousarray(table, dtype=np.uint8)
+        self._memory = shared_memory.SharedMemory(create=True, size=max(1, table.nbytes))
+        self.table = np.ndarray(table.shape, dtype=np.uint8, buffer=self._memory.buf)
+        self.table[...] = table
+        self.table.flags.writeable = False
+        self.handle = (self._memory.name, table.shape)
+
+    def __enter__(self) -> SharedTable:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Free the shared block. Workers still attached keep their mapping until they detach."""
+        del self.table
+        self._memory.close()
+        self._memory.unlink()
+
+
+_attached: OrderedDict[str, tuple[shared_memory.SharedMemory, np.ndarray]] = OrderedDict()
+
+
+def attach(handle: TableHandle) -> np.ndarray:
+    """Return the table of handle as a read-only array over the shared block, without copying it."""
+    name, shape = handle
+    entry = _attached.get(name)
+    if entry is None:
+        # worker processes share the resource tracker of the process that created them, where the block is
+        # already registered by its owner
+        memory = shared_memory.SharedMemory(name)
+        table = np.ndarray(shape, dtype=np.uint8, buffer=memory.buf)
+        table.flags.writeable = False
+        entry = _attached[name] = (memory, table)
+        if len(_attached) > MAX_ATTACHED:
+            _detach(next(iter(_attached)))
+    else:
+        _attached.move_to_end(name)
+    return entry[1]
+
+
+def _detach(name: str) -> None:
+    """Close this process's mapping of the named block."""
+    memory, table = _attached.pop(name)
+    del table
+    try:
+        memory.close()
+    except BufferError:
+        pass  # an array over the block is still in use; the mapping is closed when it is collected
@@ -70,21 +70,33 @@ class BacktrackingSolution:
 
         def dfs(pos: int):
             """...
+            用显式栈代替递归：placed[k] 是 spaces[k] 当前填入的数字，tried[k] 是下一个要尝试的数字
             """
             nonlocal valid
-            if pos == len(spaces):
-                valid = True
-                return
+            start = pos
+            placed = [-1] * len(spaces)
+            tried = [0] * len(spaces)
+            while pos >= start:
+                if pos == len(spaces):
+                    valid = True
+                    return
 
-            i, j = spaces[pos]
-            for digit in range(su.INITIATED_NUMBER):
-                if row[i][digit] == column[j][digit] == block[i // su.BASE][j // su.BASE][digit] is False:
-                    row[i][digit] = column[j][digit] = block[i // su.BASE][j // su.BASE][digit] = True
-                    board[i][j] = str(digit + 1)
-                    dfs(pos + 1)
+                i, j = spaces[pos]
+                if placed[pos] >= 0:
+                    digit = placed[pos]
                     row[i][digit] = column[j][digit] = block[i // su.BASE][j // su.BASE][digit] = False
-                if valid:
-                    return
+                    placed[pos] = -1
+                for digit in range(tried[pos], su.INITIATED_NUMBER):
+                    if row[i][digit] == column[j][digit] == block[i // su.BASE][j // su.BASE][digit] is False:
+                        row[i][digit] = column[j][digit] = block[i // su.BASE][j // su.BASE][digit] = True
+                        board[i][j] = str(digit + 1)
+                        placed[pos] = digit
+                        tried[pos] = digit + 1
+                        pos += 1
+                        break
+                else:
+                    tried[pos] = 0
+                    pos -= 1
 
         row = [[False] * su.INITIATED_NUMBER for _ in range(su.INITIATED_NUMBER)]
         column = [[False] * su.INITIATED_NUMBER for _ in range(su.INITIATED_NUMBER)]
@@ -122,24 +134,35 @@ class BitwiseSolution:
 
         def dfs(pos: int):
             """...
+            用显式栈代替递归：placed[k] 是 spaces[k] 当前填入的数字，masks[k] 是还没尝试的数字
             """
             nonlocal valid
-            if pos == len(spaces):
-                valid = True
-                return
+            start = pos
+            placed = [-1] * len(spaces)
+            masks = [None] * len(spaces)
+            while pos >= start:
+                if pos == len(spaces):
+                    valid = True
+                    return
 
-            i, j = spaces[pos]
-            mask = ~(row[i] | column[j] | block[i // su.BASE][j // su.BASE]) & 0x1ff
-            while mask:
+                i, j = spaces[pos]
+                if placed[pos] >= 0:
+                    flip(i, j, placed[pos])
+                    placed[pos] = -1
+                elif masks[pos] is None:
+                    masks[pos] = ~(row[i] | column[j] | block[i // su.BASE][j // su.BASE]) & 0x1ff
+                mask = masks[pos]
+                if not mask:
+                    masks[pos] = None
+                    pos -= 1
+                    continue
                 digit_mask = mask & (-mask)
                 digit = bin(digit_mask).count("0") - 1
                 flip(i, j, digit)
                 board[i][j] = str(digit + 1)
-                dfs(pos + 1)
-                flip(i, j, digit)
-                mask &= (mask - 1)
-                if valid:
-                    return
+                placed[pos] = digit
+                masks[pos] = mask & (mask - 1)
+                pos += 1
 
         row = [0] * su.INITIATED_NUMBER
         column = [0] * su.INITIATED_NUMBER
@@ -177,24 +200,35 @@ class EnumerationSolution:
 
         def dfs(pos: int):
             """...
+            用显式栈代替递归：placed[k] 是 spaces[k] 当前填入的数字，masks[k] 是还没尝试的数字
             """
             nonlocal valid
-            if pos == len(spaces):
-                valid = True
-                return
+            start = pos
+            placed = [-1] * len(spaces)
+            masks = [None] * len(spaces)
+            while pos >= start:
+                if pos == len(spaces):
+                    valid = True
+                    return
 
-            i, j = spaces[pos]
-            mask = ~(row[i] | column[j] | block[i // su.BASE][j // su.BASE]) & 0x1ff
-            while mask:
+                i, j = spaces[pos]
+                if placed[pos] >= 0:
+                    flip(i, j, placed[pos])
+                    placed[pos] = -1
+                elif masks[pos] is None:
+                    masks[pos] = ~(row[i] | column[j] | block[i // su.BASE][j // su.BASE]) & 0x1ff
+                mask = masks[pos]
+                if not mask:
+                    masks[pos] = None
+                    pos -= 1
+                    continue
                 digit_mask = mask & (-mask)
                 digit = bin(digit_mask).count("0") - 1
                 flip(i, j, digit)
                 board[i][j] = str(digit + 1)
-                dfs(pos + 1)
-                flip(i, j, digit)
-                mask &= (mask - 1)
-                if valid:
-                    return
+                placed[pos] = digit
+                masks[pos] = mask & (mask - 1)
+                pos += 1
 
         row = [0] * su.INITIATED_NUMBER
         column = [0] * su.INITIATED_NUMBER
@@ -314,43 +348,53 @@ class DLX:
 
     def dance(self, step):
         """
-        :param step: 递归深度
+        :param step: 起始的搜索深度
         :return:
+        用显式栈代替递归：frames 的每一项是 [该层删除的列, 该层当前尝试的行节点]
         """
-        if self.r[self.head] == self.head:
-            self.end = step
-            return True
-
-        c = self.r[self.head]
-        j = self.r[self.head]
-        # 选择节点数最少的列
-        while j != self.head:
-            if self.s[j] < self.s[c]:
-                c = j
-            j = self.r[j]
-        self.remove(c)
-
-        i = self.d[c]
-        while i != c:
-            # 删除节点i所在的行，并将其保存到结果集中
-            self.ans[step] = self.row[i]
-            j = self.r[i]
-            while j != i:
-                self.remove(self.col[j])
-                j = self.r[j]
-            if self.dance(step + 1):  # 搜索成功则返回
+        frames = []
+        while True:
+            if self.r[self.head] == self.head:
+                self.end = step
                 return True
 
-            # 搜索失败，要恢复，回溯
-            self.ans[step] = 0
-            j = self.l[i]
-            while j != i:
-                self.restore(self.col[j])
-                j = self.l[j]
-
-            i = self.d[i]
-        self.restore(c)
-        return False
+            c = self.r[self.head]
+            j = self.r[self.head]
+            # 选择节点数最少的列
+            while j != self.head:
+                if self.s[j] < self.s[c]:
+                    c = j
+                j = self.r[j]
+            self.remove(c)
+            frames.append([c, self.d[c]])
+
+            while True:
+                c, i = frames[-1]
+                if i != c:
+                    # 删除节点i所在的行，并将其保存到结果集中，然后进入下一层
+                    self.ans[step] = self.row[i]
+                    j = self.r[i]
+                    while j != i:
+                        self.remove(self.col[j])
+                        j = self.r[j]
+                    step += 1
+                    break
+
+                # 该层的行都失败了，恢复该列，回到上一层
+                self.restore(c)
+                frames.pop()
+                if not frames:
+                    return False
+                step -= 1
+
+                # 搜索失败，要恢复，回溯
+                i = frames[-1][1]
+                self.ans[step] = 0
+                j = self.l[i]
+                while j != i:
+                    self.restore(self.col[j])
+                    j = self.l[j]
+                frames[-1][1] = self.d[i]
 
     def transform_input(self, i, j, num):
         """...
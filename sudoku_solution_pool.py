@@ -0,0 +1,219 @@
+"""The pool of solutions consistent with an Adversarial Sudoku game so far.
+
+The set of completions consistent with a game only ever shrinks: every accepted guess and revealed cell fixes a digit,
+and every rejected guess rules one out. A SolutionPool is filled from the solver once and then filtered as the game
+moves on, so an adversary turn costs a pass over the pool instead of a full re-solve.
+
+The pool is a 2-D uint8 table with one flattened solution per row, alongside a histogram counting, for every cell and
+digit, how many solutions in the pool put that digit in that cell. Both are updated together whenever the pool is
+filtered, so the support of any move is a single lookup.
+"""
+from __future__ import annotations
+
+import random
+from itertools import islice
+from typing import Optional
+
+import numpy as np
+
+import sudoku_setup as setup
+
+
+class SolutionPool:
+    """
+    A bounded pool of solutions consistent with a board and a set of rejected guesses.
+
+    When the board has more than capacity consistent solutions, the pool holds a uniform reservoir sample of the
+    first scan_limit solutions found by the solver, which is not a uniform sample of every consistent solution. It
+    is refilled from the solver whenever filtering leaves fewer than low_water solutions, unless it already holds
+    every consistent solution.
+
+    Instance Attributes:
+    - capacity: the most solutions kept
+    - low_water: the pool is refilled when it holds fewer solutions than this
+    - scan_limit: the most solutions read from the solver in one refill
+    - exhaustive: whether the pool holds every solution consistent with the game so far
+    - table: one flattened solution per row
+    - histogram: histogram[r, c, d - 1] is the number of solutions in the pool with digit d at (r, c)
+
+    Representation Invariants:
+    - 1 <= self.low_water <= self.capacity <= self.scan_limit
+    - len(self) <= self.capacity
+    - self.histogram.sum(axis=2) == len(self) everywhere
+    """
+    capacity: int
+    low_water: int
+    scan_limit: int
+    exhaustive: bool
+    table: np.ndarray
+    histogram: np.ndarray
+    _n: int
+    _board: Optional[list[list[int]]]
+    _excluded: set[tuple[int, int, int]]
+    _solutions: Optional[list[list[list[int]]]]
+
+    def __init__(self, capacity: int = 512, low_water: Optional[int] = None, scan_limit: Optional[int] = None) -> None:
+        """Initialize an empty pool."""
+        self.capacity = capacity
+        self.low_water = max(1, capacity // 8) if low_water is None else low_water
+        self.scan_limit = 16 * capacity if scan_limit is None else scan_limit
+        self.exhaustive = False
+        self._n = 0
+        self._set_table(np.zeros((0, 0), dtype=np.uint8))
+        self._board = None
+        self._excluded = set()
+
+    def __len__(self) -> int:
+        """Return the number of solutions in the pool."""
+        return self.table.shape[0]
+
+    @property
+    def solutions(self) -> list[list[list[int]]]:
+        """The solutions in the pool as nested lists. The returned list must not be mutated."""
+        if self._solutions is None:
+            n = self._n
+            self._solutions = [row.reshape(n, n).tolist() for row in self.table]
+        return self._solutions
+
+    def copy(self) -> SolutionPool:
+        """Return a copy of this pool that can be filtered independently."""
+        pool = SolutionPool(self.capacity, self.low_water, self.scan_limit)
+        pool.exhaustive = self.exhaustive
+        pool._n = self._n
+        pool.table = self.table.copy()
+        pool.histogram = self.histogram.copy()
+        pool._board = None if self._board is None else [row[:] for row in self._board]
+        pool._excluded = set(self._excluded)
+        return pool
+
+    def get(self, board: list[list[int]]) -> list[list[list[int]]]:
+        """Return the solutions in the pool after bringing it up to date with board, refilling it if it runs low."""
+        self.sync(board)
+        if len(self) < self.low_water and not self.exhaustive:
+            self.refill()
+        return self.solutions
+
+    def sync(self, board: list[list[int]]) -> None:
+        """Keep only the solutions agreeing with the cells filled in board since the last sync.
+
+        If board is not an extension of the previous board, the pool is emptied and will be refilled for board.
+        """
+        old = self._board
+        self._board = [row[:] for row in board]
+        if old is None:
+            self._n = len(board)
+            return
+        filled_cells, filled_values = [], []
+        for r, row in enumerate(board):
+            for c, value in enumerate(row):
+                if value != old[r][c]:
+                    if old[r][c] != 0:
+                        self._reset()
+                        return
+                    filled_cells.append(r * self._n + c)
+                    filled_values.append(value)
+        if filled_cells and len(self):
+            self._keep(np.all(self.table[:, filled_cells] == np.array(filled_values, dtype=np.uint8), axis=1))
+
+    def exclude(self, cell: tuple[int, int], value: int) -> None:
+        """Drop the solutions with value at cell, after the adversary rejected that guess."""
+        r, c = cell
+        self._excluded.add((r, c, value))
+        if len(self):
+            self._keep(self.table[:, r * self._n + c] != value)
+
+    def refill(self) -> None:
+        """Fill the pool from the solver with solutions consistent with the current board and rejected guesses.
+
+        Preconditions:
+        - self.get or self.sync has been called at least once
+        """
+        excluded = self._excluded
+        stream = (s for s in setup.iter_solutions(self._board, self._n)
+                  if not any(s[r][c] == v for r, c, v in excluded))
+        reservoir = []
+        seen = 0
+        for solution in islice(stream, self.scan_limit):
+            seen += 1
+            if len(reservoir) < self.capacity:
+                reservoir.append(solution)
+            else:
+                k = random.randrange(seen)
+                if k < self.capacity:
+                    reservoir[k] = solution
+        # the pool is complete if the solver ran dry before filling it past capacity
+        self.exhaustive = seen <= self.capacity and (seen < self.scan_limit or next(stream, None) is None)
+        table = solution_table(reservoir, self._n)
+        if self.exhaustive:
+            # a complete pool is kept in the row-major order of find_multiple_solutions
+            table = table[np.lexsort(table.T[::-1])]
+        self._set_table(table)
+
+    def support(self, cell: tuple[int, int], value: int) -> int:
+        """Return the number of solutions in the pool with value at cell."""
+        return int(self.histogram[cell[0], cell[1], value - 1])
+
+    def probability(self, cell: tuple[int, int], value: int) -> float:
+        """Return the fraction of the solutions in the pool with value at cell, or 0.0 for an empty pool."""
+        return self.support(cell, value) / len(self) if len(self) else 0.0
+
+    def ranked_moves(self) -> list[tuple[tuple[int, int], int, int]]:
+        """Return every (cell, value, support) with a cell empty on the current board and support > 0, ordered by
+        decreasing support (ties in row-major order of cell, then value).
+        """
+        n = self._n
+        empty = np.array([[value == 0 for value in row] for row in self._board], dtype=bool)
+        counts = np.where(empty[:, :, None], self.histogram, 0).ravel()
+        order = np.argsort(-counts, kind='stable')
+        order = order[counts[order] > 0]
+        return [((int(k) // (n * n), int(k) // n % n), int(k) % n + 1, int(counts[k])) for k in order]
+
+    def joint_histogram(self, cell: tuple[int, int]) -> np.ndarray:
+        """Return the (n, n, n, n) counts whose [r, c, d - 1, e - 1] entry is the number of solutions in the pool with
+        digit d at (r, c) and digit e at cell.
+        """
+        n = self._n
+        digits = np.arange(1, n + 1, dtype=np.uint8)
+        at_cell = (self.table[:, cell[0] * n + cell[1], None] == digits).astype(np.float32)
+        one_hot = (self.table[:, :, None] == digits).reshape(len(self), n * n * n).astype(np.float32)
+        return (one_hot.T @ at_cell).round().astype(np.int64).reshape(n, n, n, n)
+
+    def _keep(self, mask: np.ndarray) -> None:
+        """Keep the solutions selected by the boolean mask, updating the histogram by whichever side is smaller."""
+        removed = self.table[~mask]
+        if len(removed) == 0:
+            return
+        kept = self.table[mask]
+        if len(removed) < len(kept):
+            self.histogram -= solution_histogram(removed, self._n)
+            self.table = kept
+            self._solutions = None
+        else:
+            self._set_table(kept)
+
+    def _set_table(self, table: np.ndarray) -> None:
+        """Replace the table and rebuild the histogram."""
+        self.table = table
+        self.histogram = solution_histogram(table, self._n)
+        self._solutions = None
+
+    def _reset(self) -> None:
+        """Forget every solution and rejected guess."""
+        self.exhaustive = False
+        self._n = len(self._board)
+        self._set_table(np.zeros((0, self._n * self._n), dtype=np.uint8))
+        self._excluded = set()
+
+
+def solution_table(solutions: list[list[list[int]]], n: int) -> np.ndarray:
+    """Return the solutions as a table with one flattened solution per row."""
+    return np.array(solutions, dtype=np.uint8).reshape(len(solutions), n * n)
+
+
+def solution_histogram(table: np.ndarray, n: int) -> np.ndarray:
+    """Return the (n, n, n) cell-digit counts of the solutions in table."""
+    if n == 0:
+        return np.zeros((0, 0, 0), dtype=np.int64)
+    offsets = np.arange(n * n, dtype=np.int64) * n - 1
+    counts = np.bincount((table.astype(np.int64) + offsets).ravel(), minlength=n * n * n)
+    return counts.reshape(n, n, n)
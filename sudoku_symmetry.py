@@ -0,0 +1,330 @@
+"""Canonical forms of sudoku boards under the symmetries of the game.
+
+Two boards are equivalent when one can be turned into the other by
+    - relabeling the digits,
+    - permuting the bands, or the rows inside a band,
+    - permuting the stacks, or the columns inside a stack,
+    - transposing the board.
+Every board produced by `sudoku_setup.generate_sudoku` is such an image of the `_pattern` baseline, so positions of
+different games are often equivalent. `canonical_form` maps a board to the representative of its class together with
+the BoardTransform that produced it, so results computed on the representative can be mapped back.
+
+The representative is the lexicographically smallest relabeled board over every arrangement consistent with a sort of
+the rows, columns, bands and stacks by symmetry-invariant keys. When the ties between those keys leave more than
+MAX_CANDIDATES arrangements, ties are broken by the original order instead; the result is then still an equivalent
+board, but two equivalent boards may get different representatives (a missed cache hit, never a wrong one).
+"""
+from __future__ import annotations
+
+from collections import Counter, OrderedDict
+from itertools import permutations, product
+from math import factorial
+
+import sudoku_setup as setup
+
+MAX_CANDIDATES = 128  # the most arrangements compared by canonical_form
+
+# the bounds of the process-wide `solution_cache`, which can be changed through its maxsize and max_solutions
+# attributes, taking effect at its next miss; max_solutions is what bounds its memory, about n * n + 40 bytes a solution
+CACHE_MAX_BOARDS = 4096
+CACHE_MAX_SOLUTIONS = 100_000
+
+
+class BoardTransform:
+    """
+    A symmetry of the sudoku board, mapping an original board to a transformed board:
+
+        transformed[i][j] == digits[source[rows[i]][cols[j]]]
+
+    where source is the original board, transposed first if transpose is True.
+
+    Representation Invariants:
+    - sorted(self.rows) == sorted(self.cols) == list(range(self.n))
+    - self.digits[0] == 0 and sorted(self.digits) == list(range(self.n + 1))
+    """
+    __slots__ = ('n', 'transpose', 'rows', 'cols', 'digits', '_row_pos', '_col_pos', '_digit_inv')
+    n: int
+    transpose: bool
+    rows: tuple[int, ...]
+    cols: tuple[int, ...]
+    digits: tuple[int, ...]
+
+    def __init__(self, transpose: bool, rows: tuple[int, ...], cols: tuple[int, ...], digits: tuple[int, ...]) -> None:
+        """Initialize a new transform."""
+        self.n = len(rows)
+        self.transpose = transpose
+        self.rows = rows
+        self.cols = cols
+        self.digits = digits
+        self._row_pos = _inverse(rows)
+        self._col_pos = _inverse(cols)
+        self._digit_inv = _inverse(digits)
+
+    def apply(self, board: list[list[int]]) -> list[list[int]]:
+        """Return the image of the original board under this transform."""
+        source = _transposed(board) if self.transpose else board
+        digits = self.digits
+        return [[digits[source[r][c]] for c in self.cols] for r in self.rows]
+
+    def invert(self, board: list[list[int]]) -> list[list[int]]:
+        """Return the original board whose image under this transform is the given board."""
+        inv = self._digit_inv
+        source = [[inv[board[self._row_pos[r]][self._col_pos[c]]] for c in range(self.n)] for r in range(self.n)]
+        return _transposed(source) if self.transpose else source
+
+    def map_cell(self, cell: tuple[int, int]) -> tuple[int, int]:
+        """Return the position of the original cell in the transformed board."""
+        r, c = (cell[1], cell[0]) if self.transpose else cell
+        return (self._row_pos[r], self._col_pos[c])
+
+    def unmap_cell(self, cell: tuple[int, int]) -> tuple[int, int]:
+        """Return the position in the original board of the transformed cell."""
+        r, c = self.rows[cell[0]], self.cols[cell[1]]
+        return (c, r) if self.transpose else (r, c)
+
+    def map_move(self, move: tuple[tuple[int, int], int]) -> tuple[tuple[int, int], int]:
+        """Return the guess move on the original board as a move on the transformed board."""
+        return (self.map_cell(move[0]), self.digits[move[1]])
+
+    def unmap_move(self, move: tuple[tuple[int, int], int]) -> tuple[tuple[int, int], int]:
+        """Return the guess move on the transformed board as a move on the original board."""
+        return (self.unmap_cell(move[0]), self._digit_inv[move[1]])
+
+
+def canonical_form(board: list[list[int]]) -> tuple[list[list[int]], BoardTransform]:
+    """Return the representative of the symmetry class of board and the transform mapping board onto it.
+
+    >>> board = [[1, 0, 0, 0], [0, 0, 1, 0], [0, 1, 0, 0], [0, 0, 0, 2]]
+    >>> relabeled = [[3, 0, 0, 0], [0, 0, 3, 0], [0, 3, 0, 0], [0, 0, 0, 4]]
+    >>> canonical_form(board)[0] == canonical_form(relabeled)[0]
+    True
+    >>> canonical, transform = canonical_form(board)
+    >>> transform.invert(canonical) == board
+    True
+    """
+    n = len(board)
+    b = setup.get_base_number(n)
+    transposed = _transposed(board)
+    orientations = []
+    for transpose, source in ((False, board), (True, transposed)):
+        row_keys, col_keys = _unit_keys(source)
+        orientations.append((transpose, source, _arrangements(row_keys, b), _arrangements(col_keys, b)))
+
+    total = sum(_count(rows) * _count(cols) for _, _, rows, cols in orientations)
+    best_flat, best = None, None
+    for transpose, source, row_groups, col_groups in orientations:
+        if total <= MAX_CANDIDATES:
+            row_orders, col_orders = _expand(row_groups), _expand(col_groups)
+        else:
+            row_orders, col_orders = [_first(row_groups)], [_first(col_groups)]
+        for rows, cols in product(row_orders, col_orders):
+            flat, digits = _relabeled(source, rows, cols, n)
+            if best_flat is None or flat < best_flat:
+                best_flat, best = flat, (transpose, rows, cols, digits)
+
+    transform = BoardTransform(*best)
+    return [list(best_flat[r * n:(r + 1) * n]) for r in range(n)], transform
+
+
+def canonical_key(board: list[list[int]]) -> bytes:
+    """Return a hashable key that is equal for boards with the same canonical form."""
+    canonical, _ = canonical_form(board)
+    return bytes(value for row in canonical for value in row)
+
+
+class SolutionCache:
+    """
+    A bounded cache of `find_multiple_solutions` results keyed by canonical form, so that a board hits the cache
+    when any board of its symmetry class has been solved before.
+
+    The least recently used boards are dropped first whenever the cache holds more than maxsize boards or more than
+    max_solutions solutions in total. The solutions of a board that has more than max_solutions alone are not kept.
+
+    Instance Attributes:
+    - maxsize: the most canonical boards kept
+    - max_solutions: the most solutions kept, over every board
+    - hits: the number of lookups answered from the cache
+    - misses: the number of lookups that ran the solver
+
+    >>> cache = SolutionCache(max_solutions=3)
+    >>> board = setup.generate_sudoku(4)
+    >>> board[0][0] = board[0][1] = board[1][0] = board[1][1] = 0
+    >>> len(cache.find_multiple_solutions(board)), len(cache), cache.solutions
+    (1, 1, 1)
+    >>> len(cache.find_multiple_solutions([[0] * 4 for _ in range(4)])), len(cache), cache.solutions
+    (288, 1, 1)
+    """
+    maxsize: int
+    max_solutions: int
+    hits: int
+    misses: int
+    _entries: OrderedDict[bytes, list[bytes]]
+    _solutions: int
+
+    def __init__(self, maxsize: int = CACHE_MAX_BOARDS, max_solutions: int = CACHE_MAX_SOLUTIONS) -> None:
+        """Initialize an empty cache."""
+        self.maxsize = maxsize
+        self.max_solutions = max_solutions
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._solutions = 0
+
+    def __len__(self) -> int:
+        """Return the number of canonical boards in the cache."""
+        return len(self._entries)
+
+    @property
+    def solutions(self) -> int:
+        """Return the number of solutions in the cache, over every board."""
+        return self._solutions
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters."""
+        self._entries.clear()
+        self._solutions = 0
+        self.hits = 0
+        self.misses = 0
+
+    def find_multiple_solutions(self, puzzle: list[list[int]]) -> list[list[list[int]]]:
+        """Return every solution of puzzle, in the same order as `sudoku_setup.find_multiple_solutions`."""
+        n = len(puzzle)
+        canonical, transform = canonical_form(puzzle)
+        key = bytes(value for row in canonical for value in row)
+        solutions = self._entries.get(key)
+        if solutions is None:
+            self.misses += 1
+            solutions = [bytes(value for row in s for value in row)
+                         for s in setup.find_multiple_solutions(canonical, n)]
+            if len(solutions) <= self.max_solutions:
+                self._entries[key] = solutions
+                self._solutions += len(solutions)
+            self._shrink()
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+        # the solver yields solutions in row-major lexicographic order; restore that order after mapping back
+        originals = sorted(transform.invert([list(s[r * n:(r + 1) * n]) for r in range(n)]) for s in solutions)
+        return originals
+
+    def _shrink(self) -> None:
+        """Drop the least recently used boards until the cache is within its bounds."""
+        while self._entries and (len(self._entries) > self.maxsize or self._solutions > self.max_solutions):
+            _, solutions = self._entries.popitem(last=False)
+            self._solutions -= len(solutions)
+
+
+solution_cache = SolutionCache()
+
+
+################################################################################
+# Helpers
+################################################################################
+def _inverse(order: tuple[int, ...]) -> tuple[int, ...]:
+    """Return the inverse of the permutation order."""
+    inverse = [0] * len(order)
+    for position, value in enumerate(order):
+        inverse[value] = position
+    return tuple(inverse)
+
+
+def _transposed(board: list[list[int]]) -> list[list[int]]:
+    """Return the transpose of board."""
+    return [list(column) for column in zip(*board)]
+
+
+def _unit_keys(board: list[list[int]]) -> tuple[list[tuple], list[tuple]]:
+    """Return keys for the rows and the columns of board that are invariant under every symmetry keeping the
+    rows as rows.
+    """
+    n = len(board)
+    frequency = Counter(value for row in board for value in row if value != 0)
+    row_count = [sum(1 for value in row if value != 0) for row in board]
+    col_count = [sum(1 for r in range(n) if board[r][c] != 0) for c in range(n)]
+    row_keys = [(row_count[r],
+                 tuple(sorted(col_count[c] for c in range(n) if board[r][c] != 0)),
+                 tuple(sorted(frequency[value] for value in board[r] if value != 0))) for r in range(n)]
+    col_keys = [(col_count[c],
+                 tuple(sorted(row_count[r] for r in range(n) if board[r][c] != 0)),
+                 tuple(sorted(frequency[board[r][c]] for r in range(n) if board[r][c] != 0))) for c in range(n)]
+    return row_keys, col_keys
+
+
+def _tie_groups(items: list[int], key: dict[int, tuple] | list[tuple]) -> list[list[int]]:
+    """Return items sorted by key, split into runs of equal keys."""
+    groups = []
+    for item in sorted(items, key=lambda i: key[i]):
+        if groups and key[groups[-1][0]] == key[item]:
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+    return groups
+
+
+def _arrangements(keys: list[tuple], b: int) -> tuple[list[list[int]], dict[int, list[list[int]]]]:
+    """Return the tie groups of the bands (or stacks) and, for each band, the tie groups of its rows (or columns)."""
+    band_keys = {g: tuple(sorted(keys[g * b:(g + 1) * b])) for g in range(b)}
+    band_groups = _tie_groups(list(range(b)), band_keys)
+    unit_groups = {g: _tie_groups(list(range(g * b, (g + 1) * b)), keys) for g in range(b)}
+    return band_groups, unit_groups
+
+
+def _count(arrangement: tuple[list[list[int]], dict[int, list[list[int]]]]) -> int:
+    """Return the number of orders described by arrangement."""
+    band_groups, unit_groups = arrangement
+    total = 1
+    for group in band_groups:
+        total *= factorial(len(group))
+    for groups in unit_groups.values():
+        for group in groups:
+            total *= factorial(len(group))
+    return total
+
+
+def _expand(arrangement: tuple[list[list[int]], dict[int, list[list[int]]]]) -> list[tuple[int, ...]]:
+    """Return every order described by arrangement."""
+    band_groups, unit_groups = arrangement
+    inside = {g: [sum(choice, ()) for choice in product(*(list(permutations(group)) for group in groups))]
+              for g, groups in unit_groups.items()}
+    orders = []
+    for band_choice in product(*(list(permutations(group)) for group in band_groups)):
+        bands = sum(band_choice, ())
+        for units in product(*(inside[g] for g in bands)):
+            orders.append(sum(units, ()))
+    return orders
+
+
+def _first(arrangement: tuple[list[list[int]], dict[int, list[list[int]]]]) -> tuple[int, ...]:
+    """Return the order described by arrangement that keeps ties in their original order."""
+    band_groups, unit_groups = arrangement
+    return tuple(unit for group in band_groups for g in group for units in unit_groups[g] for unit in units)
+
+
+def _relabeled(source: list[list[int]], rows: tuple[int, ...], cols: tuple[int, ...],
+               n: int) -> tuple[tuple[int, ...], tuple[int, ...]]:
+    """Return the board arranged by rows and cols with digits renumbered in order of first appearance, and the
+    digit map used.
+    """
+    digits = [0] * (n + 1)
+    next_digit = 1
+    flat = []
+    for r in rows:
+        row = source[r]
+        for c in cols:
+            value = row[c]
+            if value != 0 and digits[value] == 0:
+                digits[value] = next_digit
+                next_digit += 1
+            flat.append(digits[value])
+    for value in range(1, n + 1):
+        if digits[value] == 0:
+            digits[value] = next_digit
+            next_digit += 1
+    return tuple(flat), tuple(digits)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod(verbose=True)
@@ -0,0 +1,86 @@
+"""Vectorized legality checks for sudoku boards.
+
+Boards are checked as NumPy arrays, whole batches at a time. Every row, column and block of a board is one "unit",
+and a board of length n has 3n of them. Reshaping a (k, n, n) batch into its (k, 3n, n) units lets one bincount
+tally the digits of every unit of every board at once, so checking thousands of boards is a few array operations
+instead of a Python loop per cell. A single move is checked by is_move_legal with plain loops instead.
+"""
+from __future__ import annotations
+
+from math import isqrt
+from typing import Iterable
+
+import numpy as np
+
+
+def as_boards(boards: Iterable[list[list[int]]] | np.ndarray) -> np.ndarray:
+    """Return the boards as a (k, n, n) integer array."""
+    array = np.asarray(boards if isinstance(boards, np.ndarray) else list(boards), dtype=np.int64)
+    if array.ndim == 2:
+        array = array[None]
+    return array
+
+
+def unit_view(boards: np.ndarray) -> np.ndarray:
+    """Return the (k, 3n, n) units of a (k, n, n) batch: its rows, then its columns, then its blocks."""
+    k, n, _ = boards.shape
+    b = isqrt(n)
+    blocks = boards.reshape(k, b, b, b, b).transpose(0, 1, 3, 2, 4).reshape(k, n, n)
+    return np.concatenate((boards, boards.transpose(0, 2, 1), blocks), axis=1)
+
+
+def digit_counts(boards: np.ndarray) -> np.ndarray:
+    """Return the (k, 3n, n + 1) counts of every digit, 0 for empty, in every unit of a (k, n, n) batch.
+
+    Preconditions:
+        - 0 <= boards <= n everywhere
+    """
+    k, n, _ = boards.shape
+    units = unit_view(boards)
+    offsets = np.arange(k * 3 * n, dtype=np.int64).reshape(k, 3 * n, 1) * (n + 1)
+    return np.bincount((units + offsets).ravel(), minlength=k * 3 * n * (n + 1)).reshape(k, 3 * n, n + 1)
+
+
+def valid_solutions(boards: Iterable[list[list[int]]] | np.ndarray) -> np.ndarray:
+    """Return, for every board, whether it is a complete solution: each unit holds every digit exactly once.
+
+    >>> valid_solutions([[[1, 2, 3, 4], [3, 4, 1, 2], [2, 1, 4, 3], [4, 3, 2, 1]],
+    ...                  [[1, 2, 3, 4], [3, 4, 1, 2], [2, 1, 4, 3], [4, 3, 1, 2]]]).tolist()
+    [True, False]
+    """
+    boards = as_boards(boards)
+    n = boards.shape[1]
+    in_range = ((boards >= 1) & (boards <= n)).all(axis=(1, 2))
+    counts = digit_counts(np.where(in_range[:, None, None], boards, 0))
+    return in_range & (counts[:, :, 1:] == 1).all(axis=(1, 2))
+
+
+def is_move_legal(board: list[list[int]], p: tuple[int, int], d: int) -> bool:
+    """Return whether digit d can be placed in the position p of board without repeating a digit of its row,
+    column or block. The digit already in p, if any, is ignored.
+
+    A single cell is checked with plain loops that stop at the first conflict, which is faster than building arrays.
+    """
+    n = len(board)
+    if not 1 <= d <= n:
+        return False
+    r, c = p
+    row = board[r]
+    for i in range(n):
+        if i != c and row[i] == d:
+            return False
+        if i != r and board[i][c] == d:
+            return False
+    b = isqrt(n)
+    br, bc = r - r % b, c - c % b
+    for i in range(br, br + b):
+        for j in range(bc, bc + b):
+            if (i != r or j != c) and board[i][j] == d:
+                return False
+    return True
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod(verbose=True)